@@ -1,654 +1,4066 @@
-#include <stdint.h>
-#include <stdlib.h>
-#include <string.h>
-#include <stdio.h>
+#include "basic_image_lib.h"
 
-#ifdef _WIN32
-#include <malloc.h>
+#if defined(_MSC_VER)
+#include <intrin.h>
+#elif HAS_AVX2
+#include <cpuid.h>
 #endif
 
-#if defined(__x86_64__) || defined(_M_X64)
-#include <immintrin.h>
+#if HAS_NEON && defined(__linux__) && !defined(__aarch64__)
+#include <sys/auxv.h>
+#include <asm/hwcap.h>
 #endif
 
-#define ALIGNMENT 32
-
-#if defined(__AVX2__)
-#define HAS_AVX2 1
+#ifdef _WIN32
+#define WIN32_LEAN_AND_MEAN
+#include <windows.h>
+typedef SRWLOCK lib_mutex;
+#define LIB_MUTEX_INIT SRWLOCK_INIT
+#define lib_mutex_lock(m) AcquireSRWLockExclusive(m)
+#define lib_mutex_unlock(m) ReleaseSRWLockExclusive(m)
+#define lib_mutex_trylock(m) TryAcquireSRWLockExclusive(m)
+typedef CONDITION_VARIABLE lib_cond;
+#define LIB_COND_INIT CONDITION_VARIABLE_INIT
+#define lib_cond_wait(c, m) SleepConditionVariableSRW(c, m, INFINITE, 0)
+#define lib_cond_broadcast(c) WakeAllConditionVariable(c)
 #else
-#define HAS_AVX2 0
+#include <pthread.h>
+#include <unistd.h>
+#include <time.h>
+#include <sys/mman.h>
+typedef pthread_mutex_t lib_mutex;
+#define LIB_MUTEX_INIT PTHREAD_MUTEX_INITIALIZER
+#define lib_mutex_lock(m) pthread_mutex_lock(m)
+#define lib_mutex_unlock(m) pthread_mutex_unlock(m)
+#define lib_mutex_trylock(m) (pthread_mutex_trylock(m) == 0)
+typedef pthread_cond_t lib_cond;
+#define LIB_COND_INIT PTHREAD_COND_INITIALIZER
+#define lib_cond_wait(c, m) pthread_cond_wait(c, m)
+#define lib_cond_broadcast(c) pthread_cond_broadcast(c)
 #endif
 
-#if defined(__ARM_NEON)
-#include <arm_neon.h>
+// Relaxed atomics on 64-bit counters, for values read without holding the
+// lock that guards their writes.
+#if defined(_MSC_VER)
+#define stats_add(counter, value) _InterlockedExchangeAdd64((volatile __int64*)(counter), (__int64)(value))
+#define stats_load(counter) ((uint64_t)_InterlockedCompareExchange64((volatile __int64*)(counter), 0, 0))
+#define stats_store(counter, value) ((void)_InterlockedExchange64((volatile __int64*)(counter), (__int64)(value)))
+#define stats_swap_max(counter, seen, value) \
+    ((uint64_t)_InterlockedCompareExchange64((volatile __int64*)(counter), (__int64)(value), (__int64)(seen)) == (seen))
+#else
+#define stats_add(counter, value) __atomic_fetch_add((counter), (value), __ATOMIC_RELAXED)
+#define stats_load(counter) __atomic_load_n((counter), __ATOMIC_RELAXED)
+#define stats_store(counter, value) __atomic_store_n((counter), (value), __ATOMIC_RELAXED)
+#define stats_swap_max(counter, seen, value) \
+    __atomic_compare_exchange_n((counter), &(seen), (value), 0, __ATOMIC_RELAXED, __ATOMIC_RELAXED)
 #endif
 
-uint8_t* create_image_rgba(uint32_t width, uint32_t height) {
-    size_t size = width * height * 4;
-    uint8_t* image_data;
+// Every image buffer is preceded by a header recording its size class, so
+// free_image_rgba() can hand it back to the pool. The header size keeps the
+// pixel data ALIGNMENT-aligned.
+#define BLOCK_HEADER_SIZE 64
+#define POOL_CLASSES 64
+#define HUGE_PAGE_SIZE (2 * 1024 * 1024)
+
+typedef struct pool_block {
+    size_t size;
+    struct pool_block* class_prev;
+    struct pool_block* class_next;
+    struct pool_block* lru_prev;
+    struct pool_block* lru_next;
+} pool_block;
+
+typedef struct {
+    size_t size;
+    pool_block* head;
+} pool_class;
+
+static struct {
+    lib_mutex lock;
+    // Written under lock, but create/free_image_rgba() check it without the
+    // lock first, so it is always accessed with stats_load/stats_store.
+    uint64_t limit_bytes;
+    uint64_t cached_bytes;
+    uint64_t cached_blocks;
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t evictions;
+    pool_class classes[POOL_CLASSES];
+    pool_block* lru_newest;
+    pool_block* lru_oldest;
+} pool = {LIB_MUTEX_INIT};
+
+// Guards the resample coefficient table cache.
+static lib_mutex resample_lock = LIB_MUTEX_INIT;
+
+// Buffers of at least this many bytes ask the kernel for transparent huge
+// pages, which cuts TLB misses when whole frames are streamed through. 0 = off.
+// Read by allocations on any thread, so accessed with stats_load/stats_store.
+static uint64_t huge_page_threshold = 0;
+
+void set_huge_page_threshold(uint64_t bytes) {
+    stats_store(&huge_page_threshold, bytes);
+}
+
+static size_t pool_size_class(size_t size) {
+    // Small buffers round to the SIMD alignment, larger ones to whole pages.
+    // Empty images still get a real block so every size class is non-zero.
+    if (size == 0) {
+        return ALIGNMENT;
+    }
+    if (size < 4096) {
+        return (size + ALIGNMENT - 1) & ~(size_t)(ALIGNMENT - 1);
+    }
+    return (size + 4095) & ~(size_t)4095;
+}
+
+static pool_block* block_alloc(size_t size) {
+    pool_block* block;
+    size_t total = BLOCK_HEADER_SIZE + size;
+
+    #if defined(MADV_HUGEPAGE)
+    uint64_t threshold = stats_load(&huge_page_threshold);
+    if (threshold > 0 && size >= threshold) {
+        // Huge pages only back 2 MB-aligned ranges, and the advice has to come
+        // before the first write faults the pages in. It is only a hint: the
+        // block is still usable when THP is disabled.
+        if (posix_memalign((void**)&block, HUGE_PAGE_SIZE, total) != 0) {
+            return NULL;
+        }
+        madvise(block, total & ~(size_t)4095, MADV_HUGEPAGE);
+        block->size = size;
+        return block;
+    }
+    #endif
 
     #ifdef _WIN32
-    image_data = (uint8_t*)_aligned_malloc(size, ALIGNMENT);
+    block = (pool_block*)_aligned_malloc(total, ALIGNMENT);
     #else
     #if defined(__STDC_VERSION__) && __STDC_VERSION__ >= 201112L
-    image_data = aligned_alloc(ALIGNMENT, (size + ALIGNMENT - 1) & ~(ALIGNMENT - 1));
+    block = aligned_alloc(ALIGNMENT, total);
+    #else
+    if (posix_memalign((void**)&block, ALIGNMENT, total) != 0) {
+        block = NULL;
+    }
+    #endif
+    #endif
+
+    if (block != NULL) {
+        block->size = size;
+    }
+    return block;
+}
+
+static void block_free(pool_block* block) {
+    #ifdef _WIN32
+    _aligned_free(block);
+    #else
+    free(block);
+    #endif
+}
+
+static pool_class* pool_find_class(size_t size) {
+    for (int i = 0; i < POOL_CLASSES; i++) {
+        if (pool.classes[i].size == size) {
+            return &pool.classes[i];
+        }
+    }
+    return NULL;
+}
+
+static void pool_unlink(pool_class* cls, pool_block* block) {
+    if (block->class_prev) block->class_prev->class_next = block->class_next;
+    else cls->head = block->class_next;
+    if (block->class_next) block->class_next->class_prev = block->class_prev;
+    if (cls->head == NULL) cls->size = 0;
+
+    if (block->lru_prev) block->lru_prev->lru_next = block->lru_next;
+    else pool.lru_newest = block->lru_next;
+    if (block->lru_next) block->lru_next->lru_prev = block->lru_prev;
+    else pool.lru_oldest = block->lru_prev;
+
+    pool.cached_bytes -= block->size;
+    pool.cached_blocks--;
+}
+
+// Detaches least recently freed blocks until at most max_bytes stay cached.
+// The victims are chained through lru_next and freed by the caller outside the lock.
+static pool_block* pool_evict(uint64_t max_bytes) {
+    pool_block* victims = NULL;
+    while (pool.cached_bytes > max_bytes && pool.lru_oldest != NULL) {
+        pool_block* block = pool.lru_oldest;
+        pool_unlink(pool_find_class(block->size), block);
+        block->lru_next = victims;
+        victims = block;
+        pool.evictions++;
+    }
+    return victims;
+}
+
+static uint64_t free_victims(pool_block* victims) {
+    uint64_t released = 0;
+    while (victims != NULL) {
+        pool_block* next = victims->lru_next;
+        released += victims->size;
+        block_free(victims);
+        victims = next;
+    }
+    return released;
+}
+
+uint8_t* create_image_rgba(uint32_t width, uint32_t height) {
+    // Sizes are computed in 64 bits: a 32-bit product wraps above ~1 gigapixel.
+    uint64_t bytes = (uint64_t)width * height * 4;
+    if (bytes > SIZE_MAX - BLOCK_HEADER_SIZE - 4096) {
+        return NULL;
+    }
+    size_t size = pool_size_class((size_t)bytes);
+    pool_block* block = NULL;
+
+    if (stats_load(&pool.limit_bytes) > 0) {
+        lib_mutex_lock(&pool.lock);
+        pool_class* cls = pool_find_class(size);
+        if (cls != NULL) {
+            // Reuse the most recently freed block: it is the most likely to still be cache-warm.
+            block = cls->head;
+            pool_unlink(cls, block);
+            pool.hits++;
+        } else {
+            pool.misses++;
+        }
+        lib_mutex_unlock(&pool.lock);
+    }
+
+    if (block == NULL) {
+        block = block_alloc(size);
+        if (block == NULL) {
+            return NULL;
+        }
+    }
+
+    return (uint8_t*)block + BLOCK_HEADER_SIZE;
+}
+
+void free_image_rgba(uint8_t* image_data) {
+    if (image_data == NULL) {
+        return;
+    }
+
+    pool_block* block = (pool_block*)(image_data - BLOCK_HEADER_SIZE);
+    pool_block* victims = block;
+
+    if (stats_load(&pool.limit_bytes) > 0) {
+        lib_mutex_lock(&pool.lock);
+        pool_class* cls = pool_find_class(block->size);
+        if (cls == NULL) {
+            cls = pool_find_class(0);
+        }
+        if (cls != NULL && block->size <= stats_load(&pool.limit_bytes)) {
+            cls->size = block->size;
+            block->class_prev = NULL;
+            block->class_next = cls->head;
+            if (cls->head) cls->head->class_prev = block;
+            cls->head = block;
+
+            block->lru_prev = NULL;
+            block->lru_next = pool.lru_newest;
+            if (pool.lru_newest) pool.lru_newest->lru_prev = block;
+            else pool.lru_oldest = block;
+            pool.lru_newest = block;
+
+            pool.cached_bytes += block->size;
+            pool.cached_blocks++;
+            victims = pool_evict(stats_load(&pool.limit_bytes));
+        } else {
+            victims->lru_next = NULL;
+        }
+        lib_mutex_unlock(&pool.lock);
+    } else {
+        victims->lru_next = NULL;
+    }
+
+    free_victims(victims);
+}
+
+void pool_set_limit(uint64_t limit_bytes) {
+    lib_mutex_lock(&pool.lock);
+    stats_store(&pool.limit_bytes, limit_bytes);
+    pool_block* victims = pool_evict(limit_bytes);
+    lib_mutex_unlock(&pool.lock);
+    free_victims(victims);
+}
+
+uint64_t pool_trim(uint64_t max_bytes) {
+    lib_mutex_lock(&pool.lock);
+    pool_block* victims = pool_evict(max_bytes);
+    lib_mutex_unlock(&pool.lock);
+    return free_victims(victims);
+}
+
+void pool_get_stats(pool_stats* stats) {
+    lib_mutex_lock(&pool.lock);
+    stats->limit_bytes = stats_load(&pool.limit_bytes);
+    stats->cached_bytes = pool.cached_bytes;
+    stats->cached_blocks = pool.cached_blocks;
+    stats->hits = pool.hits;
+    stats->misses = pool.misses;
+    stats->evictions = pool.evictions;
+    lib_mutex_unlock(&pool.lock);
+}
+
+// Worker pool: the calling thread and up to num_threads - 1 persistent workers
+// split a job into bands of destination rows and claim them one at a time.
+#define MAX_THREADS 64
+#define MIN_BAND_ROWS 8
+#define BANDS_PER_THREAD 4
+#define DEFAULT_PARALLEL_THRESHOLD (256 * 1024)
+
+typedef void (*band_fn)(void* ctx, uint32_t y0, uint32_t y1);
+
+static struct {
+    lib_mutex lock;
+    lib_mutex submit;
+    lib_cond work_ready;
+    lib_cond work_done;
+    // num_threads and parallel_threshold are read by every parallel_rows()
+    // call without the lock, so they are accessed with stats_load/stats_store.
+    uint64_t num_threads;
+    uint32_t started;
+    uint64_t parallel_threshold;
+    uint64_t generation;
+    band_fn fn;
+    void* ctx;
+    uint32_t rows;
+    uint32_t band_rows;
+    uint32_t bands;
+    uint32_t next_band;
+    uint32_t done_bands;
+} workers = {LIB_MUTEX_INIT, LIB_MUTEX_INIT, LIB_COND_INIT, LIB_COND_INIT, 0, 0, DEFAULT_PARALLEL_THRESHOLD};
+
+static uint32_t cpu_count(void) {
+    #ifdef _WIN32
+    SYSTEM_INFO info;
+    GetSystemInfo(&info);
+    long count = (long)info.dwNumberOfProcessors;
+    #else
+    long count = sysconf(_SC_NPROCESSORS_ONLN);
+    #endif
+
+    if (count < 1) return 1;
+    if (count > MAX_THREADS) return MAX_THREADS;
+    return (uint32_t)count;
+}
+
+void set_num_threads(uint32_t num_threads) {
+    if (num_threads == 0) num_threads = cpu_count();
+    if (num_threads > MAX_THREADS) num_threads = MAX_THREADS;
+    lib_mutex_lock(&workers.lock);
+    stats_store(&workers.num_threads, num_threads);
+    lib_mutex_unlock(&workers.lock);
+}
+
+uint32_t get_num_threads(void) {
+    init_dispatch();
+    return (uint32_t)stats_load(&workers.num_threads);
+}
+
+void set_parallel_threshold(uint64_t pixels) {
+    stats_store(&workers.parallel_threshold, pixels);
+}
+
+// Runs the bands of the current job that nobody has claimed yet. Called with workers.lock held.
+static void run_bands_locked(void) {
+    while (workers.next_band < workers.bands) {
+        uint32_t y0 = workers.next_band++ * workers.band_rows;
+        uint32_t y1 = y0 + workers.band_rows;
+        if (y1 > workers.rows) y1 = workers.rows;
+        band_fn fn = workers.fn;
+        void* ctx = workers.ctx;
+
+        lib_mutex_unlock(&workers.lock);
+        fn(ctx, y0, y1);
+        lib_mutex_lock(&workers.lock);
+
+        if (++workers.done_bands == workers.bands) {
+            lib_cond_broadcast(&workers.work_done);
+        }
+    }
+}
+
+static void worker_loop(uint32_t index) {
+    lib_mutex_lock(&workers.lock);
+    uint64_t seen = workers.generation;
+    for (;;) {
+        while (workers.generation == seen) {
+            lib_cond_wait(&workers.work_ready, &workers.lock);
+        }
+        seen = workers.generation;
+        // Workers beyond the current thread count stay parked.
+        if (index + 1 < stats_load(&workers.num_threads)) {
+            run_bands_locked();
+        }
+    }
+}
+
+#ifdef _WIN32
+static DWORD WINAPI worker_main(LPVOID arg) {
+    worker_loop((uint32_t)(uintptr_t)arg);
+    return 0;
+}
+#else
+static void* worker_main(void* arg) {
+    worker_loop((uint32_t)(uintptr_t)arg);
+    return NULL;
+}
+
+// Worker threads do not survive fork(): the child starts with a fresh pool
+// and unlocked mutexes, so multiprocessing workers can keep using the library.
+static void before_fork(void) {
+    lib_mutex_lock(&workers.submit);
+    lib_mutex_lock(&workers.lock);
+    lib_mutex_lock(&pool.lock);
+    lib_mutex_lock(&resample_lock);
+}
+
+static void after_fork_parent(void) {
+    lib_mutex_unlock(&resample_lock);
+    lib_mutex_unlock(&pool.lock);
+    lib_mutex_unlock(&workers.lock);
+    lib_mutex_unlock(&workers.submit);
+}
+
+static void after_fork_child(void) {
+    pthread_mutex_init(&pool.lock, NULL);
+    pthread_mutex_init(&resample_lock, NULL);
+    pthread_mutex_init(&workers.lock, NULL);
+    pthread_mutex_init(&workers.submit, NULL);
+    pthread_cond_init(&workers.work_ready, NULL);
+    pthread_cond_init(&workers.work_done, NULL);
+    workers.started = 0;
+}
+#endif
+
+// Starts workers until count are running. Called with workers.lock held.
+static void start_workers_locked(uint32_t count) {
+    #ifndef _WIN32
+    static int fork_handlers_installed = 0;
+    if (!fork_handlers_installed) {
+        pthread_atfork(before_fork, after_fork_parent, after_fork_child);
+        fork_handlers_installed = 1;
+    }
+    #endif
+
+    while (workers.started < count) {
+        void* arg = (void*)(uintptr_t)workers.started;
+        #ifdef _WIN32
+        HANDLE thread = CreateThread(NULL, 0, worker_main, arg, 0, NULL);
+        if (thread == NULL) break;
+        CloseHandle(thread);
+        #else
+        pthread_t thread;
+        if (pthread_create(&thread, NULL, worker_main, arg) != 0) break;
+        pthread_detach(thread);
+        #endif
+        workers.started++;
+    }
+}
+
+// Calls fn over rows [0, rows), split into bands across the worker pool when the
+// job covers at least parallel_threshold pixels. Falls back to a single inline
+// call for small jobs, nested calls, or while another thread owns the pool.
+static void parallel_rows(band_fn fn, void* ctx, uint32_t rows, uint64_t pixels) {
+    uint32_t threads = (uint32_t)stats_load(&workers.num_threads);
+    if (threads < 2 || rows < 2 * MIN_BAND_ROWS || pixels < stats_load(&workers.parallel_threshold) ||
+        !lib_mutex_trylock(&workers.submit)) {
+        fn(ctx, 0, rows);
+        return;
+    }
+
+    lib_mutex_lock(&workers.lock);
+    start_workers_locked(threads - 1);
+
+    uint32_t band_rows = (rows + threads * BANDS_PER_THREAD - 1) / (threads * BANDS_PER_THREAD);
+    if (band_rows < MIN_BAND_ROWS) band_rows = MIN_BAND_ROWS;
+
+    workers.fn = fn;
+    workers.ctx = ctx;
+    workers.rows = rows;
+    workers.band_rows = band_rows;
+    workers.bands = (rows + band_rows - 1) / band_rows;
+    workers.next_band = 0;
+    workers.done_bands = 0;
+    workers.generation++;
+    lib_cond_broadcast(&workers.work_ready);
+
+    run_bands_locked();
+    while (workers.done_bands < workers.bands) {
+        lib_cond_wait(&workers.work_done, &workers.lock);
+    }
+
+    lib_mutex_unlock(&workers.lock);
+    lib_mutex_unlock(&workers.submit);
+}
+
+// Every fill, blit and blend is a clipped rectangle processed one row at a time
+// by a per-tier row kernel. For fills, src points at the 4-byte color and
+// src_stride is 0.
+typedef void (*row_fn)(uint8_t* dst, const uint8_t* src, uint32_t count);
+
+typedef struct {
+    uint8_t* dst;
+    const uint8_t* src;
+    size_t dst_stride;
+    size_t src_stride;
+    uint32_t width;
+    uint32_t height;
+    row_fn row;
+} rect_op;
+
+// Clips a src_width x src_height source placed at (start_x, start_y) against the
+// destination. Source pixels are src_bytes wide. Returns 0 when nothing is visible.
+static int clip_rect_bytes(rect_op* op, uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                           const uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                           uint32_t src_bytes, int32_t start_x, int32_t start_y) {
+    int64_t x0 = (start_x < 0) ? 0 : start_x;
+    int64_t y0 = (start_y < 0) ? 0 : start_y;
+    int64_t x1 = (int64_t)start_x + src_width;
+    int64_t y1 = (int64_t)start_y + src_height;
+    if (x1 > dest_width) x1 = dest_width;
+    if (y1 > dest_height) y1 = dest_height;
+
+    if (x0 >= x1 || y0 >= y1) return 0;
+
+    op->dst = dest + (size_t)y0 * dest_stride + (size_t)x0 * 4;
+    op->src = src + (size_t)(y0 - start_y) * src_stride + (size_t)(x0 - start_x) * src_bytes;
+    op->dst_stride = dest_stride;
+    op->src_stride = src_stride;
+    op->width = (uint32_t)(x1 - x0);
+    op->height = (uint32_t)(y1 - y0);
+    return 1;
+}
+
+static int clip_rect(rect_op* op, uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                     const uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                     int32_t start_x, int32_t start_y) {
+    return clip_rect_bytes(op, dest, dest_width, dest_height, dest_stride,
+                           src, src_width, src_height, src_stride, 4, start_x, start_y);
+}
+
+static void rect_rows(void* ctx, uint32_t y0, uint32_t y1) {
+    const rect_op* op = (const rect_op*)ctx;
+    uint8_t* dst = op->dst + (size_t)y0 * op->dst_stride;
+    const uint8_t* src = op->src + (size_t)y0 * op->src_stride;
+
+    for (uint32_t y = y0; y < y1; y++) {
+        op->row(dst, src, op->width);
+        dst += op->dst_stride;
+        src += op->src_stride;
+    }
+}
+
+static void run_rect(rect_op* op, int parallel) {
+    if (parallel) {
+        parallel_rows(rect_rows, op, op->height, (uint64_t)op->width * op->height);
+    } else {
+        rect_rows(op, 0, op->height);
+    }
+}
+
+// Explicit *_avx2 / *_neon entry points fall back to the scalar kernel when the
+// running CPU lacks the instruction set, so they are always safe to call.
+#if HAS_AVX2
+#define AVX2_OR(fast, fallback) ((cpu_features() & CPU_FEATURE_AVX2) ? (fast) : (fallback))
+#else
+#define AVX2_OR(fast, fallback) (fallback)
+#endif
+
+#if HAS_NEON
+#define NEON_OR(fast, fallback) ((cpu_features() & CPU_FEATURE_NEON) ? (fast) : (fallback))
+#else
+#define NEON_OR(fast, fallback) (fallback)
+#endif
+
+// Opt-in kernel counters: every kernel family records its calls, destination
+// pixels, bytes read plus written and wall time, split by the SIMD tier that
+// ran. While disabled a call costs one predictable branch; building with
+// PYCRGBA_NO_STATS removes the hooks entirely. Each family is counted once in
+// the *_with helper that its plain, _avx2, _neon, _strided and auto_ entry
+// points share.
+#ifndef PYCRGBA_NO_STATS
+#define PYCRGBA_STATS 1
+#else
+#define PYCRGBA_STATS 0
+#endif
+
+enum {
+    STAT_FILL,
+    STAT_BLIT,
+    STAT_BLIT_SAME_SIZE,
+    STAT_BLEND,
+    STAT_BLEND_PREMULTIPLIED,
+    STAT_BLEND_ANALYZED,
+    STAT_BLEND_MASK,
+    STAT_BLEND_MASK_BATCH,
+    STAT_PREMULTIPLY,
+    STAT_UNPREMULTIPLY,
+    STAT_CONVERT_PIXELS,
+    STAT_NEAREST_RESIZE,
+    STAT_BILINEAR_RESIZE,
+    STAT_AREA_RESIZE,
+    STAT_SCALED_BLIT,
+    STAT_SCALED_BLEND,
+    STAT_ANALYZE_ALPHA,
+    STAT_DRAW_BATCH,
+    STAT_RECOMPOSE_DAMAGED,
+    STAT_DIFF_REGIONS,
+    STAT_MULTIPLY,
+    STAT_OPS
+};
+
+static const char* const stat_names[STAT_OPS] = {
+    "fill", "blit", "blit_same_size", "blend", "blend_premultiplied", "blend_analyzed",
+    "blend_mask", "blend_mask_batch", "premultiply", "unpremultiply", "convert_pixels",
+    "nearest_resize", "bilinear_resize", "area_resize", "scaled_blit", "scaled_blend", "analyze_alpha",
+    "draw_batch", "recompose_damaged", "diff_regions", "multiply",
+};
+
+static kernel_stats stat_table[STAT_OPS][STATS_TIERS];
+static volatile int stats_on = 0;
+
+#if PYCRGBA_STATS
+static uint64_t stats_clock(void) {
+    #ifdef _WIN32
+    LARGE_INTEGER now, frequency;
+    QueryPerformanceCounter(&now);
+    QueryPerformanceFrequency(&frequency);
+    return (uint64_t)((double)now.QuadPart * 1e9 / (double)frequency.QuadPart);
     #else
-    if (posix_memalign((void**)&image_data, ALIGNMENT, size) != 0) {
-        image_data = NULL;
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (uint64_t)now.tv_sec * 1000000000u + (uint64_t)now.tv_nsec;
+    #endif
+}
+
+// kernel is the row (or table) the call ran with; it picks the tier, and for
+// the helpers shared by two families, the family. Defined after the dispatch tables.
+static void stats_record(uint32_t op, const void* kernel, uint64_t start, uint64_t pixels, uint64_t bytes);
+
+#define STATS_START() uint64_t stats_start = stats_on ? stats_clock() : 0
+#define STATS_STOP(op, kernel, pixels, bytes) \
+    do { if (stats_start) stats_record((op), (const void*)(kernel), stats_start, (pixels), (bytes)); } while (0)
+#else
+#define STATS_START() ((void)0)
+#define STATS_STOP(op, kernel, pixels, bytes) ((void)(op), (void)(pixels), (void)(bytes))
+#endif
+
+static void fill_row(uint8_t* dst, const uint8_t* color, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++) {
+        dst[i * 4] = color[0];
+        dst[i * 4 + 1] = color[1];
+        dst[i * 4 + 2] = color[2];
+        dst[i * 4 + 3] = color[3];
+    }
+}
+
+#if HAS_AVX2
+TARGET_AVX2
+static void fill_row_avx2(uint8_t* dst, const uint8_t* color, uint32_t count) {
+    uint32_t pixel;
+    memcpy(&pixel, color, 4);
+    __m256i rgba = _mm256_set1_epi32((int32_t)pixel);
+
+    uint32_t avx2_blocks = count / 8;
+    for (uint32_t i = 0; i < avx2_blocks; i++) {
+        _mm256_storeu_si256((__m256i*)&dst[i * 32], rgba);
+    }
+
+    fill_row(dst + avx2_blocks * 32, color, count % 8);
+}
+#endif
+
+#if HAS_NEON
+static void fill_row_neon(uint8_t* dst, const uint8_t* color, uint32_t count) {
+    uint32_t pixel;
+    memcpy(&pixel, color, 4);
+    uint32x4_t rgba = vdupq_n_u32(pixel);
+
+    uint32_t neon_blocks = count / 4;
+    for (uint32_t i = 0; i < neon_blocks; i++) {
+        vst1q_u32((uint32_t*)&dst[i * 16], rgba);
+    }
+
+    fill_row(dst + neon_blocks * 16, color, count % 4);
+}
+#endif
+
+static row_fn streaming_row(row_fn row, const rect_op* op);
+
+static void fill_with(row_fn row, int parallel, uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                      uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    if (image_data == NULL) {
+        printf("Image data is NULL\n");
+        return;
+    }
+
+    STATS_START();
+    uint8_t color[4] = {r, g, b, a};
+    uint64_t pixels = 0;
+    rect_op op;
+    if (clip_rect(&op, image_data, width, height, stride, color, width, height, 0, 0, 0)) {
+        op.row = streaming_row(row, &op);
+        run_rect(&op, parallel);
+        pixels = (uint64_t)op.width * op.height;
+    }
+    STATS_STOP(STAT_FILL, row, pixels, pixels * 4);
+}
+
+void fill_image_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(fill_row, 0, image_data, width, height, (size_t)width * 4, r, g, b, a);
+}
+
+void fill_image_rgba_avx2(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(AVX2_OR(fill_row_avx2, fill_row), 0, image_data, width, height, (size_t)width * 4, r, g, b, a);
+}
+
+void fill_image_rgba_neon(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(NEON_OR(fill_row_neon, fill_row), 0, image_data, width, height, (size_t)width * 4, r, g, b, a);
+}
+
+void fill_image_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                             uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(fill_row, 0, image_data, width, height, stride, r, g, b, a);
+}
+
+void fill_image_rgba_strided_avx2(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                                  uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(AVX2_OR(fill_row_avx2, fill_row), 0, image_data, width, height, stride, r, g, b, a);
+}
+
+void fill_image_rgba_strided_neon(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                                  uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(NEON_OR(fill_row_neon, fill_row), 0, image_data, width, height, stride, r, g, b, a);
+}
+
+// Alpha arithmetic shared by the blend kernels. The straight-alpha blend
+// divides by 255 rounding down, exactly like the scalar integer division; the
+// premultiplied kernels round to nearest.
+static inline uint32_t div255(uint32_t x) {
+    x += 128;
+    return (x + (x >> 8)) >> 8;
+}
+
+#if HAS_AVX2
+// Rounded x / 255 for 16-bit lanes holding products of two bytes.
+TARGET_AVX2
+static inline __m256i div255_epu16(__m256i x) {
+    x = _mm256_add_epi16(x, _mm256_set1_epi16(128));
+    return _mm256_srli_epi16(_mm256_add_epi16(x, _mm256_srli_epi16(x, 8)), 8);
+}
+
+// Copies each pixel's alpha word to its four 16-bit lanes.
+TARGET_AVX2
+static inline __m256i broadcast_alpha_epu16(__m256i pixels) {
+    return _mm256_shufflehi_epi16(_mm256_shufflelo_epi16(pixels, _MM_SHUFFLE(3, 3, 3, 3)), _MM_SHUFFLE(3, 3, 3, 3));
+}
+
+// x / 255 rounded down for 16-bit lanes holding at most 255 * 255, matching
+// the integer division of the scalar straight-alpha blend.
+TARGET_AVX2
+static inline __m256i div255_floor_epu16(__m256i x) {
+    x = _mm256_add_epi16(x, _mm256_add_epi16(_mm256_srli_epi16(x, 8), _mm256_set1_epi16(1)));
+    return _mm256_srli_epi16(x, 8);
+}
+#endif
+
+#if HAS_NEON
+// Rounded x / 255 narrowed to bytes, for products of two bytes.
+static inline uint8x8_t div255_neon(uint16x8_t x) {
+    return vraddhn_u16(x, vrshrq_n_u16(x, 8));
+}
+
+// x / 255 rounded down and narrowed to bytes, for x <= 255 * 255.
+static inline uint8x8_t div255_floor_neon(uint16x8_t x) {
+    x = vaddq_u16(x, vaddq_u16(vshrq_n_u16(x, 8), vdupq_n_u16(1)));
+    return vshrn_n_u16(x, 8);
+}
+#endif
+
+static void blend_row(uint8_t* background, const uint8_t* overlay, uint32_t count) {
+    for (uint32_t x = 0; x < count; x++) {
+        uint32_t pixel_index = x * 4;
+
+        uint8_t r1 = background[pixel_index];
+        uint8_t g1 = background[pixel_index + 1];
+        uint8_t b1 = background[pixel_index + 2];
+        uint8_t a1 = background[pixel_index + 3];
+
+        uint8_t r2 = overlay[pixel_index];
+        uint8_t g2 = overlay[pixel_index + 1];
+        uint8_t b2 = overlay[pixel_index + 2];
+        uint8_t a2 = overlay[pixel_index + 3];
+
+        if (a2 == 0) {
+            continue;
+        } else if (a2 == 255) {
+            background[pixel_index] = r2;
+            background[pixel_index + 1] = g2;
+            background[pixel_index + 2] = b2;
+            background[pixel_index + 3] = a2;
+        } else {
+            uint32_t inv_alpha = 255 - a2;
+            background[pixel_index]     = (r2 * a2 + r1 * inv_alpha) / 255;
+            background[pixel_index + 1] = (g2 * a2 + g1 * inv_alpha) / 255;
+            background[pixel_index + 2] = (b2 * a2 + b1 * inv_alpha) / 255;
+            background[pixel_index + 3] = a2 + (a1 * inv_alpha) / 255;
+        }
+    }
+}
+
+#if HAS_AVX2
+// Blends two pixels per 64-bit half in 16-bit lanes. Color lanes get
+// (s * a + d * (255 - a)) / 255 and the alpha lane a + d * (255 - a) / 255,
+// both rounded down. For a == 0 and a == 255 this gives back d and s, so
+// mixed vectors need no per-pixel branches to match the scalar kernel.
+TARGET_AVX2
+static inline __m256i blend_straight_epu16(__m256i src, __m256i dst) {
+    __m256i alpha = broadcast_alpha_epu16(src);
+    __m256i inv_alpha = _mm256_sub_epi16(_mm256_set1_epi16(255), alpha);
+    __m256i dst_part = _mm256_mullo_epi16(dst, inv_alpha);
+    __m256i color = div255_floor_epu16(_mm256_add_epi16(_mm256_mullo_epi16(src, alpha), dst_part));
+    __m256i new_alpha = _mm256_add_epi16(alpha, div255_floor_epu16(dst_part));
+    return _mm256_blend_epi16(color, new_alpha, 0x88);
+}
+
+// Each vector of 8 overlay pixels is classified by its alpha bytes first:
+// fully transparent vectors are skipped without touching the background,
+// fully opaque ones are stored as they are, and only mixed ones are blended.
+TARGET_AVX2
+static void blend_row_avx2(uint8_t* background, const uint8_t* overlay, uint32_t count) {
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i alpha_mask = _mm256_set1_epi32((int32_t)0xFF000000);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m256i src = _mm256_loadu_si256((const __m256i*)(overlay + x * 4));
+        __m256i alpha = _mm256_and_si256(src, alpha_mask);
+
+        if (_mm256_movemask_epi8(_mm256_cmpeq_epi32(alpha, zero)) == -1) {
+            continue;
+        }
+        if (_mm256_movemask_epi8(_mm256_cmpeq_epi32(alpha, alpha_mask)) == -1) {
+            _mm256_storeu_si256((__m256i*)(background + x * 4), src);
+            continue;
+        }
+
+        __m256i dst = _mm256_loadu_si256((const __m256i*)(background + x * 4));
+        __m256i lo = blend_straight_epu16(_mm256_unpacklo_epi8(src, zero), _mm256_unpacklo_epi8(dst, zero));
+        __m256i hi = blend_straight_epu16(_mm256_unpackhi_epi8(src, zero), _mm256_unpackhi_epi8(dst, zero));
+        _mm256_storeu_si256((__m256i*)(background + x * 4), _mm256_packus_epi16(lo, hi));
+    }
+
+    blend_row(background + x * 4, overlay + x * 4, count - x);
+}
+#endif
+
+#if HAS_NEON
+// Same classification as the AVX2 kernel on 8 deinterleaved pixels; the
+// eight alpha bytes are tested as one 64-bit lane.
+static inline void blend_pixels_neon(uint8_t* background, uint8x8x4_t src) {
+    uint64_t alpha_bits = vget_lane_u64(vreinterpret_u64_u8(src.val[3]), 0);
+
+    if (alpha_bits == 0) {
+        return;
+    }
+    if (alpha_bits == UINT64_MAX) {
+        vst4_u8(background, src);
+        return;
+    }
+
+    uint8x8x4_t dst = vld4_u8(background);
+    uint8x8_t inv_alpha = vmvn_u8(src.val[3]);
+    for (uint32_t c = 0; c < 3; c++) {
+        uint16x8_t sum = vmlal_u8(vmull_u8(src.val[c], src.val[3]), dst.val[c], inv_alpha);
+        dst.val[c] = div255_floor_neon(sum);
+    }
+    dst.val[3] = vadd_u8(src.val[3], div255_floor_neon(vmull_u8(dst.val[3], inv_alpha)));
+    vst4_u8(background, dst);
+}
+
+static void blend_row_neon(uint8_t* background, const uint8_t* overlay, uint32_t count) {
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        blend_pixels_neon(background + x * 4, vld4_u8(overlay + x * 4));
+    }
+
+    blend_row(background + x * 4, overlay + x * 4, count - x);
+}
+#endif
+
+static void blend_with(row_fn row, int parallel, uint8_t* background, uint32_t bg_width, uint32_t bg_height,
+                       size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                       int32_t start_x, int32_t start_y) {
+    if (background == NULL || overlay == NULL) {
+        printf("Background or overlay image is NULL\n");
+        return;
+    }
+
+    STATS_START();
+    uint64_t pixels = 0;
+    rect_op op;
+    if (clip_rect(&op, background, bg_width, bg_height, bg_stride,
+                  overlay, ov_width, ov_height, ov_stride, start_x, start_y)) {
+        op.row = row;
+        run_rect(&op, parallel);
+        pixels = (uint64_t)op.width * op.height;
+    }
+    STATS_STOP(STAT_BLEND, row, pixels, pixels * 12);
+}
+
+void blend(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+            uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(blend_row, 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+               overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
+}
+
+void blend_avx2(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(AVX2_OR(blend_row_avx2, blend_row), 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+               overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
+}
+
+void blend_neon(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(NEON_OR(blend_row_neon, blend_row), 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+               overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
+}
+
+void blend_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                   uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                   int32_t start_x, int32_t start_y) {
+    blend_with(blend_row, 0, background, bg_width, bg_height, bg_stride,
+               overlay, ov_width, ov_height, ov_stride, start_x, start_y);
+}
+
+void blend_strided_avx2(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                        uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                        int32_t start_x, int32_t start_y) {
+    blend_with(AVX2_OR(blend_row_avx2, blend_row), 0, background, bg_width, bg_height, bg_stride,
+               overlay, ov_width, ov_height, ov_stride, start_x, start_y);
+}
+
+void blend_strided_neon(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                        uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                        int32_t start_x, int32_t start_y) {
+    blend_with(NEON_OR(blend_row_neon, blend_row), 0, background, bg_width, bg_height, bg_stride,
+               overlay, ov_width, ov_height, ov_stride, start_x, start_y);
+}
+
+// Coverage masks: a solid colour is drawn through an 8-bit mask, one byte per
+// pixel. Each pixel's alpha is mask * a / 255 (rounded), after which the pixel
+// is blended exactly like blend_row(), so blending through a mask matches
+// blending the equivalent expanded RGBA overlay on every tier.
+typedef void (*mask_row_fn)(uint8_t* dst, const uint8_t* mask, uint32_t count, const uint8_t* color);
+
+typedef struct {
+    rect_op rect;
+    mask_row_fn row;
+    uint8_t color[4];
+} mask_op;
+
+static void blend_mask_row(uint8_t* dst, const uint8_t* mask, uint32_t count, const uint8_t* color) {
+    for (uint32_t x = 0; x < count; x++) {
+        uint32_t alpha = div255((uint32_t)mask[x] * color[3]);
+        uint8_t* pixel = dst + x * 4;
+
+        if (alpha == 0) {
+            continue;
+        } else if (alpha == 255) {
+            pixel[0] = color[0];
+            pixel[1] = color[1];
+            pixel[2] = color[2];
+            pixel[3] = 255;
+        } else {
+            uint32_t inv_alpha = 255 - alpha;
+            pixel[0] = (color[0] * alpha + pixel[0] * inv_alpha) / 255;
+            pixel[1] = (color[1] * alpha + pixel[1] * inv_alpha) / 255;
+            pixel[2] = (color[2] * alpha + pixel[2] * inv_alpha) / 255;
+            pixel[3] = alpha + (pixel[3] * inv_alpha) / 255;
+        }
+    }
+}
+
+#if HAS_AVX2
+// The colour is constant, so the blend needs no alpha classification: with the
+// colour widened to (r, g, b, 255), (colour * alpha + dst * (255 - alpha)) / 255
+// rounded down gives blend_row()'s result on all four channels, alpha included.
+// The eight per-pixel alphas are computed once in 16-bit lanes and shuffled into
+// the unpacklo/unpackhi pixel order.
+TARGET_AVX2
+static void blend_mask_row_avx2(uint8_t* dst, const uint8_t* mask, uint32_t count, const uint8_t* color) {
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i max = _mm256_set1_epi16(255);
+    const __m256i src = _mm256_setr_epi16(color[0], color[1], color[2], 255, color[0], color[1], color[2], 255,
+                                          color[0], color[1], color[2], 255, color[0], color[1], color[2], 255);
+    const __m256i solid = _mm256_set1_epi32((int32_t)(color[0] | (color[1] << 8) | (color[2] << 16) | 0xFF000000u));
+    const __m256i lo_order = _mm256_setr_epi8(0, 1, 0, 1, 0, 1, 0, 1, 2, 3, 2, 3, 2, 3, 2, 3,
+                                              8, 9, 8, 9, 8, 9, 8, 9, 10, 11, 10, 11, 10, 11, 10, 11);
+    const __m256i hi_order = _mm256_setr_epi8(4, 5, 4, 5, 4, 5, 4, 5, 6, 7, 6, 7, 6, 7, 6, 7,
+                                              12, 13, 12, 13, 12, 13, 12, 13, 14, 15, 14, 15, 14, 15, 14, 15);
+    const __m128i alpha = _mm_set1_epi16(color[3]);
+    const __m128i eight_bytes = _mm_set_epi64x(0, -1);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m128i coverage = _mm_loadl_epi64((const __m128i*)(mask + x));
+        if (_mm_testz_si128(coverage, coverage)) {
+            continue;
+        }
+        if (color[3] == 255 && _mm_testc_si128(coverage, eight_bytes)) {
+            _mm256_storeu_si256((__m256i*)(dst + x * 4), solid);
+            continue;
+        }
+
+        __m128i src_alpha = _mm_add_epi16(_mm_mullo_epi16(_mm_cvtepu8_epi16(coverage), alpha), _mm_set1_epi16(128));
+        src_alpha = _mm_srli_epi16(_mm_add_epi16(src_alpha, _mm_srli_epi16(src_alpha, 8)), 8);
+        __m256i both = _mm256_broadcastsi128_si256(src_alpha);
+        __m256i alpha_lo = _mm256_shuffle_epi8(both, lo_order);
+        __m256i alpha_hi = _mm256_shuffle_epi8(both, hi_order);
+
+        __m256i pixels = _mm256_loadu_si256((const __m256i*)(dst + x * 4));
+        __m256i lo = _mm256_add_epi16(_mm256_mullo_epi16(src, alpha_lo),
+                                      _mm256_mullo_epi16(_mm256_unpacklo_epi8(pixels, zero), _mm256_sub_epi16(max, alpha_lo)));
+        __m256i hi = _mm256_add_epi16(_mm256_mullo_epi16(src, alpha_hi),
+                                      _mm256_mullo_epi16(_mm256_unpackhi_epi8(pixels, zero), _mm256_sub_epi16(max, alpha_hi)));
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), _mm256_packus_epi16(div255_floor_epu16(lo), div255_floor_epu16(hi)));
+    }
+
+    blend_mask_row(dst + x * 4, mask + x, count - x, color);
+}
+#endif
+
+#if HAS_NEON
+static void blend_mask_row_neon(uint8_t* dst, const uint8_t* mask, uint32_t count, const uint8_t* color) {
+    const uint8x8_t alpha = vdup_n_u8(color[3]);
+    uint8x8x4_t src;
+    src.val[0] = vdup_n_u8(color[0]);
+    src.val[1] = vdup_n_u8(color[1]);
+    src.val[2] = vdup_n_u8(color[2]);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        uint8x8_t coverage = vld1_u8(mask + x);
+        if (vget_lane_u64(vreinterpret_u64_u8(coverage), 0) == 0) {
+            continue;
+        }
+
+        src.val[3] = div255_neon(vmull_u8(coverage, alpha));
+        blend_pixels_neon(dst + x * 4, src);
+    }
+
+    blend_mask_row(dst + x * 4, mask + x, count - x, color);
+}
+#endif
+
+static void mask_rows(void* ctx, uint32_t y0, uint32_t y1) {
+    const mask_op* op = (const mask_op*)ctx;
+    const rect_op* rect = &op->rect;
+
+    for (uint32_t y = y0; y < y1; y++) {
+        op->row(rect->dst + (size_t)y * rect->dst_stride, rect->src + (size_t)y * rect->src_stride,
+                rect->width, op->color);
+    }
+}
+
+// Clips a mask placed at (start_x, start_y) exactly like blend_with() clips an
+// overlay. Returns 0 when nothing is visible.
+static int clip_mask(mask_op* op, mask_row_fn row, uint8_t* dest, uint32_t dest_width, uint32_t dest_height,
+                     size_t dest_stride, const uint8_t* mask, uint32_t mask_width, uint32_t mask_height,
+                     size_t mask_stride, int32_t start_x, int32_t start_y,
+                     uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    if (a == 0 || !clip_rect_bytes(&op->rect, dest, dest_width, dest_height, dest_stride,
+                                   mask, mask_width, mask_height, mask_stride, 1, start_x, start_y)) {
+        return 0;
+    }
+
+    op->row = row;
+    op->color[0] = r;
+    op->color[1] = g;
+    op->color[2] = b;
+    op->color[3] = a;
+    return 1;
+}
+
+static void blend_mask_with(mask_row_fn row, int parallel, uint8_t* dest, uint32_t dest_width, uint32_t dest_height,
+                            size_t dest_stride, const uint8_t* mask, uint32_t mask_width, uint32_t mask_height,
+                            size_t mask_stride, int32_t start_x, int32_t start_y,
+                            uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    if (dest == NULL || mask == NULL) {
+        printf("Destination or mask image is NULL\n");
+        return;
+    }
+
+    STATS_START();
+    uint64_t pixels = 0;
+    mask_op op;
+    if (clip_mask(&op, row, dest, dest_width, dest_height, dest_stride,
+                  mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a)) {
+        pixels = (uint64_t)op.rect.width * op.rect.height;
+        if (parallel) {
+            parallel_rows(mask_rows, &op, op.rect.height, pixels);
+        } else {
+            mask_rows(&op, 0, op.rect.height);
+        }
+    }
+    STATS_STOP(STAT_BLEND_MASK, row, pixels, pixels * 9);
+}
+
+void blend_mask(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height,
+                uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y,
+                uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(blend_mask_row, 0, dest, dest_width, dest_height, (size_t)dest_width * 4,
+                    mask, mask_width, mask_height, mask_width, start_x, start_y, r, g, b, a);
+}
+
+void blend_mask_avx2(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height,
+                     uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y,
+                     uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(AVX2_OR(blend_mask_row_avx2, blend_mask_row), 0, dest, dest_width, dest_height,
+                    (size_t)dest_width * 4, mask, mask_width, mask_height, mask_width, start_x, start_y, r, g, b, a);
+}
+
+void blend_mask_neon(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height,
+                     uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y,
+                     uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(NEON_OR(blend_mask_row_neon, blend_mask_row), 0, dest, dest_width, dest_height,
+                    (size_t)dest_width * 4, mask, mask_width, mask_height, mask_width, start_x, start_y, r, g, b, a);
+}
+
+void blend_mask_strided(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                        uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride,
+                        int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(blend_mask_row, 0, dest, dest_width, dest_height, dest_stride,
+                    mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a);
+}
+
+void blend_mask_strided_avx2(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                             uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride,
+                             int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(AVX2_OR(blend_mask_row_avx2, blend_mask_row), 0, dest, dest_width, dest_height, dest_stride,
+                    mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a);
+}
+
+void blend_mask_strided_neon(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                             uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride,
+                             int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(NEON_OR(blend_mask_row_neon, blend_mask_row), 0, dest, dest_width, dest_height, dest_stride,
+                    mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a);
+}
+
+// Premultiplied alpha: color channels are stored already multiplied by alpha,
+// so "over" is dst = src + dst * (255 - src_alpha) / 255 on every channel,
+// alpha included. That is correct for translucent backgrounds too and needs
+// a single multiply per channel, which fits in 16-bit lanes. All kernels use
+// div255() rounding, so every tier produces identical results.
+
+// unpremultiply_recip[a] = ceil(255 * 65536 / a). With channels clamped to
+// alpha, (c * recip + 32768) >> 16 equals round(c * 255 / a) for every input.
+static uint32_t unpremultiply_recip[256];
+
+static void init_unpremultiply_recip(void) {
+    for (uint32_t a = 1; a < 256; a++) {
+        unpremultiply_recip[a] = (255u * 65536u + a - 1) / a;
+    }
+}
+
+static void premultiply_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t x = 0; x < count; x++) {
+        uint32_t a = src[x * 4 + 3];
+        dst[x * 4 + 0] = (uint8_t)div255(src[x * 4 + 0] * a);
+        dst[x * 4 + 1] = (uint8_t)div255(src[x * 4 + 1] * a);
+        dst[x * 4 + 2] = (uint8_t)div255(src[x * 4 + 2] * a);
+        dst[x * 4 + 3] = (uint8_t)a;
+    }
+}
+
+static void unpremultiply_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t x = 0; x < count; x++) {
+        uint32_t a = src[x * 4 + 3];
+        uint32_t recip = unpremultiply_recip[a];
+        for (uint32_t c = 0; c < 3; c++) {
+            uint32_t value = src[x * 4 + c] < a ? src[x * 4 + c] : a;
+            dst[x * 4 + c] = (uint8_t)((value * recip + 32768) >> 16);
+        }
+        dst[x * 4 + 3] = (uint8_t)a;
+    }
+}
+
+static inline uint8_t over_channel(uint32_t src, uint32_t dst, uint32_t inv_alpha) {
+    uint32_t value = src + div255(dst * inv_alpha);
+    return (uint8_t)(value < 255 ? value : 255);
+}
+
+static void blend_premultiplied_row(uint8_t* background, const uint8_t* overlay, uint32_t count) {
+    for (uint32_t x = 0; x < count; x++) {
+        uint8_t* dst = background + x * 4;
+        const uint8_t* src = overlay + x * 4;
+        uint32_t inv_alpha = 255 - src[3];
+        dst[0] = over_channel(src[0], dst[0], inv_alpha);
+        dst[1] = over_channel(src[1], dst[1], inv_alpha);
+        dst[2] = over_channel(src[2], dst[2], inv_alpha);
+        dst[3] = over_channel(src[3], dst[3], inv_alpha);
+    }
+}
+
+#if HAS_AVX2
+TARGET_AVX2
+static void premultiply_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i alpha_mask = _mm256_set1_epi32((int32_t)0xFF000000);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m256i pixels = _mm256_loadu_si256((const __m256i*)(src + x * 4));
+        __m256i lo = _mm256_unpacklo_epi8(pixels, zero);
+        __m256i hi = _mm256_unpackhi_epi8(pixels, zero);
+        lo = div255_epu16(_mm256_mullo_epi16(lo, broadcast_alpha_epu16(lo)));
+        hi = div255_epu16(_mm256_mullo_epi16(hi, broadcast_alpha_epu16(hi)));
+        __m256i result = _mm256_blendv_epi8(_mm256_packus_epi16(lo, hi), pixels, alpha_mask);
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), result);
+    }
+
+    premultiply_row(dst + x * 4, src + x * 4, count - x);
+}
+
+// Channels are isolated in 32-bit lanes so they can be multiplied by the
+// gathered reciprocal of their pixel's alpha.
+TARGET_AVX2
+static void unpremultiply_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const __m256i alpha_bytes = _mm256_setr_epi8(3, 3, 3, 3, 7, 7, 7, 7, 11, 11, 11, 11, 15, 15, 15, 15,
+                                                 3, 3, 3, 3, 7, 7, 7, 7, 11, 11, 11, 11, 15, 15, 15, 15);
+    const __m256i byte_mask = _mm256_set1_epi32(0xFF);
+    const __m256i round = _mm256_set1_epi32(32768);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m256i pixels = _mm256_loadu_si256((const __m256i*)(src + x * 4));
+        __m256i alpha = _mm256_srli_epi32(pixels, 24);
+        __m256i recip = _mm256_i32gather_epi32((const int*)unpremultiply_recip, alpha, 4);
+        __m256i clamped = _mm256_min_epu8(pixels, _mm256_shuffle_epi8(pixels, alpha_bytes));
+
+        __m256i r = _mm256_and_si256(clamped, byte_mask);
+        __m256i g = _mm256_and_si256(_mm256_srli_epi32(clamped, 8), byte_mask);
+        __m256i b = _mm256_and_si256(_mm256_srli_epi32(clamped, 16), byte_mask);
+        r = _mm256_srli_epi32(_mm256_add_epi32(_mm256_mullo_epi32(r, recip), round), 16);
+        g = _mm256_srli_epi32(_mm256_add_epi32(_mm256_mullo_epi32(g, recip), round), 16);
+        b = _mm256_srli_epi32(_mm256_add_epi32(_mm256_mullo_epi32(b, recip), round), 16);
+
+        __m256i result = _mm256_or_si256(_mm256_or_si256(r, _mm256_slli_epi32(g, 8)),
+                                         _mm256_or_si256(_mm256_slli_epi32(b, 16), _mm256_slli_epi32(alpha, 24)));
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), result);
+    }
+
+    unpremultiply_row(dst + x * 4, src + x * 4, count - x);
+}
+
+// All-zero vectors leave the background unchanged and fully opaque ones
+// replace it, so both skip the arithmetic.
+TARGET_AVX2
+static void blend_premultiplied_row_avx2(uint8_t* background, const uint8_t* overlay, uint32_t count) {
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i alpha_mask = _mm256_set1_epi32((int32_t)0xFF000000);
+    const __m256i max = _mm256_set1_epi16(255);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m256i src = _mm256_loadu_si256((const __m256i*)(overlay + x * 4));
+        if (_mm256_testz_si256(src, src)) {
+            continue;
+        }
+        if (_mm256_movemask_epi8(_mm256_cmpeq_epi32(_mm256_and_si256(src, alpha_mask), alpha_mask)) == -1) {
+            _mm256_storeu_si256((__m256i*)(background + x * 4), src);
+            continue;
+        }
+
+        __m256i dst = _mm256_loadu_si256((const __m256i*)(background + x * 4));
+        __m256i inv_lo = _mm256_sub_epi16(max, broadcast_alpha_epu16(_mm256_unpacklo_epi8(src, zero)));
+        __m256i inv_hi = _mm256_sub_epi16(max, broadcast_alpha_epu16(_mm256_unpackhi_epi8(src, zero)));
+        __m256i lo = div255_epu16(_mm256_mullo_epi16(_mm256_unpacklo_epi8(dst, zero), inv_lo));
+        __m256i hi = div255_epu16(_mm256_mullo_epi16(_mm256_unpackhi_epi8(dst, zero), inv_hi));
+        __m256i result = _mm256_adds_epu8(src, _mm256_packus_epi16(lo, hi));
+        _mm256_storeu_si256((__m256i*)(background + x * 4), result);
+    }
+
+    blend_premultiplied_row(background + x * 4, overlay + x * 4, count - x);
+}
+#endif
+
+#if HAS_NEON
+static void premultiply_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 8 <= count; x += 8) {
+        uint8x8x4_t pixels = vld4_u8(src + x * 4);
+        pixels.val[0] = div255_neon(vmull_u8(pixels.val[0], pixels.val[3]));
+        pixels.val[1] = div255_neon(vmull_u8(pixels.val[1], pixels.val[3]));
+        pixels.val[2] = div255_neon(vmull_u8(pixels.val[2], pixels.val[3]));
+        vst4_u8(dst + x * 4, pixels);
+    }
+    premultiply_row(dst + x * 4, src + x * 4, count - x);
+}
+
+static void unpremultiply_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const uint32x4_t round = vdupq_n_u32(32768);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        uint8x8x4_t pixels = vld4_u8(src + x * 4);
+        uint32_t lanes[8];
+        for (uint32_t i = 0; i < 8; i++) {
+            lanes[i] = unpremultiply_recip[src[(x + i) * 4 + 3]];
+        }
+        uint32x4_t recip_lo = vld1q_u32(lanes);
+        uint32x4_t recip_hi = vld1q_u32(lanes + 4);
+
+        for (uint32_t c = 0; c < 3; c++) {
+            uint16x8_t value = vmovl_u8(vmin_u8(pixels.val[c], pixels.val[3]));
+            uint32x4_t lo = vmlaq_u32(round, vmovl_u16(vget_low_u16(value)), recip_lo);
+            uint32x4_t hi = vmlaq_u32(round, vmovl_u16(vget_high_u16(value)), recip_hi);
+            pixels.val[c] = vmovn_u16(vcombine_u16(vshrn_n_u32(lo, 16), vshrn_n_u32(hi, 16)));
+        }
+        vst4_u8(dst + x * 4, pixels);
+    }
+
+    unpremultiply_row(dst + x * 4, src + x * 4, count - x);
+}
+
+static void blend_premultiplied_row_neon(uint8_t* background, const uint8_t* overlay, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 8 <= count; x += 8) {
+        uint8x8x4_t src = vld4_u8(overlay + x * 4);
+        uint8x8_t any = vorr_u8(vorr_u8(src.val[0], src.val[1]), vorr_u8(src.val[2], src.val[3]));
+        if (vget_lane_u64(vreinterpret_u64_u8(any), 0) == 0) {
+            continue;
+        }
+        if (vget_lane_u64(vreinterpret_u64_u8(src.val[3]), 0) == UINT64_MAX) {
+            vst4_u8(background + x * 4, src);
+            continue;
+        }
+
+        uint8x8x4_t dst = vld4_u8(background + x * 4);
+        uint8x8_t inv_alpha = vmvn_u8(src.val[3]);
+        for (uint32_t c = 0; c < 4; c++) {
+            dst.val[c] = vqadd_u8(src.val[c], div255_neon(vmull_u8(dst.val[c], inv_alpha)));
+        }
+        vst4_u8(background + x * 4, dst);
+    }
+    blend_premultiplied_row(background + x * 4, overlay + x * 4, count - x);
+}
+#endif
+
+// Runs an in-place row kernel over a whole image.
+static void convert_with(row_fn row, int parallel, uint8_t* image_data, uint32_t width, uint32_t height,
+                         size_t stride) {
+    if (image_data == NULL || width == 0 || height == 0) {
+        return;
+    }
+
+    // Also fills unpremultiply_recip on first use.
+    init_dispatch();
+    STATS_START();
+    rect_op op = {image_data, image_data, stride, stride, width, height, row};
+    run_rect(&op, parallel);
+    STATS_STOP(STAT_PREMULTIPLY, row, (uint64_t)width * height, (uint64_t)width * height * 8);
+}
+
+void premultiply(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(premultiply_row, 0, image_data, width, height, (size_t)width * 4);
+}
+
+void premultiply_avx2(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(AVX2_OR(premultiply_row_avx2, premultiply_row), 0, image_data, width, height, (size_t)width * 4);
+}
+
+void premultiply_neon(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(NEON_OR(premultiply_row_neon, premultiply_row), 0, image_data, width, height, (size_t)width * 4);
+}
+
+void unpremultiply(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(unpremultiply_row, 0, image_data, width, height, (size_t)width * 4);
+}
+
+void unpremultiply_avx2(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(AVX2_OR(unpremultiply_row_avx2, unpremultiply_row), 0, image_data, width, height, (size_t)width * 4);
+}
+
+void unpremultiply_neon(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(NEON_OR(unpremultiply_row_neon, unpremultiply_row), 0, image_data, width, height, (size_t)width * 4);
+}
+
+// Multiplying by a color scales each channel by color[c] / 255 in place, with
+// div255() rounding on every tier. (o, o, o, o) applies an opacity to
+// premultiplied pixels, (255, 255, 255, o) to straight ones. Like fills, the
+// row kernels get the color as src.
+static void multiply_row(uint8_t* dst, const uint8_t* color, uint32_t count) {
+    for (uint32_t x = 0; x < count; x++) {
+        dst[x * 4 + 0] = (uint8_t)div255(dst[x * 4 + 0] * color[0]);
+        dst[x * 4 + 1] = (uint8_t)div255(dst[x * 4 + 1] * color[1]);
+        dst[x * 4 + 2] = (uint8_t)div255(dst[x * 4 + 2] * color[2]);
+        dst[x * 4 + 3] = (uint8_t)div255(dst[x * 4 + 3] * color[3]);
+    }
+}
+
+#if HAS_AVX2
+TARGET_AVX2
+static void multiply_row_avx2(uint8_t* dst, const uint8_t* color, uint32_t count) {
+    const __m256i zero = _mm256_setzero_si256();
+    uint32_t packed;
+    memcpy(&packed, color, 4);
+    // Two pixels' worth of 16-bit factors per lane, matching the unpacked pixels.
+    const __m256i factors = _mm256_unpacklo_epi8(_mm256_set1_epi32((int32_t)packed), zero);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m256i pixels = _mm256_loadu_si256((const __m256i*)(dst + x * 4));
+        __m256i lo = div255_epu16(_mm256_mullo_epi16(_mm256_unpacklo_epi8(pixels, zero), factors));
+        __m256i hi = div255_epu16(_mm256_mullo_epi16(_mm256_unpackhi_epi8(pixels, zero), factors));
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), _mm256_packus_epi16(lo, hi));
+    }
+
+    multiply_row(dst + x * 4, color, count - x);
+}
+#endif
+
+#if HAS_NEON
+static void multiply_row_neon(uint8_t* dst, const uint8_t* color, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 8 <= count; x += 8) {
+        uint8x8x4_t pixels = vld4_u8(dst + x * 4);
+        for (uint32_t c = 0; c < 4; c++) {
+            pixels.val[c] = div255_neon(vmull_u8(pixels.val[c], vdup_n_u8(color[c])));
+        }
+        vst4_u8(dst + x * 4, pixels);
+    }
+    multiply_row(dst + x * 4, color, count - x);
+}
+#endif
+
+static void multiply_with(row_fn row, int parallel, uint8_t* image_data, uint32_t width, uint32_t height,
+                          size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    if (image_data == NULL || width == 0 || height == 0) {
+        return;
+    }
+
+    STATS_START();
+    uint8_t color[4] = {r, g, b, a};
+    rect_op op = {image_data, color, stride, 0, width, height, row};
+    run_rect(&op, parallel);
+    STATS_STOP(STAT_MULTIPLY, row, (uint64_t)width * height, (uint64_t)width * height * 8);
+}
+
+void multiply_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(multiply_row, 0, image_data, width, height, (size_t)width * 4, r, g, b, a);
+}
+
+void multiply_rgba_avx2(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(AVX2_OR(multiply_row_avx2, multiply_row), 0, image_data, width, height, (size_t)width * 4, r, g, b, a);
+}
+
+void multiply_rgba_neon(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(NEON_OR(multiply_row_neon, multiply_row), 0, image_data, width, height, (size_t)width * 4, r, g, b, a);
+}
+
+void multiply_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                           uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(multiply_row, 0, image_data, width, height, stride, r, g, b, a);
+}
+
+void multiply_rgba_strided_avx2(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                                uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(AVX2_OR(multiply_row_avx2, multiply_row), 0, image_data, width, height, stride, r, g, b, a);
+}
+
+void multiply_rgba_strided_neon(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                                uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(NEON_OR(multiply_row_neon, multiply_row), 0, image_data, width, height, stride, r, g, b, a);
+}
+
+void blend_premultiplied(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                         uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(blend_premultiplied_row, 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+               overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
+}
+
+void blend_premultiplied_avx2(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                              uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(AVX2_OR(blend_premultiplied_row_avx2, blend_premultiplied_row), 0, background, bg_width, bg_height,
+               (size_t)bg_width * 4, overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
+}
+
+void blend_premultiplied_neon(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                              uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(NEON_OR(blend_premultiplied_row_neon, blend_premultiplied_row), 0, background, bg_width, bg_height,
+               (size_t)bg_width * 4, overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
+}
+
+static void copy_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    memcpy(dst, src, (size_t)count * 4);
+}
+
+#if HAS_AVX2
+TARGET_AVX2
+static void copy_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t avx2_blocks = count / 8;
+    uint32_t remainder = count % 8;
+
+    for (uint32_t x = 0; x < avx2_blocks; x++) {
+        __m256i pixels = _mm256_loadu_si256((__m256i*)(src + x * 32));
+        _mm256_storeu_si256((__m256i*)(dst + x * 32), pixels);
+    }
+
+    if (remainder > 0) {
+        memcpy(dst + avx2_blocks * 32, src + avx2_blocks * 32, remainder * 4);
+    }
+}
+#endif
+
+#if HAS_NEON
+static void copy_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t neon_blocks = count / 4;
+    uint32_t remainder = count % 4;
+
+    for (uint32_t x = 0; x < neon_blocks; x++) {
+        uint32x4_t pixels = vld1q_u32((const uint32_t*)(src + x * 16));
+        vst1q_u32((uint32_t*)(dst + x * 16), pixels);
+    }
+
+    if (remainder > 0) {
+        memcpy(dst + neon_blocks * 16, src + neon_blocks * 16, remainder * 4);
+    }
+}
+#endif
+
+// Large-buffer mode: fills and copies that write at least streaming_threshold
+// bytes use non-temporal stores, so writing a whole frame does not evict the
+// sprites and tables the next blend needs. Each row is stored normally up to
+// the first 32-byte boundary, streamed, and finished with normal stores; the
+// sfence orders the streamed data before the row returns. 0 turns it off.
+// Kernels read the threshold with the GIL released, so it is accessed with
+// stats_load/stats_store.
+#define DEFAULT_STREAMING_THRESHOLD (16 * 1024 * 1024)
+
+static uint64_t streaming_threshold = DEFAULT_STREAMING_THRESHOLD;
+
+void set_streaming_threshold(uint64_t bytes) {
+    stats_store(&streaming_threshold, bytes);
+}
+
+uint64_t get_streaming_threshold(void) {
+    return stats_load(&streaming_threshold);
+}
+
+static int streaming_size(uint64_t bytes) {
+    uint64_t threshold = stats_load(&streaming_threshold);
+    return threshold > 0 && bytes >= threshold;
+}
+
+#if HAS_AVX2
+TARGET_AVX2
+static void stream_bytes_avx2(uint8_t* dst, const uint8_t* src, size_t bytes) {
+    size_t head = (ALIGNMENT - ((uintptr_t)dst & (ALIGNMENT - 1))) & (ALIGNMENT - 1);
+    if (head > bytes) head = bytes;
+    memcpy(dst, src, head);
+    dst += head;
+    src += head;
+    bytes -= head;
+
+    size_t blocks = bytes / 32;
+    for (size_t i = 0; i < blocks; i++) {
+        __m256i pixels = _mm256_loadu_si256((const __m256i*)(src + i * 32));
+        _mm256_stream_si256((__m256i*)(dst + i * 32), pixels);
+    }
+
+    memcpy(dst + blocks * 32, src + blocks * 32, bytes % 32);
+    _mm_sfence();
+}
+
+TARGET_AVX2
+static void copy_row_stream_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    stream_bytes_avx2(dst, src, (size_t)count * 4);
+}
+
+TARGET_AVX2
+static void fill_row_stream_avx2(uint8_t* dst, const uint8_t* color, uint32_t count) {
+    // A row that is not pixel-aligned never reaches a 32-byte boundary.
+    if ((uintptr_t)dst & 3) {
+        fill_row_avx2(dst, color, count);
+        return;
+    }
+
+    uint32_t head = (uint32_t)(((ALIGNMENT - ((uintptr_t)dst & (ALIGNMENT - 1))) & (ALIGNMENT - 1)) / 4);
+    if (head > count) head = count;
+    fill_row(dst, color, head);
+    dst += head * 4;
+    count -= head;
+
+    uint32_t pixel;
+    memcpy(&pixel, color, 4);
+    __m256i rgba = _mm256_set1_epi32((int32_t)pixel);
+
+    uint32_t avx2_blocks = count / 8;
+    for (uint32_t i = 0; i < avx2_blocks; i++) {
+        _mm256_stream_si256((__m256i*)&dst[i * 32], rgba);
+    }
+
+    fill_row(dst + avx2_blocks * 32, color, count % 8);
+    _mm_sfence();
+}
+#endif
+
+// Swaps a tier's fill or copy kernel for its streaming form when op is large
+// enough. NEON has no non-temporal store intrinsic, so that tier keeps its kernels.
+static row_fn streaming_row(row_fn row, const rect_op* op) {
+    if (!streaming_size((uint64_t)op->width * op->height * 4)) {
+        return row;
+    }
+#if HAS_AVX2
+    if (row == fill_row_avx2) return fill_row_stream_avx2;
+    if (row == copy_row_avx2) return copy_row_stream_avx2;
+#endif
+    return row;
+}
+
+static void blit_with(row_fn row, int parallel, uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+                      size_t dest_stride, const uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+                      size_t src_stride, int32_t start_x, int32_t start_y) {
+    if (dest_image == NULL || src_image == NULL) return;
+
+    STATS_START();
+    uint64_t pixels = 0;
+    rect_op op;
+    if (clip_rect(&op, dest_image, dest_width, dest_height, dest_stride,
+                  src_image, src_width, src_height, src_stride, start_x, start_y)) {
+        op.row = streaming_row(row, &op);
+        run_rect(&op, parallel);
+        pixels = (uint64_t)op.width * op.height;
+    }
+    STATS_STOP(STAT_BLIT, row, pixels, pixels * 8);
+}
+
+void blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+          uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+          int32_t start_x, int32_t start_y) {
+    blit_with(copy_row, 0, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+              src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y);
+}
+
+void blit_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+               uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+               int32_t start_x, int32_t start_y) {
+    blit_with(AVX2_OR(copy_row_avx2, copy_row), 0, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+              src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y);
+}
+
+void blit_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+               uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+               int32_t start_x, int32_t start_y) {
+    blit_with(NEON_OR(copy_row_neon, copy_row), 0, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+              src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y);
+}
+
+void blit_strided(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                  uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                  int32_t start_x, int32_t start_y) {
+    blit_with(copy_row, 0, dest_image, dest_width, dest_height, dest_stride,
+              src_image, src_width, src_height, src_stride, start_x, start_y);
+}
+
+void blit_strided_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                       uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                       int32_t start_x, int32_t start_y) {
+    blit_with(AVX2_OR(copy_row_avx2, copy_row), 0, dest_image, dest_width, dest_height, dest_stride,
+              src_image, src_width, src_height, src_stride, start_x, start_y);
+}
+
+void blit_strided_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                       uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                       int32_t start_x, int32_t start_y) {
+    blit_with(NEON_OR(copy_row_neon, copy_row), 0, dest_image, dest_width, dest_height, dest_stride,
+              src_image, src_width, src_height, src_stride, start_x, start_y);
+}
+
+void blit_same_size(uint8_t* src, uint8_t* dst, uint32_t width, uint32_t height, uint32_t channels) {
+    size_t total_bytes = (size_t)width * height * channels;
+    STATS_START();
+#if HAS_AVX2
+    if (streaming_size(total_bytes) && (cpu_features() & CPU_FEATURE_AVX2)) {
+        stream_bytes_avx2(dst, src, total_bytes);
+        STATS_STOP(STAT_BLIT_SAME_SIZE, copy_row_stream_avx2, (uint64_t)width * height, (uint64_t)total_bytes * 2);
+        return;
+    }
+#endif
+    memcpy(dst, src, total_bytes);
+    STATS_STOP(STAT_BLIT_SAME_SIZE, NULL, (uint64_t)width * height, (uint64_t)total_bytes * 2);
+}
+
+// Atlas regions: the region_width x region_height rectangle at (region_x,
+// region_y) of a larger source is drawn in place through the source's row
+// pitch, so sprites packed into one atlas never have to be copied out.
+// Returns NULL when the rectangle is not inside the source.
+static uint8_t* region_pixels(uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                              uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height) {
+    if (src_image == NULL ||
+        (uint64_t)region_x + region_width > src_width || (uint64_t)region_y + region_height > src_height) {
+        return NULL;
+    }
+    return src_image + (size_t)region_y * src_stride + (size_t)region_x * 4;
+}
+
+int blit_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height,
+                int32_t start_x, int32_t start_y) {
+    uint8_t* pixels = region_pixels(src_image, src_width, src_height, src_stride,
+                                    region_x, region_y, region_width, region_height);
+    if (pixels == NULL) return -1;
+    blit_with(copy_row, 0, dest_image, dest_width, dest_height, dest_stride,
+              pixels, region_width, region_height, src_stride, start_x, start_y);
+    return 0;
+}
+
+int blend_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                 uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                 uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height,
+                 int32_t start_x, int32_t start_y) {
+    uint8_t* pixels = region_pixels(src_image, src_width, src_height, src_stride,
+                                    region_x, region_y, region_width, region_height);
+    if (pixels == NULL) return -1;
+    blend_with(blend_row, 0, dest_image, dest_width, dest_height, dest_stride,
+               pixels, region_width, region_height, src_stride, start_x, start_y);
+    return 0;
+}
+
+// Pixel format conversion. Every format converts to and from RGBA with one
+// row kernel per tier; a pair that does not involve RGBA goes through RGBA in
+// FORMAT_CHUNK pixel pieces that stay in L1. A8 imports as white with that
+// alpha, so glyph coverage masks can be blended directly.
+#define FORMAT_CHUNK 256
+
+static const uint32_t format_bytes[PIXEL_FORMAT_COUNT] = {4, 4, 4, 3, 1};
+
+static void swap_rb_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++, src += 4, dst += 4) {
+        uint8_t r = src[0], g = src[1], b = src[2], a = src[3];
+        dst[0] = b;
+        dst[1] = g;
+        dst[2] = r;
+        dst[3] = a;
+    }
+}
+
+static void rgba_to_argb_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++, src += 4, dst += 4) {
+        uint8_t r = src[0], g = src[1], b = src[2], a = src[3];
+        dst[0] = a;
+        dst[1] = r;
+        dst[2] = g;
+        dst[3] = b;
+    }
+}
+
+static void argb_to_rgba_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++, src += 4, dst += 4) {
+        uint8_t a = src[0], r = src[1], g = src[2], b = src[3];
+        dst[0] = r;
+        dst[1] = g;
+        dst[2] = b;
+        dst[3] = a;
+    }
+}
+
+static void rgb_to_rgba_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++, src += 3, dst += 4) {
+        dst[0] = src[0];
+        dst[1] = src[1];
+        dst[2] = src[2];
+        dst[3] = 255;
+    }
+}
+
+static void rgba_to_rgb_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++, src += 4, dst += 3) {
+        dst[0] = src[0];
+        dst[1] = src[1];
+        dst[2] = src[2];
+    }
+}
+
+static void a8_to_rgba_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++, dst += 4) {
+        dst[0] = 255;
+        dst[1] = 255;
+        dst[2] = 255;
+        dst[3] = src[i];
+    }
+}
+
+static void rgba_to_a8_row(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++) {
+        dst[i] = src[i * 4 + 3];
+    }
+}
+
+#if HAS_AVX2
+// 4-byte formats differ only in channel order, so one pshufb per 8 pixels.
+TARGET_AVX2
+static inline void shuffle_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count, __m256i order, row_fn tail) {
+    uint32_t x = 0;
+    for (; x + 8 <= count; x += 8) {
+        __m256i v = _mm256_loadu_si256((const __m256i*)(src + x * 4));
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), _mm256_shuffle_epi8(v, order));
+    }
+    tail(dst + x * 4, src + x * 4, count - x);
+}
+
+TARGET_AVX2
+static void swap_rb_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    shuffle_row_avx2(dst, src, count, _mm256_setr_epi8(2, 1, 0, 3, 6, 5, 4, 7, 10, 9, 8, 11, 14, 13, 12, 15,
+                                                       2, 1, 0, 3, 6, 5, 4, 7, 10, 9, 8, 11, 14, 13, 12, 15),
+                     swap_rb_row);
+}
+
+TARGET_AVX2
+static void rgba_to_argb_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    shuffle_row_avx2(dst, src, count, _mm256_setr_epi8(3, 0, 1, 2, 7, 4, 5, 6, 11, 8, 9, 10, 15, 12, 13, 14,
+                                                       3, 0, 1, 2, 7, 4, 5, 6, 11, 8, 9, 10, 15, 12, 13, 14),
+                     rgba_to_argb_row);
+}
+
+TARGET_AVX2
+static void argb_to_rgba_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    shuffle_row_avx2(dst, src, count, _mm256_setr_epi8(1, 2, 3, 0, 5, 6, 7, 4, 9, 10, 11, 8, 13, 14, 15, 12,
+                                                       1, 2, 3, 0, 5, 6, 7, 4, 9, 10, 11, 8, 13, 14, 15, 12),
+                     argb_to_rgba_row);
+}
+
+// RGB24 moves 4 pixels (12 bytes) per 128-bit lane. The 16-byte loads and
+// stores run 4 bytes past the 8 pixels, so the loops stop 2 pixels early.
+TARGET_AVX2
+static void rgb_to_rgba_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const __m256i order = _mm256_setr_epi8(0, 1, 2, -1, 3, 4, 5, -1, 6, 7, 8, -1, 9, 10, 11, -1,
+                                           0, 1, 2, -1, 3, 4, 5, -1, 6, 7, 8, -1, 9, 10, 11, -1);
+    const __m256i alpha = _mm256_set1_epi32((int32_t)0xff000000);
+    uint32_t x = 0;
+
+    for (; x + 10 <= count; x += 8) {
+        __m128i lo = _mm_loadu_si128((const __m128i*)(src + x * 3));
+        __m128i hi = _mm_loadu_si128((const __m128i*)(src + x * 3 + 12));
+        __m256i v = _mm256_inserti128_si256(_mm256_castsi128_si256(lo), hi, 1);
+        v = _mm256_or_si256(_mm256_shuffle_epi8(v, order), alpha);
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), v);
+    }
+    rgb_to_rgba_row(dst + x * 4, src + x * 3, count - x);
+}
+
+TARGET_AVX2
+static void rgba_to_rgb_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const __m256i order = _mm256_setr_epi8(0, 1, 2, 4, 5, 6, 8, 9, 10, 12, 13, 14, -1, -1, -1, -1,
+                                           0, 1, 2, 4, 5, 6, 8, 9, 10, 12, 13, 14, -1, -1, -1, -1);
+    uint32_t x = 0;
+
+    for (; x + 10 <= count; x += 8) {
+        __m256i v = _mm256_shuffle_epi8(_mm256_loadu_si256((const __m256i*)(src + x * 4)), order);
+        _mm_storeu_si128((__m128i*)(dst + x * 3), _mm256_castsi256_si128(v));
+        _mm_storeu_si128((__m128i*)(dst + x * 3 + 12), _mm256_extracti128_si256(v, 1));
+    }
+    rgba_to_rgb_row(dst + x * 3, src + x * 4, count - x);
+}
+
+TARGET_AVX2
+static void a8_to_rgba_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const __m256i white = _mm256_set1_epi32(0x00ffffff);
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m256i a = _mm256_cvtepu8_epi32(_mm_loadl_epi64((const __m128i*)(src + x)));
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), _mm256_or_si256(_mm256_slli_epi32(a, 24), white));
+    }
+    a8_to_rgba_row(dst + x * 4, src + x, count - x);
+}
+
+// 32 pixels per step: the alphas are shifted down and packed 32 -> 16 -> 8
+// bits, which interleaves the 128-bit lanes; one permute restores the order.
+TARGET_AVX2
+static void rgba_to_a8_row_avx2(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const __m256i order = _mm256_setr_epi32(0, 4, 1, 5, 2, 6, 3, 7);
+    uint32_t x = 0;
+
+    for (; x + 32 <= count; x += 32) {
+        const __m256i* p = (const __m256i*)(src + x * 4);
+        __m256i a0 = _mm256_srli_epi32(_mm256_loadu_si256(p), 24);
+        __m256i a1 = _mm256_srli_epi32(_mm256_loadu_si256(p + 1), 24);
+        __m256i a2 = _mm256_srli_epi32(_mm256_loadu_si256(p + 2), 24);
+        __m256i a3 = _mm256_srli_epi32(_mm256_loadu_si256(p + 3), 24);
+        __m256i packed = _mm256_packus_epi16(_mm256_packus_epi32(a0, a1), _mm256_packus_epi32(a2, a3));
+        _mm256_storeu_si256((__m256i*)(dst + x), _mm256_permutevar8x32_epi32(packed, order));
+    }
+    rgba_to_a8_row(dst + x, src + x * 4, count - x);
+}
+#endif
+
+#if HAS_NEON
+// vld3/vld4 de-interleave 16 pixels into one register per channel, so every
+// conversion is a re-interleaving store.
+static void swap_rb_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 16 <= count; x += 16) {
+        uint8x16x4_t v = vld4q_u8(src + x * 4);
+        uint8x16_t r = v.val[0];
+        v.val[0] = v.val[2];
+        v.val[2] = r;
+        vst4q_u8(dst + x * 4, v);
+    }
+    swap_rb_row(dst + x * 4, src + x * 4, count - x);
+}
+
+static void rgba_to_argb_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 16 <= count; x += 16) {
+        uint8x16x4_t v = vld4q_u8(src + x * 4);
+        uint8x16x4_t out = {{v.val[3], v.val[0], v.val[1], v.val[2]}};
+        vst4q_u8(dst + x * 4, out);
+    }
+    rgba_to_argb_row(dst + x * 4, src + x * 4, count - x);
+}
+
+static void argb_to_rgba_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 16 <= count; x += 16) {
+        uint8x16x4_t v = vld4q_u8(src + x * 4);
+        uint8x16x4_t out = {{v.val[1], v.val[2], v.val[3], v.val[0]}};
+        vst4q_u8(dst + x * 4, out);
+    }
+    argb_to_rgba_row(dst + x * 4, src + x * 4, count - x);
+}
+
+static void rgb_to_rgba_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 16 <= count; x += 16) {
+        uint8x16x3_t v = vld3q_u8(src + x * 3);
+        uint8x16x4_t out = {{v.val[0], v.val[1], v.val[2], vdupq_n_u8(255)}};
+        vst4q_u8(dst + x * 4, out);
+    }
+    rgb_to_rgba_row(dst + x * 4, src + x * 3, count - x);
+}
+
+static void rgba_to_rgb_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 16 <= count; x += 16) {
+        uint8x16x4_t v = vld4q_u8(src + x * 4);
+        uint8x16x3_t out = {{v.val[0], v.val[1], v.val[2]}};
+        vst3q_u8(dst + x * 3, out);
+    }
+    rgba_to_rgb_row(dst + x * 3, src + x * 4, count - x);
+}
+
+static void a8_to_rgba_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    const uint8x16_t white = vdupq_n_u8(255);
+    uint32_t x = 0;
+    for (; x + 16 <= count; x += 16) {
+        uint8x16x4_t out = {{white, white, white, vld1q_u8(src + x)}};
+        vst4q_u8(dst + x * 4, out);
+    }
+    a8_to_rgba_row(dst + x * 4, src + x, count - x);
+}
+
+static void rgba_to_a8_row_neon(uint8_t* dst, const uint8_t* src, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 16 <= count; x += 16) {
+        vst1q_u8(dst + x, vld4q_u8(src + x * 4).val[3]);
+    }
+    rgba_to_a8_row(dst + x, src + x * 4, count - x);
+}
+#endif
+
+// Indexed by PIXEL_FORMAT_*; the RGBA entries are the tier's plain copy.
+typedef struct {
+    row_fn to_rgba[PIXEL_FORMAT_COUNT];
+    row_fn from_rgba[PIXEL_FORMAT_COUNT];
+} format_kernels;
+
+static const format_kernels scalar_formats = {
+    {copy_row, swap_rb_row, argb_to_rgba_row, rgb_to_rgba_row, a8_to_rgba_row},
+    {copy_row, swap_rb_row, rgba_to_argb_row, rgba_to_rgb_row, rgba_to_a8_row},
+};
+
+#if HAS_AVX2
+static const format_kernels avx2_formats = {
+    {copy_row_avx2, swap_rb_row_avx2, argb_to_rgba_row_avx2, rgb_to_rgba_row_avx2, a8_to_rgba_row_avx2},
+    {copy_row_avx2, swap_rb_row_avx2, rgba_to_argb_row_avx2, rgba_to_rgb_row_avx2, rgba_to_a8_row_avx2},
+};
+#endif
+
+#if HAS_NEON
+static const format_kernels neon_formats = {
+    {copy_row_neon, swap_rb_row_neon, argb_to_rgba_row_neon, rgb_to_rgba_row_neon, a8_to_rgba_row_neon},
+    {copy_row_neon, swap_rb_row_neon, rgba_to_argb_row_neon, rgba_to_rgb_row_neon, rgba_to_a8_row_neon},
+};
+#endif
+
+typedef struct {
+    row_fn to_rgba;
+    row_fn from_rgba;
+    const uint8_t* src;
+    uint8_t* dst;
+    size_t src_stride;
+    size_t dst_stride;
+    uint32_t src_bytes;
+    uint32_t dst_bytes;
+    uint32_t width;
+} format_op;
+
+static void format_rows(void* ctx, uint32_t y0, uint32_t y1) {
+    const format_op* op = (const format_op*)ctx;
+
+    for (uint32_t y = y0; y < y1; y++) {
+        const uint8_t* src = op->src + y * op->src_stride;
+        uint8_t* dst = op->dst + y * op->dst_stride;
+
+        if (!op->to_rgba) {
+            op->from_rgba(dst, src, op->width);
+        } else if (!op->from_rgba) {
+            op->to_rgba(dst, src, op->width);
+        } else {
+            uint32_t chunk[FORMAT_CHUNK];
+            for (uint32_t x = 0; x < op->width; x += FORMAT_CHUNK) {
+                uint32_t count = op->width - x < FORMAT_CHUNK ? op->width - x : FORMAT_CHUNK;
+                op->to_rgba((uint8_t*)chunk, src + (size_t)x * op->src_bytes, count);
+                op->from_rgba(dst + (size_t)x * op->dst_bytes, (const uint8_t*)chunk, count);
+            }
+        }
+    }
+}
+
+// Returns -1 for an unknown format, a stride shorter than a row, or an
+// in-place conversion that changes the pixel size; 4-byte formats may be
+// converted in place (src == dst with the same stride). A stride of 0 means
+// packed rows.
+static int convert_pixels_with(const format_kernels* formats, int parallel,
+                               const uint8_t* src, uint32_t src_format, size_t src_stride,
+                               uint8_t* dst, uint32_t dst_format, size_t dst_stride,
+                               uint32_t width, uint32_t height) {
+    if (src_format >= PIXEL_FORMAT_COUNT || dst_format >= PIXEL_FORMAT_COUNT) {
+        return -1;
+    }
+    format_op op = {NULL, NULL, src, dst, src_stride, dst_stride,
+                    format_bytes[src_format], format_bytes[dst_format], width};
+    if (op.src_stride == 0) op.src_stride = (size_t)width * op.src_bytes;
+    if (op.dst_stride == 0) op.dst_stride = (size_t)width * op.dst_bytes;
+    if (op.src_stride < (size_t)width * op.src_bytes || op.dst_stride < (size_t)width * op.dst_bytes ||
+        (src == dst && op.src_bytes != op.dst_bytes)) {
+        return -1;
+    }
+    if (!src || !dst || width == 0 || height == 0) {
+        return 0;
+    }
+
+    if (src_format == PIXEL_FORMAT_RGBA) {
+        op.from_rgba = formats->from_rgba[dst_format];
+    } else if (dst_format == PIXEL_FORMAT_RGBA) {
+        op.to_rgba = formats->to_rgba[src_format];
+    } else {
+        op.to_rgba = formats->to_rgba[src_format];
+        op.from_rgba = formats->from_rgba[dst_format];
+    }
+
+    STATS_START();
+    if (parallel) {
+        parallel_rows(format_rows, &op, height, (uint64_t)width * height);
+    } else {
+        format_rows(&op, 0, height);
+    }
+    STATS_STOP(STAT_CONVERT_PIXELS, formats, (uint64_t)width * height,
+               (uint64_t)width * height * (op.src_bytes + op.dst_bytes));
+    return 0;
+}
+
+int convert_pixels(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format,
+                   uint32_t width, uint32_t height) {
+    return convert_pixels_with(&scalar_formats, 0, src, src_format, 0, dst, dst_format, 0, width, height);
+}
+
+int convert_pixels_avx2(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format,
+                        uint32_t width, uint32_t height) {
+    return convert_pixels_with(AVX2_OR(&avx2_formats, &scalar_formats), 0,
+                               src, src_format, 0, dst, dst_format, 0, width, height);
+}
+
+int convert_pixels_neon(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format,
+                        uint32_t width, uint32_t height) {
+    return convert_pixels_with(NEON_OR(&neon_formats, &scalar_formats), 0,
+                               src, src_format, 0, dst, dst_format, 0, width, height);
+}
+
+int convert_pixels_strided(const uint8_t* src, uint32_t src_format, size_t src_stride,
+                           uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height) {
+    return convert_pixels_with(&scalar_formats, 0, src, src_format, src_stride, dst, dst_format, dst_stride, width, height);
+}
+
+int convert_pixels_strided_avx2(const uint8_t* src, uint32_t src_format, size_t src_stride,
+                                uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height) {
+    return convert_pixels_with(AVX2_OR(&avx2_formats, &scalar_formats), 0,
+                               src, src_format, src_stride, dst, dst_format, dst_stride, width, height);
+}
+
+int convert_pixels_strided_neon(const uint8_t* src, uint32_t src_format, size_t src_stride,
+                                uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height) {
+    return convert_pixels_with(NEON_OR(&neon_formats, &scalar_formats), 0,
+                               src, src_format, src_stride, dst, dst_format, dst_stride, width, height);
+}
+
+// Resampling is separable: every axis uses a table with a fixed number of taps
+// per output pixel, holding the first source index and RESAMPLE_BITS
+// fixed-point weights that sum to exactly RESAMPLE_ONE. Nearest neighbor uses
+// one tap, so its table is just the source index of every output pixel.
+// Building a table costs a division per tap, so tables are cached by
+// (src size, dst size, filter) and shared between calls and threads.
+#define RESAMPLE_BITS 14
+#define RESAMPLE_ONE (1 << RESAMPLE_BITS)
+#define RESAMPLE_ROUND (1 << (RESAMPLE_BITS - 1))
+#define RESAMPLE_CACHE_SIZE 16
+#define RESAMPLE_BILINEAR 0
+#define RESAMPLE_AREA 1
+#define RESAMPLE_NEAREST 2
+
+typedef struct {
+    uint32_t src_size;
+    uint32_t dst_size;
+    uint32_t filter;
+    uint32_t taps;
+    uint32_t refs;
+    uint64_t last_used;
+    uint32_t* start;
+    int16_t* weights;
+} resample_table;
+
+static struct {
+    resample_table* entries[RESAMPLE_CACHE_SIZE];
+    uint64_t clock;
+} resample_cache;
+
+static resample_table* build_resample_table(uint32_t src_size, uint32_t dst_size, uint32_t filter) {
+    double scale = (double)src_size / dst_size;
+    // An output pixel covers scale source pixels and can straddle one more.
+    uint32_t taps = 2;
+    if (filter == RESAMPLE_AREA) {
+        taps = (src_size + dst_size - 1) / dst_size + 1;
+    } else if (filter == RESAMPLE_NEAREST) {
+        taps = 1;
+    }
+    if (taps > src_size) taps = src_size;
+
+    size_t weight_count = (size_t)dst_size * taps;
+    resample_table* table = malloc(sizeof(resample_table) + dst_size * sizeof(uint32_t) + weight_count * sizeof(int16_t));
+    double* row = malloc(taps * sizeof(double));
+    if (!table || !row) {
+        free(table);
+        free(row);
+        return NULL;
+    }
+
+    table->src_size = src_size;
+    table->dst_size = dst_size;
+    table->filter = filter;
+    table->taps = taps;
+    table->refs = 0;
+    table->last_used = 0;
+    table->start = (uint32_t*)(table + 1);
+    table->weights = (int16_t*)(table->start + dst_size);
+
+    for (uint32_t i = 0; i < dst_size; i++) {
+        uint32_t first;
+        uint32_t last;
+        double lo = 0.0;
+        double hi = 0.0;
+        double frac = 0.0;
+
+        if (filter == RESAMPLE_AREA) {
+            lo = (double)i * src_size / dst_size;
+            hi = (double)(i + 1) * src_size / dst_size;
+            first = (uint32_t)lo;
+            last = (uint32_t)hi;
+            if (last > first && (double)last == hi) last--;
+        } else if (filter == RESAMPLE_NEAREST) {
+            // 16.16 fixed point, so every variant maps columns identically.
+            uint64_t ratio = ((uint64_t)src_size << 16) / dst_size;
+            first = (uint32_t)((i * ratio) >> 16);
+            last = first;
+        } else {
+            double center = (i + 0.5) * scale - 0.5;
+            if (center < 0.0) center = 0.0;
+            if (center > src_size - 1) center = src_size - 1;
+            first = (uint32_t)center;
+            frac = center - first;
+            last = first + 1;
+        }
+        if (first > src_size - 1) first = src_size - 1;
+        if (last > src_size - 1) last = src_size - 1;
+
+        uint32_t start = first;
+        if (start > src_size - taps) start = src_size - taps;
+        if (last - start >= taps) last = start + taps - 1;
+        table->start[i] = start;
+
+        for (uint32_t k = 0; k < taps; k++) {
+            row[k] = 0.0;
+        }
+        for (uint32_t x = first; x <= last; x++) {
+            double w;
+            if (filter == RESAMPLE_AREA) {
+                double a = (x > lo) ? x : lo;
+                double b = (x + 1.0 < hi) ? x + 1.0 : hi;
+                w = (b - a) / scale;
+            } else {
+                w = (x == first) ? 1.0 - frac : frac;
+            }
+            row[x - start] += w;
+        }
+
+        // Round to fixed point, then give the rounding error to the largest
+        // weight so every output pixel is an exact weighted average.
+        int16_t* weights = table->weights + (size_t)i * taps;
+        int32_t sum = 0;
+        uint32_t largest = 0;
+        for (uint32_t k = 0; k < taps; k++) {
+            weights[k] = (int16_t)(row[k] * RESAMPLE_ONE + 0.5);
+            sum += weights[k];
+            if (weights[k] > weights[largest]) largest = k;
+        }
+        weights[largest] = (int16_t)(weights[largest] + RESAMPLE_ONE - sum);
+    }
+
+    free(row);
+    return table;
+}
+
+// Returns a referenced table for the given axis, building and caching it on a
+// miss. The least recently used table is evicted when the cache is full; it is
+// freed once the last caller releases it.
+static resample_table* acquire_resample_table(uint32_t src_size, uint32_t dst_size, uint32_t filter) {
+    resample_table* table = NULL;
+    resample_table* evicted = NULL;
+
+    lib_mutex_lock(&resample_lock);
+    for (int i = 0; i < RESAMPLE_CACHE_SIZE; i++) {
+        resample_table* entry = resample_cache.entries[i];
+        if (entry && entry->src_size == src_size && entry->dst_size == dst_size && entry->filter == filter) {
+            entry->refs++;
+            entry->last_used = ++resample_cache.clock;
+            table = entry;
+            break;
+        }
+    }
+    lib_mutex_unlock(&resample_lock);
+    if (table) {
+        return table;
+    }
+
+    table = build_resample_table(src_size, dst_size, filter);
+    if (!table) {
+        return NULL;
+    }
+
+    // The cache holds one reference and the caller another.
+    table->refs = 2;
+    lib_mutex_lock(&resample_lock);
+    table->last_used = ++resample_cache.clock;
+    int slot = 0;
+    for (int i = 0; i < RESAMPLE_CACHE_SIZE; i++) {
+        resample_table* entry = resample_cache.entries[i];
+        if (!entry) {
+            slot = i;
+            break;
+        }
+        if (entry->last_used < resample_cache.entries[slot]->last_used) {
+            slot = i;
+        }
+    }
+    evicted = resample_cache.entries[slot];
+    if (evicted && --evicted->refs != 0) {
+        evicted = NULL;
+    }
+    resample_cache.entries[slot] = table;
+    lib_mutex_unlock(&resample_lock);
+
+    free(evicted);
+    return table;
+}
+
+static void release_resample_table(resample_table* table) {
+    lib_mutex_lock(&resample_lock);
+    uint32_t refs = --table->refs;
+    lib_mutex_unlock(&resample_lock);
+    if (refs == 0) {
+        free(table);
+    }
+}
+
+void resample_cache_clear(void) {
+    resample_table* unused[RESAMPLE_CACHE_SIZE];
+    int count = 0;
+
+    lib_mutex_lock(&resample_lock);
+    for (int i = 0; i < RESAMPLE_CACHE_SIZE; i++) {
+        resample_table* entry = resample_cache.entries[i];
+        resample_cache.entries[i] = NULL;
+        if (entry && --entry->refs == 0) {
+            unused[count++] = entry;
+        }
+    }
+    lib_mutex_unlock(&resample_lock);
+
+    for (int i = 0; i < count; i++) {
+        free(unused[i]);
+    }
+}
+
+// Horizontal kernels filter one source row into table->dst_size pixels.
+// Vertical kernels combine taps rows, stride bytes apart, into one dst row of
+// bytes bytes.
+typedef void (*resample_h_fn)(uint8_t* dst, const uint8_t* src, const resample_table* table);
+typedef void (*resample_v_fn)(uint8_t* dst, const uint8_t* src, size_t stride,
+                              const int16_t* weights, uint32_t taps, uint32_t bytes);
+
+static inline void resample_pixel(uint8_t* dst, const uint8_t* src, const resample_table* table, uint32_t i) {
+    const uint8_t* s = src + (size_t)table->start[i] * 4;
+    const int16_t* w = table->weights + (size_t)i * table->taps;
+    int32_t r = RESAMPLE_ROUND, g = RESAMPLE_ROUND, b = RESAMPLE_ROUND, a = RESAMPLE_ROUND;
+
+    for (uint32_t k = 0; k < table->taps; k++) {
+        r += s[k * 4 + 0] * w[k];
+        g += s[k * 4 + 1] * w[k];
+        b += s[k * 4 + 2] * w[k];
+        a += s[k * 4 + 3] * w[k];
+    }
+
+    dst[i * 4 + 0] = (uint8_t)(r >> RESAMPLE_BITS);
+    dst[i * 4 + 1] = (uint8_t)(g >> RESAMPLE_BITS);
+    dst[i * 4 + 2] = (uint8_t)(b >> RESAMPLE_BITS);
+    dst[i * 4 + 3] = (uint8_t)(a >> RESAMPLE_BITS);
+}
+
+static void resample_h(uint8_t* dst, const uint8_t* src, const resample_table* table) {
+    for (uint32_t i = 0; i < table->dst_size; i++) {
+        resample_pixel(dst, src, table, i);
+    }
+}
+
+static void resample_v(uint8_t* dst, const uint8_t* src, size_t stride,
+                       const int16_t* weights, uint32_t taps, uint32_t bytes) {
+    for (uint32_t x = 0; x < bytes; x++) {
+        int32_t sum = RESAMPLE_ROUND;
+        for (uint32_t k = 0; k < taps; k++) {
+            sum += src[k * stride + x] * weights[k];
+        }
+        dst[x] = (uint8_t)(sum >> RESAMPLE_BITS);
+    }
+}
+
+#if HAS_AVX2
+// Two output pixels per register, one per 128-bit lane. Each step loads two
+// adjacent source pixels, interleaves their channels into 16-bit pairs and
+// multiplies them by the matching weight pair with madd.
+TARGET_AVX2
+static void resample_h_avx2(uint8_t* dst, const uint8_t* src, const resample_table* table) {
+    const __m256i pairs = _mm256_setr_epi8(0, -1, 4, -1, 1, -1, 5, -1, 2, -1, 6, -1, 3, -1, 7, -1,
+                                           0, -1, 4, -1, 1, -1, 5, -1, 2, -1, 6, -1, 3, -1, 7, -1);
+    const uint32_t taps = table->taps;
+    uint32_t i = 0;
+
+    for (; i + 1 < table->dst_size; i += 2) {
+        const uint8_t* s0 = src + (size_t)table->start[i] * 4;
+        const uint8_t* s1 = src + (size_t)table->start[i + 1] * 4;
+        const uint16_t* w0 = (const uint16_t*)table->weights + (size_t)i * taps;
+        const uint16_t* w1 = w0 + taps;
+        __m256i sum = _mm256_set1_epi32(RESAMPLE_ROUND);
+
+        uint32_t k = 0;
+        for (; k + 1 < taps; k += 2) {
+            __m256i pixels = _mm256_inserti128_si256(
+                _mm256_castsi128_si256(_mm_loadl_epi64((const __m128i*)(s0 + k * 4))),
+                _mm_loadl_epi64((const __m128i*)(s1 + k * 4)), 1);
+            __m256i weights = _mm256_inserti128_si256(
+                _mm256_castsi128_si256(_mm_set1_epi32((int32_t)(w0[k] | ((uint32_t)w0[k + 1] << 16)))),
+                _mm_set1_epi32((int32_t)(w1[k] | ((uint32_t)w1[k + 1] << 16))), 1);
+            sum = _mm256_add_epi32(sum, _mm256_madd_epi16(_mm256_shuffle_epi8(pixels, pairs), weights));
+        }
+        if (k < taps) {
+            int32_t p0, p1;
+            memcpy(&p0, s0 + k * 4, 4);
+            memcpy(&p1, s1 + k * 4, 4);
+            __m256i pixels = _mm256_inserti128_si256(
+                _mm256_castsi128_si256(_mm_cvtsi32_si128(p0)), _mm_cvtsi32_si128(p1), 1);
+            __m256i weights = _mm256_inserti128_si256(
+                _mm256_castsi128_si256(_mm_set1_epi32(w0[k])), _mm_set1_epi32(w1[k]), 1);
+            sum = _mm256_add_epi32(sum, _mm256_madd_epi16(_mm256_shuffle_epi8(pixels, pairs), weights));
+        }
+
+        sum = _mm256_srai_epi32(sum, RESAMPLE_BITS);
+        sum = _mm256_packus_epi16(_mm256_packs_epi32(sum, sum), _mm256_setzero_si256());
+        int32_t out0 = _mm256_cvtsi256_si32(sum);
+        int32_t out1 = _mm256_extract_epi32(sum, 4);
+        memcpy(dst + (size_t)i * 4, &out0, 4);
+        memcpy(dst + (size_t)(i + 1) * 4, &out1, 4);
+    }
+
+    if (i < table->dst_size) {
+        resample_pixel(dst, src, table, i);
+    }
+}
+
+// 32 bytes per step. Bytes of two source rows are interleaved so madd applies
+// both rows' weights at once; all unpacks and packs stay within 128-bit lanes,
+// so the output comes back in source order.
+TARGET_AVX2
+static void resample_v_avx2(uint8_t* dst, const uint8_t* src, size_t stride,
+                            const int16_t* weights, uint32_t taps, uint32_t bytes) {
+    const __m256i zero = _mm256_setzero_si256();
+    const uint16_t* w = (const uint16_t*)weights;
+    uint32_t x = 0;
+
+    for (; x + 32 <= bytes; x += 32) {
+        __m256i s0 = _mm256_set1_epi32(RESAMPLE_ROUND);
+        __m256i s1 = s0, s2 = s0, s3 = s0;
+
+        for (uint32_t k = 0; k < taps; k += 2) {
+            __m256i a = _mm256_loadu_si256((const __m256i*)(src + k * stride + x));
+            __m256i b = zero;
+            uint32_t pair = w[k];
+            if (k + 1 < taps) {
+                b = _mm256_loadu_si256((const __m256i*)(src + (k + 1) * stride + x));
+                pair |= (uint32_t)w[k + 1] << 16;
+            }
+            __m256i mk = _mm256_set1_epi32((int32_t)pair);
+            __m256i lo = _mm256_unpacklo_epi8(a, b);
+            __m256i hi = _mm256_unpackhi_epi8(a, b);
+            s0 = _mm256_add_epi32(s0, _mm256_madd_epi16(_mm256_unpacklo_epi8(lo, zero), mk));
+            s1 = _mm256_add_epi32(s1, _mm256_madd_epi16(_mm256_unpackhi_epi8(lo, zero), mk));
+            s2 = _mm256_add_epi32(s2, _mm256_madd_epi16(_mm256_unpacklo_epi8(hi, zero), mk));
+            s3 = _mm256_add_epi32(s3, _mm256_madd_epi16(_mm256_unpackhi_epi8(hi, zero), mk));
+        }
+
+        s0 = _mm256_srai_epi32(s0, RESAMPLE_BITS);
+        s1 = _mm256_srai_epi32(s1, RESAMPLE_BITS);
+        s2 = _mm256_srai_epi32(s2, RESAMPLE_BITS);
+        s3 = _mm256_srai_epi32(s3, RESAMPLE_BITS);
+        __m256i out = _mm256_packus_epi16(_mm256_packs_epi32(s0, s1), _mm256_packs_epi32(s2, s3));
+        _mm256_storeu_si256((__m256i*)(dst + x), out);
+    }
+
+    if (x < bytes) {
+        resample_v(dst + x, src + x, stride, weights, taps, bytes - x);
+    }
+}
+#endif
+
+#if HAS_NEON
+static void resample_h_neon(uint8_t* dst, const uint8_t* src, const resample_table* table) {
+    const uint32_t taps = table->taps;
+
+    for (uint32_t i = 0; i < table->dst_size; i++) {
+        const uint8_t* s = src + (size_t)table->start[i] * 4;
+        const uint16_t* w = (const uint16_t*)table->weights + (size_t)i * taps;
+        uint32x4_t sum = vdupq_n_u32(RESAMPLE_ROUND);
+
+        for (uint32_t k = 0; k < taps; k++) {
+            uint32_t pixel;
+            memcpy(&pixel, s + k * 4, 4);
+            uint16x4_t channels = vget_low_u16(vmovl_u8(vcreate_u8(pixel)));
+            sum = vmlal_n_u16(sum, channels, w[k]);
+        }
+
+        uint16x4_t narrow = vshrn_n_u32(sum, RESAMPLE_BITS);
+        uint32_t out = vget_lane_u32(vreinterpret_u32_u8(vmovn_u16(vcombine_u16(narrow, narrow))), 0);
+        memcpy(dst + (size_t)i * 4, &out, 4);
+    }
+}
+
+static void resample_v_neon(uint8_t* dst, const uint8_t* src, size_t stride,
+                            const int16_t* weights, uint32_t taps, uint32_t bytes) {
+    const uint16_t* w = (const uint16_t*)weights;
+    uint32_t x = 0;
+
+    for (; x + 16 <= bytes; x += 16) {
+        uint32x4_t s0 = vdupq_n_u32(RESAMPLE_ROUND);
+        uint32x4_t s1 = s0, s2 = s0, s3 = s0;
+
+        for (uint32_t k = 0; k < taps; k++) {
+            uint8x16_t v = vld1q_u8(src + k * stride + x);
+            uint16x8_t lo = vmovl_u8(vget_low_u8(v));
+            uint16x8_t hi = vmovl_u8(vget_high_u8(v));
+            s0 = vmlal_n_u16(s0, vget_low_u16(lo), w[k]);
+            s1 = vmlal_n_u16(s1, vget_high_u16(lo), w[k]);
+            s2 = vmlal_n_u16(s2, vget_low_u16(hi), w[k]);
+            s3 = vmlal_n_u16(s3, vget_high_u16(hi), w[k]);
+        }
+
+        uint16x8_t lo = vcombine_u16(vshrn_n_u32(s0, RESAMPLE_BITS), vshrn_n_u32(s1, RESAMPLE_BITS));
+        uint16x8_t hi = vcombine_u16(vshrn_n_u32(s2, RESAMPLE_BITS), vshrn_n_u32(s3, RESAMPLE_BITS));
+        vst1q_u8(dst + x, vcombine_u8(vmovn_u16(lo), vmovn_u16(hi)));
+    }
+
+    if (x < bytes) {
+        resample_v(dst + x, src + x, stride, weights, taps, bytes - x);
+    }
+}
+#endif
+
+typedef struct {
+    resample_h_fn h;
+    resample_v_fn v;
+    const resample_table* x_table;
+    const resample_table* y_table;
+    const uint8_t* src;
+    uint8_t* dst;
+    uint8_t* tmp;
+    size_t src_stride;
+    size_t dst_stride;
+    size_t tmp_stride;
+    uint32_t first_row;
+    uint32_t row_bytes;
+} resample_op;
+
+static void resample_h_band(void* ctx, uint32_t y0, uint32_t y1) {
+    const resample_op* op = (const resample_op*)ctx;
+    for (uint32_t y = y0; y < y1; y++) {
+        op->h(op->tmp + y * op->tmp_stride, op->src + (size_t)(op->first_row + y) * op->src_stride, op->x_table);
+    }
+}
+
+static void resample_v_band(void* ctx, uint32_t y0, uint32_t y1) {
+    const resample_op* op = (const resample_op*)ctx;
+    const resample_table* t = op->y_table;
+    for (uint32_t y = y0; y < y1; y++) {
+        const uint8_t* rows = op->tmp + (size_t)(t->start[y] - op->first_row) * op->tmp_stride;
+        op->v(op->dst + y * op->dst_stride, rows, op->tmp_stride,
+              t->weights + (size_t)y * t->taps, t->taps, op->row_bytes);
+    }
+}
+
+// Only the source rows that some output row reads are filtered horizontally.
+// Returns -1 when the temporary image cannot be allocated.
+static int resample_tables(resample_h_fn h, resample_v_fn v, int parallel,
+                           const resample_table* x_table, const resample_table* y_table,
+                           const uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                           uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    resample_op op = {h, v, x_table, y_table, src, dst, NULL,
+                      src_stride, dst_stride, (size_t)dst_width * 4, 0, dst_width * 4};
+    uint32_t rows = src_height;
+    if (src_height != dst_height) {
+        op.first_row = y_table->start[0];
+        rows = y_table->start[dst_height - 1] + y_table->taps - op.first_row;
+    }
+
+    // Equal sizes on an axis make its pass an exact copy, so it is skipped.
+    if (src_width == dst_width && src_height == dst_height) {
+        for (uint32_t y = 0; y < src_height; y++) {
+            memcpy(dst + y * dst_stride, src + y * src_stride, op.row_bytes);
+        }
+        return 0;
+    }
+    if (src_width == dst_width) {
+        op.tmp = (uint8_t*)src + op.first_row * src_stride;
+        op.tmp_stride = src_stride;
+    } else if (src_height == dst_height) {
+        op.tmp = dst;
+        op.tmp_stride = dst_stride;
+    } else {
+        op.tmp = create_image_rgba(dst_width, rows);
+        if (!op.tmp) {
+            return -1;
+        }
+    }
+
+    if (src_width != dst_width) {
+        if (parallel) {
+            parallel_rows(resample_h_band, &op, rows, (uint64_t)dst_width * rows * x_table->taps);
+        } else {
+            resample_h_band(&op, 0, rows);
+        }
+    }
+
+    if (src_height != dst_height) {
+        if (parallel) {
+            parallel_rows(resample_v_band, &op, dst_height, (uint64_t)dst_width * dst_height * y_table->taps);
+        } else {
+            resample_v_band(&op, 0, dst_height);
+        }
+    }
+
+    if (src_width != dst_width && src_height != dst_height) {
+        free_image_rgba(op.tmp);
+    }
+    return 0;
+}
+
+// Returns 0, or -1 when a coefficient table or the temporary image cannot be
+// allocated.
+static int resample_with(resample_h_fn h, resample_v_fn v, int parallel, uint32_t filter,
+                         const uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                         uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    if (!src || !dst || src_width == 0 || src_height == 0 ||
+        dst_width == 0 || dst_height == 0) {
+        return 0;
+    }
+
+    STATS_START();
+    resample_table* x_table = acquire_resample_table(src_width, dst_width, filter);
+    resample_table* y_table = acquire_resample_table(src_height, dst_height, filter);
+    int result = -1;
+    if (x_table && y_table) {
+        result = resample_tables(h, v, parallel, x_table, y_table, src, src_width, src_height, src_stride,
+                                 dst, dst_width, dst_height, dst_stride);
+    }
+
+    if (x_table) release_resample_table(x_table);
+    if (y_table) release_resample_table(y_table);
+    STATS_STOP(filter == RESAMPLE_AREA ? STAT_AREA_RESIZE : STAT_BILINEAR_RESIZE, h, (uint64_t)dst_width * dst_height,
+               ((uint64_t)src_width * src_height + (uint64_t)dst_width * dst_height) * 4);
+    return result;
+}
+
+int bilinear_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                    uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(resample_h, resample_v, 0, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
+}
+
+int bilinear_resize_avx2(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                         uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(AVX2_OR(resample_h_avx2, resample_h), AVX2_OR(resample_v_avx2, resample_v), 0, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
+}
+
+int bilinear_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                         uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(NEON_OR(resample_h_neon, resample_h), NEON_OR(resample_v_neon, resample_v), 0, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
+}
+
+int bilinear_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                            uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(resample_h, resample_v, 0, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
+
+int bilinear_resize_strided_avx2(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                                 uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(AVX2_OR(resample_h_avx2, resample_h), AVX2_OR(resample_v_avx2, resample_v), 0, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
+
+int bilinear_resize_strided_neon(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                                 uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(NEON_OR(resample_h_neon, resample_h), NEON_OR(resample_v_neon, resample_v), 0, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
+
+int area_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(resample_h, resample_v, 0, RESAMPLE_AREA,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
+}
+
+int area_resize_avx2(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                     uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(AVX2_OR(resample_h_avx2, resample_h), AVX2_OR(resample_v_avx2, resample_v), 0, RESAMPLE_AREA,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
+}
+
+int area_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                     uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(NEON_OR(resample_h_neon, resample_h), NEON_OR(resample_v_neon, resample_v), 0, RESAMPLE_AREA,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
+}
+
+int area_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                        uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(resample_h, resample_v, 0, RESAMPLE_AREA,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
+
+int area_resize_strided_avx2(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                             uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(AVX2_OR(resample_h_avx2, resample_h), AVX2_OR(resample_v_avx2, resample_v), 0, RESAMPLE_AREA,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
+
+int area_resize_strided_neon(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                             uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(NEON_OR(resample_h_neon, resample_h), NEON_OR(resample_v_neon, resample_v), 0, RESAMPLE_AREA,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
+
+// Nearest neighbor kernels gather count pixels from a source row through a
+// table of column indices.
+typedef void (*gather_fn)(uint8_t* dst, const uint8_t* src, const uint32_t* index, uint32_t count);
+
+static void gather_row(uint8_t* dst, const uint8_t* src, const uint32_t* index, uint32_t count) {
+    uint32_t* out = (uint32_t*)dst;
+    const uint32_t* in = (const uint32_t*)src;
+    for (uint32_t x = 0; x < count; x++) {
+        out[x] = in[index[x]];
+    }
+}
+
+#if HAS_AVX2
+TARGET_AVX2
+static void gather_row_avx2(uint8_t* dst, const uint8_t* src, const uint32_t* index, uint32_t count) {
+    uint32_t x = 0;
+    for (; x + 8 <= count; x += 8) {
+        __m256i columns = _mm256_loadu_si256((const __m256i*)(index + x));
+        __m256i pixels = _mm256_i32gather_epi32((const int*)src, columns, 4);
+        _mm256_storeu_si256((__m256i*)(dst + x * 4), pixels);
+    }
+    gather_row(dst + x * 4, src, index + x, count - x);
+}
+#endif
+
+#if HAS_NEON
+static void gather_row_neon(uint8_t* dst, const uint8_t* src, const uint32_t* index, uint32_t count) {
+    const uint32_t* in = (const uint32_t*)src;
+    uint32_t x = 0;
+    for (; x + 4 <= count; x += 4) {
+        uint32x4_t pixels = vdupq_n_u32(in[index[x]]);
+        pixels = vsetq_lane_u32(in[index[x + 1]], pixels, 1);
+        pixels = vsetq_lane_u32(in[index[x + 2]], pixels, 2);
+        pixels = vsetq_lane_u32(in[index[x + 3]], pixels, 3);
+        vst1q_u32((uint32_t*)(dst + x * 4), pixels);
+    }
+    gather_row(dst + x * 4, src, index + x, count - x);
+}
+#endif
+
+// Scaled blits and blends resample a src_width x src_height image to
+// width x height and draw it at (x, y), clipped to the destination, without
+// an intermediate image. A full-frame resize is a scaled blit at (0, 0).
+#define SCALE_CHUNK 256
+
+typedef struct {
+    gather_fn gather;
+    row_fn blend_row;
+    const resample_table* x_table;
+    const resample_table* y_table;
+    const uint8_t* src;
+    size_t src_stride;
+    uint8_t* dst;
+    size_t dst_stride;
+    uint32_t col0;
+    uint32_t row0;
+    uint32_t width;
+} scale_op;
+
+static void scale_rows(void* ctx, uint32_t y0, uint32_t y1) {
+    const scale_op* op = (const scale_op*)ctx;
+    const uint32_t* index = op->x_table->start + op->col0;
+    const uint32_t* rows = op->y_table->start + op->row0;
+
+    for (uint32_t y = y0; y < y1; y++) {
+        uint8_t* dst_row = op->dst + y * op->dst_stride;
+        const uint8_t* src_row = op->src + rows[y] * op->src_stride;
+
+        if (op->blend_row) {
+            uint32_t chunk[SCALE_CHUNK];
+            for (uint32_t x = 0; x < op->width; x += SCALE_CHUNK) {
+                uint32_t count = op->width - x < SCALE_CHUNK ? op->width - x : SCALE_CHUNK;
+                op->gather((uint8_t*)chunk, src_row, index + x, count);
+                op->blend_row(dst_row + x * 4, (const uint8_t*)chunk, count);
+            }
+        } else if (y > y0 && rows[y] == rows[y - 1]) {
+            // Upscaling repeats source rows; copying the previous output row is cheaper.
+            memcpy(dst_row, dst_row - op->dst_stride, (size_t)op->width * 4);
+        } else {
+            op->gather(dst_row, src_row, index, op->width);
+        }
+    }
+}
+
+// stat_op is the family the call is counted under. Returns -1 when the index
+// tables cannot be allocated.
+static int scale_with(uint32_t stat_op, gather_fn gather, row_fn blend_row, int parallel,
+                      uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                      const uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                      int32_t x, int32_t y, uint32_t width, uint32_t height) {
+    if (!dest || !src || src_width == 0 || src_height == 0 || width == 0 || height == 0) {
+        return 0;
+    }
+
+    int64_t x0 = x > 0 ? x : 0;
+    int64_t y0 = y > 0 ? y : 0;
+    int64_t x1 = (int64_t)x + width < dest_width ? (int64_t)x + width : dest_width;
+    int64_t y1 = (int64_t)y + height < dest_height ? (int64_t)y + height : dest_height;
+    if (x0 >= x1 || y0 >= y1) {
+        return 0;
+    }
+
+    STATS_START();
+    uint64_t pixels = (uint64_t)(x1 - x0) * (uint64_t)(y1 - y0);
+    resample_table* x_table = acquire_resample_table(src_width, width, RESAMPLE_NEAREST);
+    resample_table* y_table = acquire_resample_table(src_height, height, RESAMPLE_NEAREST);
+    int result = -1;
+    if (x_table && y_table) {
+        scale_op op = {gather, blend_row, x_table, y_table, src, src_stride,
+                       dest + (size_t)y0 * dest_stride + (size_t)x0 * 4, dest_stride,
+                       (uint32_t)(x0 - x), (uint32_t)(y0 - y), (uint32_t)(x1 - x0)};
+        uint32_t rows = (uint32_t)(y1 - y0);
+        if (parallel) {
+            parallel_rows(scale_rows, &op, rows, (uint64_t)op.width * rows);
+        } else {
+            scale_rows(&op, 0, rows);
+        }
+        result = 0;
+    }
+
+    if (x_table) release_resample_table(x_table);
+    if (y_table) release_resample_table(y_table);
+    STATS_STOP(stat_op, gather, pixels, pixels * (blend_row ? 12 : 8));
+    return result;
+}
+
+int nearest_neighbor_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                            uint32_t dst_width, uint32_t dst_height) {
+    return scale_with(STAT_NEAREST_RESIZE, gather_row, NULL, 0, dst, dst_width, dst_height, (size_t)dst_width * 4,
+                      src, src_width, src_height, (size_t)src_width * 4, 0, 0, dst_width, dst_height);
+}
+
+int nearest_neighbor_resize_avx2(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                                 uint32_t dst_width, uint32_t dst_height) {
+    return scale_with(STAT_NEAREST_RESIZE, AVX2_OR(gather_row_avx2, gather_row), NULL, 0, dst, dst_width, dst_height, (size_t)dst_width * 4,
+                      src, src_width, src_height, (size_t)src_width * 4, 0, 0, dst_width, dst_height);
+}
+
+int nearest_neighbor_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                                 uint32_t dst_width, uint32_t dst_height) {
+    return scale_with(STAT_NEAREST_RESIZE, NEON_OR(gather_row_neon, gather_row), NULL, 0, dst, dst_width, dst_height, (size_t)dst_width * 4,
+                      src, src_width, src_height, (size_t)src_width * 4, 0, 0, dst_width, dst_height);
+}
+
+int nearest_neighbor_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                                    uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return scale_with(STAT_NEAREST_RESIZE, gather_row, NULL, 0, dst, dst_width, dst_height, dst_stride,
+                      src, src_width, src_height, src_stride, 0, 0, dst_width, dst_height);
+}
+
+int nearest_neighbor_resize_strided_avx2(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                                         uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return scale_with(STAT_NEAREST_RESIZE, AVX2_OR(gather_row_avx2, gather_row), NULL, 0, dst, dst_width, dst_height, dst_stride,
+                      src, src_width, src_height, src_stride, 0, 0, dst_width, dst_height);
+}
+
+int nearest_neighbor_resize_strided_neon(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                                         uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return scale_with(STAT_NEAREST_RESIZE, NEON_OR(gather_row_neon, gather_row), NULL, 0, dst, dst_width, dst_height, dst_stride,
+                      src, src_width, src_height, src_stride, 0, 0, dst_width, dst_height);
+}
+
+int scaled_blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+                uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+                int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLIT, gather_row, NULL, 0, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+                      src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y, width, height);
+}
+
+int scaled_blit_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+                     uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+                     int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLIT, AVX2_OR(gather_row_avx2, gather_row), NULL, 0, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+                      src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y, width, height);
+}
+
+int scaled_blit_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+                     uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+                     int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLIT, NEON_OR(gather_row_neon, gather_row), NULL, 0, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+                      src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y, width, height);
+}
+
+int scaled_blend(uint8_t* background, uint32_t bg_width, uint32_t bg_height,
+                 uint8_t* overlay, uint32_t ov_width, uint32_t ov_height,
+                 int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLEND, gather_row, blend_row, 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+                      overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y, width, height);
+}
+
+int scaled_blend_avx2(uint8_t* background, uint32_t bg_width, uint32_t bg_height,
+                      uint8_t* overlay, uint32_t ov_width, uint32_t ov_height,
+                      int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLEND, AVX2_OR(gather_row_avx2, gather_row), AVX2_OR(blend_row_avx2, blend_row), 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+                      overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y, width, height);
+}
+
+int scaled_blend_neon(uint8_t* background, uint32_t bg_width, uint32_t bg_height,
+                      uint8_t* overlay, uint32_t ov_width, uint32_t ov_height,
+                      int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLEND, NEON_OR(gather_row_neon, gather_row), NEON_OR(blend_row_neon, blend_row), 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+                      overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y, width, height);
+}
+
+// Alpha analysis: one pass over an image records whether every pixel is
+// opaque, whether every pixel is transparent, and the tight bounding box of
+// the pixels with non-zero alpha. blend_analyzed() uses that to turn a blend
+// into a no-op, a plain copy, or a blend of just the visible box.
+#if defined(_MSC_VER)
+static inline uint32_t lowest_bit64(uint64_t v) {
+    unsigned long index;
+    _BitScanForward64(&index, v);
+    return (uint32_t)index;
+}
+
+static inline uint32_t highest_bit64(uint64_t v) {
+    unsigned long index;
+    _BitScanReverse64(&index, v);
+    return (uint32_t)index;
+}
+#else
+static inline uint32_t lowest_bit64(uint64_t v) {
+    return (uint32_t)__builtin_ctzll(v);
+}
+
+static inline uint32_t highest_bit64(uint64_t v) {
+    return 63 - (uint32_t)__builtin_clzll(v);
+}
+#endif
+
+// first is count when the row has no visible (non-zero alpha) pixel, and
+// nonzero_first is count when every byte of the row is zero. Premultiplied
+// pixels with zero alpha but non-zero color still add to the background, so
+// the premultiplied blends crop to the non-zero span instead.
+typedef struct {
+    uint32_t first;
+    uint32_t last;
+    uint32_t nonzero_first;
+    uint32_t nonzero_last;
+    int opaque;
+} alpha_span;
+
+typedef void (*alpha_row_fn)(const uint8_t* row, uint32_t count, alpha_span* span);
+
+static void alpha_row(const uint8_t* row, uint32_t count, alpha_span* span) {
+    uint32_t first = count;
+    uint32_t last = 0;
+    uint32_t nonzero_first = count;
+    uint32_t nonzero_last = 0;
+    int opaque = 1;
+
+    for (uint32_t x = 0; x < count; x++) {
+        const uint8_t* pixel = row + x * 4;
+        uint8_t a = pixel[3];
+        if (a != 0) {
+            if (first == count) first = x;
+            last = x;
+        }
+        if ((pixel[0] | pixel[1] | pixel[2] | a) != 0) {
+            if (nonzero_first == count) nonzero_first = x;
+            nonzero_last = x;
+        }
+        if (a != 255) opaque = 0;
+    }
+
+    span->first = first;
+    span->last = last;
+    span->nonzero_first = nonzero_first;
+    span->nonzero_last = nonzero_last;
+    span->opaque = opaque;
+}
+
+// Merges the span of the pixels from offset on into span.
+static void alpha_row_tail(const uint8_t* row, uint32_t offset, uint32_t count, alpha_span* span) {
+    alpha_span tail;
+    alpha_row(row + (size_t)offset * 4, count - offset, &tail);
+    if (tail.first < count - offset) {
+        if (span->first == count) span->first = offset + tail.first;
+        span->last = offset + tail.last;
+    }
+    if (tail.nonzero_first < count - offset) {
+        if (span->nonzero_first == count) span->nonzero_first = offset + tail.nonzero_first;
+        span->nonzero_last = offset + tail.nonzero_last;
+    }
+    span->opaque &= tail.opaque;
+}
+
+#if HAS_AVX2
+// Compares the alpha bytes of 8 pixels against 0 and 255; movemask yields
+// four bits per pixel, so bit positions divided by 4 are pixel offsets.
+TARGET_AVX2
+static void alpha_row_avx2(const uint8_t* row, uint32_t count, alpha_span* span) {
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i alpha_mask = _mm256_set1_epi32((int32_t)0xFF000000);
+    alpha_span result = {count, 0, count, 0, 1};
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        __m256i pixels = _mm256_loadu_si256((const __m256i*)(row + x * 4));
+        __m256i alpha = _mm256_and_si256(pixels, alpha_mask);
+        uint32_t visible = ~(uint32_t)_mm256_movemask_epi8(_mm256_cmpeq_epi32(alpha, zero));
+        uint32_t nonzero = ~(uint32_t)_mm256_movemask_epi8(_mm256_cmpeq_epi32(pixels, zero));
+        if ((uint32_t)_mm256_movemask_epi8(_mm256_cmpeq_epi32(alpha, alpha_mask)) != 0xFFFFFFFFu) {
+            result.opaque = 0;
+        }
+        if (visible) {
+            if (result.first == count) result.first = x + lowest_bit64(visible) / 4;
+            result.last = x + highest_bit64(visible) / 4;
+        }
+        if (nonzero) {
+            if (result.nonzero_first == count) result.nonzero_first = x + lowest_bit64(nonzero) / 4;
+            result.nonzero_last = x + highest_bit64(nonzero) / 4;
+        }
+    }
+
+    alpha_row_tail(row, x, count, &result);
+    *span = result;
+}
+#endif
+
+#if HAS_NEON
+// The eight deinterleaved alpha bytes are tested as one 64-bit lane.
+static void alpha_row_neon(const uint8_t* row, uint32_t count, alpha_span* span) {
+    alpha_span result = {count, 0, count, 0, 1};
+    uint32_t x = 0;
+
+    for (; x + 8 <= count; x += 8) {
+        uint8x8x4_t pixels = vld4_u8(row + x * 4);
+        uint8x8_t alpha = pixels.val[3];
+        uint8x8_t any = vorr_u8(vorr_u8(pixels.val[0], pixels.val[1]), vorr_u8(pixels.val[2], alpha));
+        uint64_t visible = vget_lane_u64(vreinterpret_u64_u8(vtst_u8(alpha, alpha)), 0);
+        uint64_t nonzero = vget_lane_u64(vreinterpret_u64_u8(vtst_u8(any, any)), 0);
+        if (vget_lane_u64(vreinterpret_u64_u8(alpha), 0) != UINT64_MAX) {
+            result.opaque = 0;
+        }
+        if (visible) {
+            if (result.first == count) result.first = x + lowest_bit64(visible) / 8;
+            result.last = x + highest_bit64(visible) / 8;
+        }
+        if (nonzero) {
+            if (result.nonzero_first == count) result.nonzero_first = x + lowest_bit64(nonzero) / 8;
+            result.nonzero_last = x + highest_bit64(nonzero) / 8;
+        }
+    }
+
+    alpha_row_tail(row, x, count, &result);
+    *span = result;
+}
+#endif
+
+static void analyze_alpha_with(alpha_row_fn row, const uint8_t* image_data, uint32_t width, uint32_t height,
+                               size_t stride, alpha_info* info) {
+    STATS_START();
+    uint32_t x0 = width, x1 = 0, y0 = height, y1 = 0;
+    uint32_t nx0 = width, nx1 = 0, ny0 = height, ny1 = 0;
+    int opaque = width != 0 && height != 0;
+
+    for (uint32_t y = 0; y < height && image_data != NULL; y++) {
+        alpha_span span;
+        row(image_data + y * stride, width, &span);
+        opaque &= span.opaque;
+        if (span.first < width) {
+            if (span.first < x0) x0 = span.first;
+            if (span.last > x1) x1 = span.last;
+            if (y0 == height) y0 = y;
+            y1 = y;
+        }
+        if (span.nonzero_first < width) {
+            if (span.nonzero_first < nx0) nx0 = span.nonzero_first;
+            if (span.nonzero_last > nx1) nx1 = span.nonzero_last;
+            if (ny0 == height) ny0 = y;
+            ny1 = y;
+        }
+    }
+
+    image_rect empty = {0, 0, 0, 0};
+    info->flags = opaque ? ALPHA_OPAQUE : 0;
+    info->bounds = empty;
+    info->nonzero_bounds = empty;
+    if (y0 == height) {
+        info->flags |= ALPHA_TRANSPARENT;
+    } else {
+        image_rect bounds = {(int32_t)x0, (int32_t)y0, x1 - x0 + 1, y1 - y0 + 1};
+        info->bounds = bounds;
     }
-    #endif
-    #endif
+    if (ny0 == height) {
+        info->flags |= ALPHA_CLEAR;
+    } else {
+        image_rect bounds = {(int32_t)nx0, (int32_t)ny0, nx1 - nx0 + 1, ny1 - ny0 + 1};
+        info->nonzero_bounds = bounds;
+    }
+    STATS_STOP(STAT_ANALYZE_ALPHA, row, (uint64_t)width * height, (uint64_t)width * height * 4);
+}
 
-    return image_data;
+void analyze_alpha(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info) {
+    analyze_alpha_with(alpha_row, image_data, width, height, (size_t)width * 4, info);
 }
 
-void free_image_rgba(uint8_t* image_data) {
-    #ifdef _WIN32
-    _aligned_free(image_data);
-    #else
-    free(image_data);
-    #endif
+void analyze_alpha_avx2(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info) {
+    analyze_alpha_with(AVX2_OR(alpha_row_avx2, alpha_row), image_data, width, height, (size_t)width * 4, info);
 }
 
-void fill_image_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
-    if (image_data == NULL) {
-        printf("Image data is NULL\n");
+void analyze_alpha_neon(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info) {
+    analyze_alpha_with(NEON_OR(alpha_row_neon, alpha_row), image_data, width, height, (size_t)width * 4, info);
+}
+
+// info must come from analyzing overlay since its last write; NULL or a box
+// that does not fit the overlay falls back to a full blend. Straight blends
+// skip and crop by alpha; premultiplied ones (premultiplied != 0) by the
+// non-zero pixels, since zero-alpha pixels with color are additive there.
+static void blend_analyzed_with(row_fn blend_row, row_fn copy_row, int parallel, int premultiplied,
+                                uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                                uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                                int32_t start_x, int32_t start_y, const alpha_info* info) {
+    const image_rect* box = info ? (premultiplied ? &info->nonzero_bounds : &info->bounds) : NULL;
+    uint32_t empty_flag = premultiplied ? ALPHA_CLEAR : ALPHA_TRANSPARENT;
+    if (!info || !background || !overlay ||
+        (!(info->flags & empty_flag) &&
+         (box->x < 0 || box->y < 0 || (uint64_t)box->x + box->width > ov_width ||
+          (uint64_t)box->y + box->height > ov_height))) {
+        blend_with(blend_row, parallel, background, bg_width, bg_height, bg_stride,
+                   overlay, ov_width, ov_height, ov_stride, start_x, start_y);
+        return;
+    }
+    STATS_START();
+    uint64_t pixels = 0;
+    if (info->flags & empty_flag) {
+        STATS_STOP(STAT_BLEND_ANALYZED, blend_row, pixels, pixels);
+        return;
+    }
+
+    int64_t x = (int64_t)start_x + box->x;
+    int64_t y = (int64_t)start_y + box->y;
+    if (x > INT32_MAX || y > INT32_MAX) {
+        STATS_STOP(STAT_BLEND_ANALYZED, blend_row, pixels, pixels);
         return;
     }
 
-    uint32_t total_pixels = width * height;
-    for (uint32_t i = 0; i < total_pixels; i++) {
-        image_data[i * 4] = r;
-        image_data[i * 4 + 1] = g;
-        image_data[i * 4 + 2] = b;
-        image_data[i * 4 + 3] = a;
+    rect_op op;
+    const uint8_t* visible = overlay + (size_t)box->y * ov_stride + (size_t)box->x * 4;
+    if (clip_rect(&op, background, bg_width, bg_height, bg_stride,
+                  visible, box->width, box->height, ov_stride, (int32_t)x, (int32_t)y)) {
+        op.row = (info->flags & ALPHA_OPAQUE) ? copy_row : blend_row;
+        run_rect(&op, parallel);
+        pixels = (uint64_t)op.width * op.height;
     }
+    STATS_STOP(STAT_BLEND_ANALYZED, blend_row, pixels, pixels * ((info->flags & ALPHA_OPAQUE) ? 8 : 12));
+}
+
+void blend_analyzed(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                    uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, const alpha_info* info) {
+    blend_analyzed_with(blend_row, copy_row, 0, 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+                        overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y, info);
+}
+
+// Frame differencing: each tier compares one row segment of two frames and
+// returns as soon as a differing 32-bit pixel is seen.
+typedef int (*diff_row_fn)(const uint8_t* a, const uint8_t* b, uint32_t count);
+
+static int diff_row(const uint8_t* a, const uint8_t* b, uint32_t count) {
+    return memcmp(a, b, (size_t)count * 4) != 0;
 }
 
 #if HAS_AVX2
-void fill_image_rgba_avx2(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
-    if (image_data == NULL) {
-        printf("Image data is NULL\n");
-        return;
+TARGET_AVX2
+static int diff_row_avx2(const uint8_t* a, const uint8_t* b, uint32_t count) {
+    uint32_t x = 0;
+
+    for (; x + 16 <= count; x += 16) {
+        __m256i d0 = _mm256_xor_si256(_mm256_loadu_si256((const __m256i*)(a + x * 4)),
+                                      _mm256_loadu_si256((const __m256i*)(b + x * 4)));
+        __m256i d1 = _mm256_xor_si256(_mm256_loadu_si256((const __m256i*)(a + x * 4 + 32)),
+                                      _mm256_loadu_si256((const __m256i*)(b + x * 4 + 32)));
+        __m256i d = _mm256_or_si256(d0, d1);
+        if (!_mm256_testz_si256(d, d)) return 1;
     }
 
-    uint32_t total_pixels = width * height;
-    uint32_t avx2_blocks = total_pixels / 8;
-    uint32_t remainder = total_pixels % 8;
+    return diff_row(a + (size_t)x * 4, b + (size_t)x * 4, count - x);
+}
+#endif
 
-    __m256i rgba = _mm256_set_epi8(a, b, g, r, a, b, g, r, a, b, g, r, a, b, g, r,
-                                   a, b, g, r, a, b, g, r, a, b, g, r, a, b, g, r);
+#if HAS_NEON
+static int diff_row_neon(const uint8_t* a, const uint8_t* b, uint32_t count) {
+    uint32_t x = 0;
 
-    for (uint32_t i = 0; i < avx2_blocks; i++) {
-        _mm256_storeu_si256((__m256i*)&image_data[i * 32], rgba);
+    for (; x + 8 <= count; x += 8) {
+        uint32x4_t d0 = veorq_u32(vld1q_u32((const uint32_t*)(a + x * 4)), vld1q_u32((const uint32_t*)(b + x * 4)));
+        uint32x4_t d1 = veorq_u32(vld1q_u32((const uint32_t*)(a + x * 4 + 16)),
+                                  vld1q_u32((const uint32_t*)(b + x * 4 + 16)));
+        uint64x2_t d = vreinterpretq_u64_u32(vorrq_u32(d0, d1));
+        if ((vgetq_lane_u64(d, 0) | vgetq_lane_u64(d, 1)) != 0) return 1;
     }
 
-    for (uint32_t i = avx2_blocks * 8; i < total_pixels; i++) {
-        image_data[i * 4]     = r;
-        image_data[i * 4 + 1] = g;
-        image_data[i * 4 + 2] = b;
-        image_data[i * 4 + 3] = a;
-    }
-}
-#else
-void fill_image_rgba_avx2(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
-    fill_image_rgba(image_data, width, height, r, g, b, a);
+    return diff_row(a + (size_t)x * 4, b + (size_t)x * 4, count - x);
 }
 #endif
 
-#if defined(__ARM_NEON)
-void fill_image_rgba_neon(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
-    if (image_data == NULL) {
-        printf("Image data is NULL\n");
-        return;
-    }
+typedef struct {
+    const char* name;
+    row_fn fill_row;
+    row_fn copy_row;
+    row_fn blend_row;
+    gather_fn gather_row;
+    resample_h_fn resample_h;
+    resample_v_fn resample_v;
+    row_fn premultiply_row;
+    row_fn unpremultiply_row;
+    row_fn blend_premultiplied_row;
+    alpha_row_fn alpha_row;
+    mask_row_fn blend_mask_row;
+    diff_row_fn diff_row;
+    row_fn multiply_row;
+    const format_kernels* formats;
+} kernel_table;
+
+// Scalar kernels are always safe, so the table is usable before init_dispatch() runs.
+#define SCALAR_KERNELS {"scalar", fill_row, copy_row, blend_row, gather_row, resample_h, resample_v, \
+                        premultiply_row, unpremultiply_row, blend_premultiplied_row, alpha_row, \
+                        blend_mask_row, diff_row, multiply_row, &scalar_formats}
+
+static kernel_table kernels = SCALAR_KERNELS;
+static uint32_t detected_features = 0;
+static int dispatch_ready = 0;
+
+static uint32_t detect_cpu_features(void) {
+    uint32_t features = 0;
 
-    uint32_t total_pixels = width * height;
-    uint32_t neon_blocks = total_pixels / 4;
-    uint32_t remainder = total_pixels % 4;
+#if HAS_AVX2
+    // AVX2 needs the CPU flag plus OS support for saving the YMM registers (XCR0 bits 1 and 2).
+    uint32_t eax, ebx, ecx, edx;
+#if defined(_MSC_VER)
+    int regs[4];
+    __cpuid(regs, 0);
+    uint32_t max_leaf = (uint32_t)regs[0];
+    __cpuid(regs, 1);
+    ecx = (uint32_t)regs[2];
+#else
+    uint32_t max_leaf = __get_cpuid_max(0, NULL);
+    __cpuid(1, eax, ebx, ecx, edx);
+#endif
 
-    uint32x4_t rgba = vdupq_n_u32((a << 24) | (b << 16) | (g << 8) | r);
+    int osxsave = (ecx >> 27) & 1;
+    int avx = (ecx >> 28) & 1;
 
-    for (uint32_t i = 0; i < neon_blocks; i++) {
-        vst1q_u32((uint32_t*)&image_data[i * 16], rgba);
+    if (max_leaf >= 7 && osxsave && avx) {
+#if defined(_MSC_VER)
+        uint64_t xcr0 = _xgetbv(0);
+        __cpuidex(regs, 7, 0);
+        ebx = (uint32_t)regs[1];
+#else
+        uint32_t xcr0_lo, xcr0_hi;
+        __asm__ volatile("xgetbv" : "=a"(xcr0_lo), "=d"(xcr0_hi) : "c"(0));
+        uint64_t xcr0 = ((uint64_t)xcr0_hi << 32) | xcr0_lo;
+        __cpuid_count(7, 0, eax, ebx, ecx, edx);
+#endif
+        if ((xcr0 & 0x6) == 0x6 && ((ebx >> 5) & 1)) {
+            features |= CPU_FEATURE_AVX2;
+        }
     }
+#endif
 
-    for (uint32_t i = neon_blocks * 4; i < total_pixels; i++) {
-        image_data[i * 4]     = r;
-        image_data[i * 4 + 1] = g;
-        image_data[i * 4 + 2] = b;
-        image_data[i * 4 + 3] = a;
-    }
-}
+#if HAS_NEON
+#if defined(__aarch64__) || defined(_M_ARM64) || !defined(__linux__)
+    // NEON is part of the AArch64 baseline.
+    features |= CPU_FEATURE_NEON;
 #else
-void fill_image_rgba_neon(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
-    fill_image_rgba(image_data, width, height, r, g, b, a);
-}
+    if (getauxval(AT_HWCAP) & HWCAP_NEON) {
+        features |= CPU_FEATURE_NEON;
+    }
+#endif
 #endif
 
-void blend(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
-            uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
-    if (background == NULL || overlay == NULL) {
-        printf("Background or overlay image is NULL\n");
+    return features;
+}
+
+void init_dispatch(void) {
+    if (dispatch_ready) {
         return;
     }
 
-    for (uint32_t y = 0; y < ov_height; y++) {
-        int bg_y = start_y + y;
-        if (bg_y < 0 || bg_y >= bg_height) {
-            continue;
-        }
+    detected_features = detect_cpu_features();
+    init_unpremultiply_recip();
 
-        uint32_t bg_index = (bg_y * bg_width + start_x) * 4;
-        uint32_t overlay_index = y * ov_width * 4;
+    // One thread per CPU, unless set_num_threads() already ran.
+    lib_mutex_lock(&workers.lock);
+    if (stats_load(&workers.num_threads) == 0) {
+        stats_store(&workers.num_threads, cpu_count());
+    }
+    lib_mutex_unlock(&workers.lock);
 
-        for (uint32_t x = 0; x < ov_width; x++) {
-            int bg_x = start_x + x;
-            if (bg_x < 0 || bg_x >= bg_width) {
-                continue;
-            }
+    if (detected_features & CPU_FEATURE_AVX2) {
+#if HAS_AVX2
+        kernel_table avx2_kernels = {"avx2", fill_row_avx2, copy_row_avx2, blend_row_avx2, gather_row_avx2,
+                                     resample_h_avx2, resample_v_avx2, premultiply_row_avx2,
+                                     unpremultiply_row_avx2, blend_premultiplied_row_avx2, alpha_row_avx2,
+                                     blend_mask_row_avx2, diff_row_avx2, multiply_row_avx2, &avx2_formats};
+        kernels = avx2_kernels;
+#endif
+    } else if (detected_features & CPU_FEATURE_NEON) {
+#if HAS_NEON
+        kernel_table neon_kernels = {"neon", fill_row_neon, copy_row_neon, blend_row_neon, gather_row_neon,
+                                     resample_h_neon, resample_v_neon, premultiply_row_neon,
+                                     unpremultiply_row_neon, blend_premultiplied_row_neon, alpha_row_neon,
+                                     blend_mask_row_neon, diff_row_neon, multiply_row_neon, &neon_formats};
+        kernels = neon_kernels;
+#endif
+    }
 
-            uint32_t bg_pixel_index = bg_index + x * 4;
-            uint32_t ov_pixel_index = overlay_index + x * 4;
+    dispatch_ready = 1;
+}
 
-            uint8_t r1 = background[bg_pixel_index];
-            uint8_t g1 = background[bg_pixel_index + 1];
-            uint8_t b1 = background[bg_pixel_index + 2];
-            uint8_t a1 = background[bg_pixel_index + 3];
+uint32_t cpu_features(void) {
+    init_dispatch();
+    return detected_features;
+}
 
-            uint8_t r2 = overlay[ov_pixel_index];
-            uint8_t g2 = overlay[ov_pixel_index + 1];
-            uint8_t b2 = overlay[ov_pixel_index + 2];
-            uint8_t a2 = overlay[ov_pixel_index + 3];
+const char* simd_tier(void) {
+    init_dispatch();
+    return kernels.name;
+}
 
-            if (a2 == 0) {
-                continue;
-            } else if (a2 == 255) {
-                background[bg_pixel_index] = r2;
-                background[bg_pixel_index + 1] = g2;
-                background[bg_pixel_index + 2] = b2;
-                background[bg_pixel_index + 3] = a2;
-            } else {
-                uint32_t inv_alpha = 255 - a2;
-                background[bg_pixel_index]     = (r2 * a2 + r1 * inv_alpha) / 255;
-                background[bg_pixel_index + 1] = (g2 * a2 + g1 * inv_alpha) / 255;
-                background[bg_pixel_index + 2] = (b2 * a2 + b1 * inv_alpha) / 255;
-                background[bg_pixel_index + 3] = a2 + (a1 * inv_alpha) / 255;
-            }
-        }
+#if PYCRGBA_STATS
+static const kernel_table scalar_kernels = SCALAR_KERNELS;
+
+// Returns the slot of a row kernel or format table in a kernel_table, or -1.
+// Slots follow the kernel_table field order.
+#define KERNEL_SLOTS 14
+#define SLOT_UNPREMULTIPLY 7
+#define SLOT_BLEND_PREMULTIPLIED 8
+
+static int kernel_slot(const kernel_table* table, const void* kernel) {
+    const void* slots[KERNEL_SLOTS] = {
+        (const void*)table->fill_row, (const void*)table->copy_row, (const void*)table->blend_row,
+        (const void*)table->gather_row, (const void*)table->resample_h, (const void*)table->resample_v,
+        (const void*)table->premultiply_row, (const void*)table->unpremultiply_row,
+        (const void*)table->blend_premultiplied_row, (const void*)table->alpha_row,
+        (const void*)table->blend_mask_row, (const void*)table->diff_row, (const void*)table->multiply_row,
+        (const void*)table->formats,
+    };
+    for (int i = 0; i < KERNEL_SLOTS; i++) {
+        if (slots[i] == kernel) return i;
     }
+    return -1;
 }
 
-#if HAS_AVX2
-void blend_avx2(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
-                uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
-    if (background == NULL || overlay == NULL) {
-        printf("Background or overlay image is NULL\n");
-        return;
-    }
+static void stats_record(uint32_t op, const void* kernel, uint64_t start, uint64_t pixels, uint64_t bytes) {
+    uint64_t elapsed = stats_clock() - start;
 
-    for (uint32_t y = 0; y < ov_height; y++) {
-        int bg_y = start_y + y;
-        if (bg_y < 0 || bg_y >= bg_height) {
-            continue;
-        }
+    // Kernels outside the scalar table (SIMD rows, the streaming copy) only run
+    // when init_dispatch() found their instruction set.
+    uint32_t tier = STATS_TIER_SCALAR;
+    int slot = kernel_slot(&scalar_kernels, kernel);
+    if (kernel != NULL && slot < 0) {
+        tier = (detected_features & CPU_FEATURE_AVX2) ? STATS_TIER_AVX2 : STATS_TIER_NEON;
+        slot = kernel_slot(&kernels, kernel);
+    }
 
-        uint32_t bg_index = (bg_y * bg_width + start_x) * 4;
-        uint32_t overlay_index = y * ov_width * 4;
+    // blend_with() and convert_with() each serve two families.
+    if (op == STAT_BLEND && slot == SLOT_BLEND_PREMULTIPLIED) op = STAT_BLEND_PREMULTIPLIED;
+    if (op == STAT_PREMULTIPLY && slot == SLOT_UNPREMULTIPLY) op = STAT_UNPREMULTIPLY;
+
+    kernel_stats* stats = &stat_table[op][tier];
+    stats_add(&stats->calls, 1);
+    stats_add(&stats->pixels, pixels);
+    stats_add(&stats->bytes, bytes);
+    stats_add(&stats->total_ns, elapsed);
+    uint64_t seen = stats_load(&stats->max_ns);
+    while (elapsed > seen && !stats_swap_max(&stats->max_ns, seen, elapsed)) {
+        seen = stats_load(&stats->max_ns);
+    }
+}
+#endif
 
-        for (uint32_t x = 0; x < ov_width - 7; x += 8) {
-            int bg_x = start_x + x;
-            if (bg_x < 0 || bg_x >= bg_width) {
-                bg_index += 32;
-                overlay_index += 32;
-                continue;
-            }
+void stats_enable(int enabled) {
+    stats_on = PYCRGBA_STATS && enabled;
+}
 
-            __m256i bg_pixels = _mm256_loadu_si256((__m256i*)&background[bg_index]);
-            __m256i ov_pixels = _mm256_loadu_si256((__m256i*)&overlay[overlay_index]);
+int stats_enabled(void) {
+    return stats_on;
+}
 
-            __m256i alpha = _mm256_and_si256(_mm256_srli_epi32(ov_pixels, 24), _mm256_set1_epi32(0xFF));
-            __m256i inv_alpha = _mm256_sub_epi32(_mm256_set1_epi32(255), alpha);
+uint32_t stats_op_count(void) {
+    return STAT_OPS;
+}
 
-            __m256i bg_r = _mm256_and_si256(bg_pixels, _mm256_set1_epi32(0xFF));
-            __m256i bg_g = _mm256_and_si256(_mm256_srli_epi32(bg_pixels, 8), _mm256_set1_epi32(0xFF));
-            __m256i bg_b = _mm256_and_si256(_mm256_srli_epi32(bg_pixels, 16), _mm256_set1_epi32(0xFF));
-            __m256i bg_a = _mm256_and_si256(_mm256_srli_epi32(bg_pixels, 24), _mm256_set1_epi32(0xFF));
+const char* stats_op_name(uint32_t op) {
+    return (op < STAT_OPS) ? stat_names[op] : NULL;
+}
 
-            __m256i ov_r = _mm256_and_si256(ov_pixels, _mm256_set1_epi32(0xFF));
-            __m256i ov_g = _mm256_and_si256(_mm256_srli_epi32(ov_pixels, 8), _mm256_set1_epi32(0xFF));
-            __m256i ov_b = _mm256_and_si256(_mm256_srli_epi32(ov_pixels, 16), _mm256_set1_epi32(0xFF));
+void stats_get(uint32_t op, uint32_t tier, kernel_stats* stats) {
+    kernel_stats empty = {0, 0, 0, 0, 0};
+    *stats = empty;
+    if (op >= STAT_OPS || tier >= STATS_TIERS) return;
+
+    kernel_stats* source = &stat_table[op][tier];
+    stats->calls = stats_load(&source->calls);
+    stats->pixels = stats_load(&source->pixels);
+    stats->bytes = stats_load(&source->bytes);
+    stats->total_ns = stats_load(&source->total_ns);
+    stats->max_ns = stats_load(&source->max_ns);
+}
 
-            __m256i r = _mm256_srli_epi32(_mm256_add_epi32(_mm256_mullo_epi32(ov_r, alpha), _mm256_mullo_epi32(bg_r, inv_alpha)), 8);
-            __m256i g = _mm256_srli_epi32(_mm256_add_epi32(_mm256_mullo_epi32(ov_g, alpha), _mm256_mullo_epi32(bg_g, inv_alpha)), 8);
-            __m256i b = _mm256_srli_epi32(_mm256_add_epi32(_mm256_mullo_epi32(ov_b, alpha), _mm256_mullo_epi32(bg_b, inv_alpha)), 8);
-            __m256i a = _mm256_add_epi32(alpha, _mm256_srli_epi32(_mm256_mullo_epi32(bg_a, inv_alpha), 8));
+// Calls still running while the counters are reset may add to the fresh ones.
+void stats_reset(void) {
+    for (uint32_t op = 0; op < STAT_OPS; op++) {
+        for (uint32_t tier = 0; tier < STATS_TIERS; tier++) {
+            kernel_stats* counters = &stat_table[op][tier];
+            stats_store(&counters->calls, 0);
+            stats_store(&counters->pixels, 0);
+            stats_store(&counters->bytes, 0);
+            stats_store(&counters->total_ns, 0);
+            stats_store(&counters->max_ns, 0);
+        }
+    }
+}
 
-            __m256i result = _mm256_or_si256(
-                _mm256_or_si256(
-                    _mm256_or_si256(r, _mm256_slli_epi32(g, 8)),
-                    _mm256_slli_epi32(b, 16)
-                ),
-                _mm256_slli_epi32(a, 24)
-            );
+// Draw lists: every command is clipped once, then destination rows are walked
+// band by band, replaying all commands that touch a band in submission order.
+// With DRAW_BIN_TILES the bands are DRAW_TILE_ROWS high so the background rows
+// stay in cache while the sprites that cover them are drawn.
+#define DRAW_TILE_ROWS 64
 
-            _mm256_storeu_si256((__m256i*)&background[bg_index], result);
+static row_fn draw_op_row(uint32_t op) {
+    if (op == DRAW_OP_BLEND) return kernels.blend_row;
+    if (op == DRAW_OP_BLEND_PREMULTIPLIED) return kernels.blend_premultiplied_row;
+    return kernels.copy_row;
+}
 
-            bg_index += 32;
-            overlay_index += 32;
-        }
+static size_t command_stride(const draw_command* cmd) {
+    return cmd->stride ? cmd->stride : (size_t)cmd->width * 4;
+}
 
-        for (uint32_t x = ov_width - (ov_width % 8); x < ov_width; x++) {
-            int bg_x = start_x + x;
-            if (bg_x < 0 || bg_x >= bg_width) {
-                continue;
+typedef struct {
+    rect_op op;
+    uint32_t y;
+} draw_item;
+
+typedef struct {
+    draw_item* items;
+    uint32_t count;
+    uint32_t chunk_rows;
+} draw_job;
+
+static void draw_rows(void* ctx, uint32_t y0, uint32_t y1) {
+    const draw_job* job = (const draw_job*)ctx;
+
+    for (uint32_t chunk_y0 = y0; chunk_y0 < y1; chunk_y0 += job->chunk_rows) {
+        uint32_t chunk_y1 = (y1 - chunk_y0 > job->chunk_rows) ? chunk_y0 + job->chunk_rows : y1;
+
+        for (uint32_t i = 0; i < job->count; i++) {
+            const draw_item* item = &job->items[i];
+            uint32_t item_y1 = item->y + item->op.height;
+            uint32_t from = (item->y > chunk_y0) ? item->y : chunk_y0;
+            uint32_t to = (item_y1 < chunk_y1) ? item_y1 : chunk_y1;
+            if (from < to) {
+                rect_rows((void*)&item->op, from - item->y, to - item->y);
             }
+        }
+    }
+}
 
-            uint32_t bg_pixel_index = (bg_y * bg_width + bg_x) * 4;
-            uint32_t ov_pixel_index = (y * ov_width + x) * 4;
-
-            uint8_t r1 = background[bg_pixel_index];
-            uint8_t g1 = background[bg_pixel_index + 1];
-            uint8_t b1 = background[bg_pixel_index + 2];
-            uint8_t a1 = background[bg_pixel_index + 3];
+void draw_batch_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                        const draw_command* commands, uint32_t count, uint32_t flags) {
+    if (background == NULL || commands == NULL || count == 0) return;
+
+    draw_item* items = (draw_item*)malloc((size_t)count * sizeof(draw_item));
+    if (items == NULL) return;
+
+    STATS_START();
+    uint32_t visible = 0;
+    uint32_t min_y = bg_height;
+    uint32_t max_y = 0;
+    uint64_t pixels = 0;
+    uint64_t bytes = 0;
+
+    for (uint32_t i = 0; i < count; i++) {
+        const draw_command* cmd = &commands[i];
+        draw_item* item = &items[visible];
+        if (cmd->image == NULL ||
+            !clip_rect(&item->op, background, bg_width, bg_height, bg_stride,
+                       cmd->image, cmd->width, cmd->height, command_stride(cmd), cmd->x, cmd->y)) {
+            continue;
+        }
 
-            uint8_t r2 = overlay[ov_pixel_index];
-            uint8_t g2 = overlay[ov_pixel_index + 1];
-            uint8_t b2 = overlay[ov_pixel_index + 2];
-            uint8_t a2 = overlay[ov_pixel_index + 3];
+        item->op.row = draw_op_row(cmd->op);
+        item->y = (cmd->y < 0) ? 0 : (uint32_t)cmd->y;
+        if (item->y < min_y) min_y = item->y;
+        if (item->y + item->op.height > max_y) max_y = item->y + item->op.height;
+        pixels += (uint64_t)item->op.width * item->op.height;
+        bytes += (uint64_t)item->op.width * item->op.height * ((cmd->op == DRAW_OP_BLIT) ? 8 : 12);
+        visible++;
+    }
 
-            if (a2 == 0) {
-                continue;
-            } else if (a2 == 255) {
-                background[bg_pixel_index] = r2;
-                background[bg_pixel_index + 1] = g2;
-                background[bg_pixel_index + 2] = b2;
-                background[bg_pixel_index + 3] = a2;
-            } else {
-                uint32_t inv_alpha = 255 - a2;
-                background[bg_pixel_index]     = (r2 * a2 + r1 * inv_alpha) / 255;
-                background[bg_pixel_index + 1] = (g2 * a2 + g1 * inv_alpha) / 255;
-                background[bg_pixel_index + 2] = (b2 * a2 + b1 * inv_alpha) / 255;
-                background[bg_pixel_index + 3] = a2 + (a1 * inv_alpha) / 255;
-            }
+    if (visible > 0) {
+        // Rows are shifted so the job only spans the rows that commands touch.
+        for (uint32_t i = 0; i < visible; i++) {
+            items[i].y -= min_y;
         }
+        draw_job job = {items, visible, (flags & DRAW_BIN_TILES) ? DRAW_TILE_ROWS : max_y - min_y};
+        parallel_rows(draw_rows, &job, max_y - min_y, pixels);
     }
+
+    free(items);
+    STATS_STOP(STAT_DRAW_BATCH, kernels.blend_row, pixels, bytes);
 }
-#else
-void blend_avx2(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
-                uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
-    blend(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y);
+
+void draw_batch(uint8_t* background, uint32_t bg_width, uint32_t bg_height,
+                const draw_command* commands, uint32_t count, uint32_t flags) {
+    draw_batch_strided(background, bg_width, bg_height, (size_t)bg_width * 4, commands, count, flags);
 }
-#endif
 
-#if defined(__ARM_NEON)
-void blend_neon(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
-                uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
-    if (background == NULL || overlay == NULL) {
-        printf("Background or overlay image is NULL\n");
-        return;
+// Glyph runs: every command blends one rectangle of a shared A8 atlas through
+// its own colour. Commands are clipped once and then drawn band by band like
+// draw_batch(), so later glyphs still land on top of earlier ones.
+typedef struct {
+    mask_op op;
+    uint32_t y;
+} mask_item;
+
+typedef struct {
+    mask_item* items;
+    uint32_t count;
+    uint32_t chunk_rows;
+} mask_job;
+
+static void mask_batch_rows(void* ctx, uint32_t y0, uint32_t y1) {
+    const mask_job* job = (const mask_job*)ctx;
+
+    for (uint32_t chunk_y0 = y0; chunk_y0 < y1; chunk_y0 += job->chunk_rows) {
+        uint32_t chunk_y1 = (y1 - chunk_y0 > job->chunk_rows) ? chunk_y0 + job->chunk_rows : y1;
+
+        for (uint32_t i = 0; i < job->count; i++) {
+            const mask_item* item = &job->items[i];
+            uint32_t item_y1 = item->y + item->op.rect.height;
+            uint32_t from = (item->y > chunk_y0) ? item->y : chunk_y0;
+            uint32_t to = (item_y1 < chunk_y1) ? item_y1 : chunk_y1;
+            if (from < to) {
+                mask_rows((void*)&item->op, from - item->y, to - item->y);
+            }
+        }
     }
+}
 
-    for (uint32_t y = 0; y < ov_height; y++) {
-        int bg_y = start_y + y;
-        if (bg_y < 0 || bg_y >= bg_height) {
+void blend_mask_batch(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                      const uint8_t* atlas, uint32_t atlas_width, uint32_t atlas_height, size_t atlas_stride,
+                      const mask_command* commands, uint32_t count, uint32_t flags) {
+    if (dest == NULL || atlas == NULL || commands == NULL || count == 0) return;
+
+    mask_item* items = (mask_item*)malloc((size_t)count * sizeof(mask_item));
+    if (items == NULL) return;
+
+    STATS_START();
+    uint32_t visible = 0;
+    uint32_t min_y = dest_height;
+    uint32_t max_y = 0;
+    uint64_t pixels = 0;
+
+    for (uint32_t i = 0; i < count; i++) {
+        const mask_command* cmd = &commands[i];
+        mask_item* item = &items[visible];
+        // Entries reaching outside the atlas are skipped rather than read out of bounds.
+        if ((uint64_t)cmd->atlas_x + cmd->width > atlas_width ||
+            (uint64_t)cmd->atlas_y + cmd->height > atlas_height ||
+            !clip_mask(&item->op, kernels.blend_mask_row, dest, dest_width, dest_height, dest_stride,
+                       atlas + (size_t)cmd->atlas_y * atlas_stride + cmd->atlas_x, cmd->width, cmd->height,
+                       atlas_stride, cmd->x, cmd->y, cmd->r, cmd->g, cmd->b, cmd->a)) {
             continue;
         }
 
-        uint32_t bg_index = (bg_y * bg_width + start_x) * 4;
-        uint32_t overlay_index = y * ov_width * 4;
+        item->y = (cmd->y < 0) ? 0 : (uint32_t)cmd->y;
+        if (item->y < min_y) min_y = item->y;
+        if (item->y + item->op.rect.height > max_y) max_y = item->y + item->op.rect.height;
+        pixels += (uint64_t)item->op.rect.width * item->op.rect.height;
+        visible++;
+    }
 
-        for (uint32_t x = 0; x < ov_width - 3; x += 4) {
-            int bg_x = start_x + x;
-            if (bg_x < 0 || bg_x + 3 >= bg_width) {
-                bg_index += 16;
-                overlay_index += 16;
-                continue;
-            }
+    if (visible > 0) {
+        for (uint32_t i = 0; i < visible; i++) {
+            items[i].y -= min_y;
+        }
+        mask_job job = {items, visible, (flags & DRAW_BIN_TILES) ? DRAW_TILE_ROWS : max_y - min_y};
+        parallel_rows(mask_batch_rows, &job, max_y - min_y, pixels);
+    }
 
-            uint8x16_t bg_pixels = vld1q_u8(&background[bg_index]);
-            uint8x16_t ov_pixels = vld1q_u8(&overlay[overlay_index]);
+    free(items);
+    STATS_STOP(STAT_BLEND_MASK_BATCH, kernels.blend_mask_row, pixels, pixels * 9);
+}
 
-            uint16x8_t alpha_high = vmovl_u8(vget_high_u8(ov_pixels));
-            uint16x8_t alpha_low = vmovl_u8(vget_low_u8(ov_pixels));
-            uint16x8_t inv_alpha_high = vsubq_u16(vdupq_n_u16(255), alpha_high);
-            uint16x8_t inv_alpha_low = vsubq_u16(vdupq_n_u16(255), alpha_low);
+// Damage tracking: clipped destination rectangles are merged whenever they
+// overlap, and once DAMAGE_MAX_RECTS is reached a new rectangle is folded into
+// the existing one whose bounding box grows the least.
+static uint64_t rect_area(const image_rect* r) {
+    return (uint64_t)r->width * r->height;
+}
 
-            uint16x8_t bg_high = vmovl_u8(vget_high_u8(bg_pixels));
-            uint16x8_t bg_low = vmovl_u8(vget_low_u8(bg_pixels));
-            uint16x8_t ov_high = vmovl_u8(vget_high_u8(ov_pixels));
-            uint16x8_t ov_low = vmovl_u8(vget_low_u8(ov_pixels));
+static int rects_overlap(const image_rect* a, const image_rect* b) {
+    return a->x < b->x + (int64_t)b->width && b->x < a->x + (int64_t)a->width &&
+           a->y < b->y + (int64_t)b->height && b->y < a->y + (int64_t)a->height;
+}
 
-            uint16x8_t blended_high = vaddq_u16(
-                vmulq_u16(ov_high, alpha_high),
-                vmulq_u16(bg_high, inv_alpha_high)
-            );
-            uint16x8_t blended_low = vaddq_u16(
-                vmulq_u16(ov_low, alpha_low),
-                vmulq_u16(bg_low, inv_alpha_low)
-            );
+static image_rect rect_union(const image_rect* a, const image_rect* b) {
+    int64_t x0 = (a->x < b->x) ? a->x : b->x;
+    int64_t y0 = (a->y < b->y) ? a->y : b->y;
+    int64_t x1 = (a->x + (int64_t)a->width > b->x + (int64_t)b->width) ? a->x + (int64_t)a->width : b->x + (int64_t)b->width;
+    int64_t y1 = (a->y + (int64_t)a->height > b->y + (int64_t)b->height) ? a->y + (int64_t)a->height : b->y + (int64_t)b->height;
+    image_rect r = {(int32_t)x0, (int32_t)y0, (uint32_t)(x1 - x0), (uint32_t)(y1 - y0)};
+    return r;
+}
 
-            blended_high = vshrq_n_u16(blended_high, 8);
-            blended_low = vshrq_n_u16(blended_low, 8);
+void damage_init(damage_list* damage, uint32_t width, uint32_t height) {
+    damage->bound_width = width;
+    damage->bound_height = height;
+    damage->count = 0;
+}
 
-            uint8x16_t result = vcombine_u8(vqmovn_u16(blended_low), vqmovn_u16(blended_high));
+void damage_clear(damage_list* damage) {
+    damage->count = 0;
+}
 
-            vst1q_u8(&background[bg_index], result);
+void damage_add(damage_list* damage, int32_t x, int32_t y, uint32_t width, uint32_t height) {
+    int64_t x0 = (x < 0) ? 0 : x;
+    int64_t y0 = (y < 0) ? 0 : y;
+    int64_t x1 = (int64_t)x + width;
+    int64_t y1 = (int64_t)y + height;
+    if (x1 > damage->bound_width) x1 = damage->bound_width;
+    if (y1 > damage->bound_height) y1 = damage->bound_height;
+    if (x0 >= x1 || y0 >= y1) return;
+
+    image_rect r = {(int32_t)x0, (int32_t)y0, (uint32_t)(x1 - x0), (uint32_t)(y1 - y0)};
+
+    for (;;) {
+        uint32_t i = 0;
+        while (i < damage->count) {
+            if (rects_overlap(&damage->rects[i], &r)) {
+                r = rect_union(&damage->rects[i], &r);
+                damage->rects[i] = damage->rects[--damage->count];
+                i = 0;
+            } else {
+                i++;
+            }
+        }
 
-            bg_index += 16;
-            overlay_index += 16;
+        if (damage->count < DAMAGE_MAX_RECTS) {
+            damage->rects[damage->count++] = r;
+            return;
         }
 
-        for (uint32_t x = ov_width - (ov_width % 4); x < ov_width; x++) {
-            int bg_x = start_x + x;
-            if (bg_x < 0 || bg_x >= bg_width) {
-                continue;
+        uint32_t best = 0;
+        uint64_t best_growth = UINT64_MAX;
+        for (i = 0; i < damage->count; i++) {
+            image_rect merged = rect_union(&damage->rects[i], &r);
+            uint64_t growth = rect_area(&merged) - rect_area(&damage->rects[i]);
+            if (growth < best_growth) {
+                best_growth = growth;
+                best = i;
             }
+        }
+        r = rect_union(&damage->rects[best], &r);
+        damage->rects[best] = damage->rects[--damage->count];
+    }
+}
 
-            uint32_t bg_pixel_index = (bg_y * bg_width + bg_x) * 4;
-            uint32_t ov_pixel_index = (y * ov_width + x) * 4;
+void damage_add_commands(damage_list* damage, const draw_command* commands, uint32_t count) {
+    for (uint32_t i = 0; i < count; i++) {
+        damage_add(damage, commands[i].x, commands[i].y, commands[i].width, commands[i].height);
+    }
+}
 
-            uint8_t r1 = background[bg_pixel_index];
-            uint8_t g1 = background[bg_pixel_index + 1];
-            uint8_t b1 = background[bg_pixel_index + 2];
-            uint8_t a1 = background[bg_pixel_index + 3];
+// Compares two frames tile by tile and adds every run of changed tiles in a
+// tile row to damage. Rows are scanned top to bottom and a tile stops being
+// compared once it is known to have changed; only one flag per tile is stored.
+// Returns the number of changed tiles, or -1 on bad arguments.
+typedef struct {
+    diff_row_fn row;
+    const uint8_t* prev;
+    size_t prev_stride;
+    const uint8_t* cur;
+    size_t cur_stride;
+    uint32_t width;
+    uint32_t height;
+    uint32_t tile;
+    uint32_t columns;
+    uint8_t* changed;
+} diff_op;
+
+static void diff_tile_rows(void* ctx, uint32_t ty0, uint32_t ty1) {
+    const diff_op* op = (const diff_op*)ctx;
+    uint32_t y1 = (ty1 * (uint64_t)op->tile < op->height) ? ty1 * op->tile : op->height;
+
+    for (uint32_t y = ty0 * op->tile; y < y1; y++) {
+        uint8_t* changed = op->changed + (size_t)(y / op->tile) * op->columns;
+        const uint8_t* prev = op->prev + (size_t)y * op->prev_stride;
+        const uint8_t* cur = op->cur + (size_t)y * op->cur_stride;
+
+        for (uint32_t tx = 0; tx < op->columns; tx++) {
+            if (changed[tx]) continue;
+            uint32_t x = tx * op->tile;
+            uint32_t count = (op->width - x < op->tile) ? op->width - x : op->tile;
+            changed[tx] = (uint8_t)op->row(prev + (size_t)x * 4, cur + (size_t)x * 4, count);
+        }
+    }
+}
 
-            uint8_t r2 = overlay[ov_pixel_index];
-            uint8_t g2 = overlay[ov_pixel_index + 1];
-            uint8_t b2 = overlay[ov_pixel_index + 2];
-            uint8_t a2 = overlay[ov_pixel_index + 3];
+static int64_t diff_regions_with(diff_row_fn row, int parallel, const uint8_t* prev, size_t prev_stride,
+                                 const uint8_t* cur, size_t cur_stride, uint32_t width, uint32_t height,
+                                 uint32_t tile, damage_list* damage) {
+    if (prev == NULL || cur == NULL || damage == NULL || tile == 0) return -1;
+    if (width == 0 || height == 0) return 0;
+
+    uint32_t columns = (uint32_t)(((uint64_t)width + tile - 1) / tile);
+    uint32_t tile_rows = (uint32_t)(((uint64_t)height + tile - 1) / tile);
+    uint8_t* changed = (uint8_t*)calloc((size_t)columns * tile_rows, 1);
+    if (changed == NULL) return -1;
+
+    STATS_START();
+    diff_op op = {row, prev, prev_stride, cur, cur_stride, width, height, tile, columns, changed};
+    if (parallel) {
+        parallel_rows(diff_tile_rows, &op, tile_rows, (uint64_t)width * height);
+    } else {
+        diff_tile_rows(&op, 0, tile_rows);
+    }
 
-            if (a2 == 0) {
+    int64_t count = 0;
+    for (uint32_t ty = 0; ty < tile_rows; ty++) {
+        const uint8_t* flags = changed + (size_t)ty * columns;
+        uint32_t tx = 0;
+        while (tx < columns) {
+            if (!flags[tx]) {
+                tx++;
                 continue;
-            } else if (a2 == 255) {
-                background[bg_pixel_index] = r2;
-                background[bg_pixel_index + 1] = g2;
-                background[bg_pixel_index + 2] = b2;
-                background[bg_pixel_index + 3] = a2;
-            } else {
-                uint32_t inv_alpha = 255 - a2;
-                background[bg_pixel_index]     = (r2 * a2 + r1 * inv_alpha) / 255;
-                background[bg_pixel_index + 1] = (g2 * a2 + g1 * inv_alpha) / 255;
-                background[bg_pixel_index + 2] = (b2 * a2 + b1 * inv_alpha) / 255;
-                background[bg_pixel_index + 3] = a2 + (a1 * inv_alpha) / 255;
             }
+            uint32_t first = tx;
+            while (tx < columns && flags[tx]) tx++;
+            count += tx - first;
+
+            uint64_t x0 = (uint64_t)first * tile;
+            uint64_t x1 = ((uint64_t)tx * tile < width) ? (uint64_t)tx * tile : width;
+            uint64_t y0 = (uint64_t)ty * tile;
+            uint64_t y1 = (y0 + tile < height) ? y0 + tile : height;
+            damage_add(damage, (int32_t)x0, (int32_t)y0, (uint32_t)(x1 - x0), (uint32_t)(y1 - y0));
         }
     }
-}
 
-#else
-// Fallback to non-NEON version if NEON is not available
-void blend_neon(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
-                uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
-    // Call the original blend function here
-    blend(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y);
+    free(changed);
+    STATS_STOP(STAT_DIFF_REGIONS, row, (uint64_t)width * height, (uint64_t)width * height * 8);
+    return count;
 }
-#endif
-
-void blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
-          uint8_t* src_image, uint32_t src_width, uint32_t src_height,
-          int32_t start_x, int32_t start_y) {
-    if (dest_image == NULL || src_image == NULL) return;
 
-    int32_t copy_start_x = (start_x < 0) ? 0 : start_x;
-    int32_t copy_start_y = (start_y < 0) ? 0 : start_y;
-    int32_t copy_end_x = (start_x + (int32_t)src_width > (int32_t)dest_width) ? dest_width : (start_x + src_width);
-    int32_t copy_end_y = (start_y + (int32_t)src_height > (int32_t)dest_height) ? dest_height : (start_y + src_height);
+int64_t diff_regions(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height,
+                     uint32_t tile, damage_list* damage) {
+    return diff_regions_with(diff_row, 0, prev, (size_t)width * 4, cur, (size_t)width * 4,
+                             width, height, tile, damage);
+}
 
-    if (copy_start_x >= copy_end_x || copy_start_y >= copy_end_y) return;
+int64_t diff_regions_avx2(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height,
+                          uint32_t tile, damage_list* damage) {
+    return diff_regions_with(AVX2_OR(diff_row_avx2, diff_row), 0, prev, (size_t)width * 4, cur, (size_t)width * 4,
+                             width, height, tile, damage);
+}
 
-    uint32_t copy_width = copy_end_x - copy_start_x;
-    uint32_t copy_height = copy_end_y - copy_start_y;
-    int32_t src_offset_x = (start_x < 0) ? -start_x : 0;
-    int32_t src_offset_y = (start_y < 0) ? -start_y : 0;
+int64_t diff_regions_neon(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height,
+                          uint32_t tile, damage_list* damage) {
+    return diff_regions_with(NEON_OR(diff_row_neon, diff_row), 0, prev, (size_t)width * 4, cur, (size_t)width * 4,
+                             width, height, tile, damage);
+}
 
-    uint32_t dest_stride = dest_width * 4;
-    uint32_t src_stride = src_width * 4;
-    uint32_t copy_stride = copy_width * 4;
+int64_t diff_regions_strided(const uint8_t* prev, size_t prev_stride, const uint8_t* cur, size_t cur_stride,
+                             uint32_t width, uint32_t height, uint32_t tile, damage_list* damage) {
+    return diff_regions_with(diff_row, 0, prev, prev_stride, cur, cur_stride, width, height, tile, damage);
+}
 
-    uint8_t* dest_ptr = dest_image + (copy_start_y * dest_width + copy_start_x) * 4;
-    uint8_t* src_ptr = src_image + (src_offset_y * src_width + src_offset_x) * 4;
+// Restores each damaged rectangle of dest from clean and replays the draw
+// commands clipped to it, leaving the rest of dest untouched.
+void recompose_damaged_strided(uint8_t* dest, size_t dest_stride, const uint8_t* clean, size_t clean_stride,
+                               uint32_t width, uint32_t height, const draw_command* commands, uint32_t count,
+                               const damage_list* damage) {
+    if (dest == NULL || clean == NULL || damage == NULL) return;
+
+    STATS_START();
+    uint64_t pixels = 0;
+    uint64_t bytes = 0;
+    for (uint32_t i = 0; i < damage->count; i++) {
+        const image_rect* r = &damage->rects[i];
+        if ((int64_t)r->x + r->width > width || (int64_t)r->y + r->height > height) continue;
+
+        uint8_t* region = dest + (size_t)r->y * dest_stride + (size_t)r->x * 4;
+        rect_op op;
+        if (clip_rect(&op, region, r->width, r->height, dest_stride,
+                      clean + (size_t)r->y * clean_stride + (size_t)r->x * 4, r->width, r->height, clean_stride, 0, 0)) {
+            op.row = kernels.copy_row;
+            run_rect(&op, 1);
+            pixels += (uint64_t)op.width * op.height;
+            bytes += (uint64_t)op.width * op.height * 8;
+        }
 
-    for (uint32_t y = 0; y < copy_height; y++) {
-        memcpy(dest_ptr, src_ptr, copy_stride);
-        dest_ptr += dest_stride;
-        src_ptr += src_stride;
+        for (uint32_t c = 0; c < count; c++) {
+            const draw_command* cmd = &commands[c];
+            if (cmd->image == NULL) continue;
+            if (clip_rect(&op, region, r->width, r->height, dest_stride,
+                          cmd->image, cmd->width, cmd->height, command_stride(cmd),
+                          (int32_t)((int64_t)cmd->x - r->x), (int32_t)((int64_t)cmd->y - r->y))) {
+                op.row = draw_op_row(cmd->op);
+                run_rect(&op, 1);
+                bytes += (uint64_t)op.width * op.height * ((cmd->op == DRAW_OP_BLIT) ? 8 : 12);
+            }
+        }
     }
+    STATS_STOP(STAT_RECOMPOSE_DAMAGED, kernels.copy_row, pixels, bytes);
 }
 
-#if HAS_AVX2
-void blit_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
-               uint8_t* src_image, uint32_t src_width, uint32_t src_height,
-               int32_t start_x, int32_t start_y) {
-    if (dest_image == NULL || src_image == NULL) return;
-
-    int32_t copy_start_x = (start_x < 0) ? 0 : start_x;
-    int32_t copy_start_y = (start_y < 0) ? 0 : start_y;
-    int32_t copy_end_x = (start_x + (int32_t)src_width > (int32_t)dest_width) ? dest_width : (start_x + src_width);
-    int32_t copy_end_y = (start_y + (int32_t)src_height > (int32_t)dest_height) ? dest_height : (start_y + src_height);
-
-    if (copy_start_x >= copy_end_x || copy_start_y >= copy_end_y) return;
-
-    uint32_t copy_width = copy_end_x - copy_start_x;
-    uint32_t copy_height = copy_end_y - copy_start_y;
-    int32_t src_offset_x = (start_x < 0) ? -start_x : 0;
-    int32_t src_offset_y = (start_y < 0) ? -start_y : 0;
-
-    uint32_t avx2_blocks = copy_width / 8;
-    uint32_t remainder = copy_width % 8;
+void recompose_damaged(uint8_t* dest, const uint8_t* clean, uint32_t width, uint32_t height,
+                       const draw_command* commands, uint32_t count, const damage_list* damage) {
+    recompose_damaged_strided(dest, (size_t)width * 4, clean, (size_t)width * 4, width, height,
+                              commands, count, damage);
+}
 
-    for (uint32_t y = 0; y < copy_height; y++) {
-        uint8_t* dest_row = dest_image + ((copy_start_y + y) * dest_width + copy_start_x) * 4;
-        uint8_t* src_row = src_image + ((src_offset_y + y) * src_width + src_offset_x) * 4;
+// The auto_* entry points use the best kernels for this CPU and split large
+// jobs across the worker pool. cffi releases the GIL around every call.
+// The *_strided forms take the row pitch of each image in bytes, so they can
+// work on a sub-rectangle of a larger image in place.
+void auto_fill_image_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(kernels.fill_row, 1, image_data, width, height, (size_t)width * 4, r, g, b, a);
+}
 
-        for (uint32_t x = 0; x < avx2_blocks; x++) {
-            __m256i pixels = _mm256_loadu_si256((__m256i*)(src_row + x * 32));
-            _mm256_storeu_si256((__m256i*)(dest_row + x * 32), pixels);
-        }
+void auto_fill_image_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                                  uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    fill_with(kernels.fill_row, 1, image_data, width, height, stride, r, g, b, a);
+}
 
-        if (remainder > 0) {
-            memcpy(dest_row + avx2_blocks * 32, src_row + avx2_blocks * 32, remainder * 4);
-        }
-    }
+void auto_blend(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(kernels.blend_row, 1, background, bg_width, bg_height, (size_t)bg_width * 4,
+               overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
 }
-#else
-void blit_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
-               uint8_t* src_image, uint32_t src_width, uint32_t src_height,
-               int32_t start_x, int32_t start_y) {
-    blit(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y);
+
+void auto_blend_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                        uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                        int32_t start_x, int32_t start_y) {
+    blend_with(kernels.blend_row, 1, background, bg_width, bg_height, bg_stride,
+               overlay, ov_width, ov_height, ov_stride, start_x, start_y);
 }
-#endif
 
-#if defined(__ARM_NEON)
-void blit_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+void auto_blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
                uint8_t* src_image, uint32_t src_width, uint32_t src_height,
                int32_t start_x, int32_t start_y) {
-    if (dest_image == NULL || src_image == NULL) return;
-
-    int32_t copy_start_x = (start_x < 0) ? 0 : start_x;
-    int32_t copy_start_y = (start_y < 0) ? 0 : start_y;
-    int32_t copy_end_x = (start_x + (int32_t)src_width > (int32_t)dest_width) ? dest_width : (start_x + src_width);
-    int32_t copy_end_y = (start_y + (int32_t)src_height > (int32_t)dest_height) ? dest_height : (start_y + src_height);
+    blit_with(kernels.copy_row, 1, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+              src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y);
+}
 
-    if (copy_start_x >= copy_end_x || copy_start_y >= copy_end_y) return;
+void auto_blit_strided(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                       uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                       int32_t start_x, int32_t start_y) {
+    blit_with(kernels.copy_row, 1, dest_image, dest_width, dest_height, dest_stride,
+              src_image, src_width, src_height, src_stride, start_x, start_y);
+}
 
-    uint32_t copy_width = copy_end_x - copy_start_x;
-    uint32_t copy_height = copy_end_y - copy_start_y;
-    int32_t src_offset_x = (start_x < 0) ? -start_x : 0;
-    int32_t src_offset_y = (start_y < 0) ? -start_y : 0;
+int auto_blit_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                     uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                     uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height,
+                     int32_t start_x, int32_t start_y) {
+    uint8_t* pixels = region_pixels(src_image, src_width, src_height, src_stride,
+                                    region_x, region_y, region_width, region_height);
+    if (pixels == NULL) return -1;
+    blit_with(kernels.copy_row, 1, dest_image, dest_width, dest_height, dest_stride,
+              pixels, region_width, region_height, src_stride, start_x, start_y);
+    return 0;
+}
 
-    uint32_t dest_stride = dest_width * 4;
-    uint32_t src_stride = src_width * 4;
+int auto_blend_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                      uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                      uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height,
+                      int32_t start_x, int32_t start_y) {
+    uint8_t* pixels = region_pixels(src_image, src_width, src_height, src_stride,
+                                    region_x, region_y, region_width, region_height);
+    if (pixels == NULL) return -1;
+    blend_with(kernels.blend_row, 1, dest_image, dest_width, dest_height, dest_stride,
+               pixels, region_width, region_height, src_stride, start_x, start_y);
+    return 0;
+}
 
-    uint8_t* dest_ptr = dest_image + (copy_start_y * dest_width + copy_start_x) * 4;
-    uint8_t* src_ptr = src_image + (src_offset_y * src_width + src_offset_x) * 4;
+int auto_nearest_neighbor_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                                 uint32_t dst_width, uint32_t dst_height) {
+    return scale_with(STAT_NEAREST_RESIZE, kernels.gather_row, NULL, 1, dst, dst_width, dst_height, (size_t)dst_width * 4,
+                      src, src_width, src_height, (size_t)src_width * 4, 0, 0, dst_width, dst_height);
+}
 
-    uint32_t neon_blocks = copy_width / 4;
-    uint32_t remainder = copy_width % 4;
+int auto_nearest_neighbor_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                                         uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return scale_with(STAT_NEAREST_RESIZE, kernels.gather_row, NULL, 1, dst, dst_width, dst_height, dst_stride,
+                      src, src_width, src_height, src_stride, 0, 0, dst_width, dst_height);
+}
 
-    for (uint32_t y = 0; y < copy_height; y++) {
-        uint8_t* dest_row = dest_ptr + y * dest_stride;
-        uint8_t* src_row = src_ptr + y * src_stride;
+int auto_scaled_blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
+                     uint8_t* src_image, uint32_t src_width, uint32_t src_height,
+                     int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLIT, kernels.gather_row, NULL, 1, dest_image, dest_width, dest_height, (size_t)dest_width * 4,
+                      src_image, src_width, src_height, (size_t)src_width * 4, start_x, start_y, width, height);
+}
 
-        for (uint32_t x = 0; x < neon_blocks; x++) {
-            uint32x4_t pixels = vld1q_u32((uint32_t*)(src_row + x * 16));
-            vst1q_u32((uint32_t*)(dest_row + x * 16), pixels);
-        }
+int auto_scaled_blit_strided(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                             uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                             int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLIT, kernels.gather_row, NULL, 1, dest_image, dest_width, dest_height, dest_stride,
+                      src_image, src_width, src_height, src_stride, start_x, start_y, width, height);
+}
 
-        if (remainder > 0) {
-            memcpy(dest_row + neon_blocks * 16, src_row + neon_blocks * 16, remainder * 4);
-        }
-    }
+int auto_scaled_blend(uint8_t* background, uint32_t bg_width, uint32_t bg_height,
+                      uint8_t* overlay, uint32_t ov_width, uint32_t ov_height,
+                      int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLEND, kernels.gather_row, kernels.blend_row, 1, background, bg_width, bg_height, (size_t)bg_width * 4,
+                      overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y, width, height);
 }
-#else
-void blit_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height,
-               uint8_t* src_image, uint32_t src_width, uint32_t src_height,
-               int32_t start_x, int32_t start_y) {
-    blit(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y);
+
+int auto_scaled_blend_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                              uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                              int32_t start_x, int32_t start_y, uint32_t width, uint32_t height) {
+    return scale_with(STAT_SCALED_BLEND, kernels.gather_row, kernels.blend_row, 1, background, bg_width, bg_height, bg_stride,
+                      overlay, ov_width, ov_height, ov_stride, start_x, start_y, width, height);
 }
-#endif
 
-void blit_same_size(uint8_t* src, uint8_t* dst, uint32_t width, uint32_t height, uint32_t channels) {
-    size_t total_bytes = width * height * channels;
-    memcpy(dst, src, total_bytes);
+int auto_bilinear_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                         uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(kernels.resample_h, kernels.resample_v, 1, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
 }
 
-void nearest_neighbor_resize(uint8_t* __restrict src, uint8_t* __restrict dst,
-                             uint32_t src_width, uint32_t src_height,
-                             uint32_t dst_width, uint32_t dst_height) {
-    if (!src || !dst || src_width == 0 || src_height == 0 ||
-        dst_width == 0 || dst_height == 0) {
-        return;
-    }
+int auto_bilinear_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                                 uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(kernels.resample_h, kernels.resample_v, 1, RESAMPLE_BILINEAR,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
 
-    const uint32_t channels = 4; // Suponiendo imagen RGBA
-    uint32_t x_ratio = (uint32_t)((src_width << 16) / dst_width) + 1;
-    uint32_t y_ratio = (uint32_t)((src_height << 16) / dst_height) + 1;
+int auto_area_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height,
+                     uint32_t dst_width, uint32_t dst_height) {
+    return resample_with(kernels.resample_h, kernels.resample_v, 1, RESAMPLE_AREA,
+                         src, src_width, src_height, (size_t)src_width * 4,
+                         dst, dst_width, dst_height, (size_t)dst_width * 4);
+}
 
-    for (uint32_t y = 0; y < dst_height; y++) {
-        uint32_t src_y = (y * y_ratio) >> 16;
-        uint8_t* dst_row = dst + y * dst_width * channels;
-        uint8_t* src_row = src + src_y * src_width * channels;
+int auto_area_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride,
+                             uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride) {
+    return resample_with(kernels.resample_h, kernels.resample_v, 1, RESAMPLE_AREA,
+                         src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride);
+}
 
-        uint32_t x = 0;
-        for (; x + 1 < dst_width; x += 2) {
-            uint32_t src_x0 = (x * x_ratio) >> 16;
-            uint32_t src_x1 = ((x + 1) * x_ratio) >> 16;
+void auto_premultiply(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(kernels.premultiply_row, 1, image_data, width, height, (size_t)width * 4);
+}
 
-            uint8_t* dst_pixel0 = dst_row + x * channels;
-            uint8_t* dst_pixel1 = dst_row + (x + 1) * channels;
+void auto_premultiply_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride) {
+    convert_with(kernels.premultiply_row, 1, image_data, width, height, stride);
+}
 
-            uint8_t* src_pixel0 = src_row + src_x0 * channels;
-            uint8_t* src_pixel1 = src_row + src_x1 * channels;
+void auto_unpremultiply(uint8_t* image_data, uint32_t width, uint32_t height) {
+    convert_with(kernels.unpremultiply_row, 1, image_data, width, height, (size_t)width * 4);
+}
 
-            // Copiar píxeles completos (RGBA)
-            *((uint32_t*)dst_pixel0) = *((uint32_t*)src_pixel0);
-            *((uint32_t*)dst_pixel1) = *((uint32_t*)src_pixel1);
-        }
+void auto_unpremultiply_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride) {
+    convert_with(kernels.unpremultiply_row, 1, image_data, width, height, stride);
+}
 
-        // Procesar píxel restante si el ancho es impar
-        if (x < dst_width) {
-            uint32_t src_x = (x * x_ratio) >> 16;
-            uint8_t* dst_pixel = dst_row + x * channels;
-            uint8_t* src_pixel = src_row + src_x * channels;
-            *((uint32_t*)dst_pixel) = *((uint32_t*)src_pixel);
-        }
-    }
+void auto_multiply_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(kernels.multiply_row, 1, image_data, width, height, (size_t)width * 4, r, g, b, a);
 }
-#if defined(__ARM_NEON)
-void nearest_neighbor_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height) {
-    if (src == NULL || dst == NULL) {
-        return;
-    }
 
-    float x_ratio = (float)src_width / dst_width;
-    float y_ratio = (float)src_height / dst_height;
-    uint32_t channels = 4;
+void auto_multiply_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                                uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    multiply_with(kernels.multiply_row, 1, image_data, width, height, stride, r, g, b, a);
+}
 
-    for (uint32_t y = 0; y < dst_height; y++) {
-        uint32_t nearest_y = (uint32_t)(y * y_ratio) * src_width * channels;
-        uint8_t* dst_row = dst + (y * dst_width * channels);
+void auto_blend_premultiplied(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                              uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y) {
+    blend_with(kernels.blend_premultiplied_row, 1, background, bg_width, bg_height, (size_t)bg_width * 4,
+               overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y);
+}
 
-        for (uint32_t x = 0; x < dst_width - 3; x += 4) {
-            uint32_t nearest_x = (uint32_t)(x * x_ratio) * channels;
-            uint8_t* src_pixel = src + nearest_y + nearest_x;
+void auto_blend_premultiplied_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                                      uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                                      int32_t start_x, int32_t start_y) {
+    blend_with(kernels.blend_premultiplied_row, 1, background, bg_width, bg_height, bg_stride,
+               overlay, ov_width, ov_height, ov_stride, start_x, start_y);
+}
 
-            uint32x4_t pixel = vld1q_u32((uint32_t*)src_pixel);
-            vst1q_u32((uint32_t*)(dst_row + x * channels), pixel);
-        }
+int64_t auto_diff_regions(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height,
+                          uint32_t tile, damage_list* damage) {
+    return diff_regions_with(kernels.diff_row, 1, prev, (size_t)width * 4, cur, (size_t)width * 4,
+                             width, height, tile, damage);
+}
 
-        for (uint32_t x = dst_width - (dst_width % 4); x < dst_width; x++) {
-            uint32_t nearest_x = (uint32_t)(x * x_ratio) * channels;
-            uint8_t* src_pixel = src + nearest_y + nearest_x;
-            memcpy(&dst_row[x * channels], src_pixel, channels);
-        }
-    }
+int64_t auto_diff_regions_strided(const uint8_t* prev, size_t prev_stride, const uint8_t* cur, size_t cur_stride,
+                                  uint32_t width, uint32_t height, uint32_t tile, damage_list* damage) {
+    return diff_regions_with(kernels.diff_row, 1, prev, prev_stride, cur, cur_stride, width, height, tile, damage);
 }
-#else
-void nearest_neighbor_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height) {
-    nearest_neighbor_resize(src, dst, src_width, src_height, dst_width, dst_height);
+
+void auto_analyze_alpha(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info) {
+    analyze_alpha_with(kernels.alpha_row, image_data, width, height, (size_t)width * 4, info);
 }
-#endif
-#if HAS_AVX2
-#include <immintrin.h>
 
-void nearest_neighbor_resize_avx2(uint8_t* __restrict src, uint8_t* __restrict dst,
-                                  uint32_t src_width, uint32_t src_height,
-                                  uint32_t dst_width, uint32_t dst_height) {
-    if (!src || !dst || src_width == 0 || src_height == 0 ||
-        dst_width == 0 || dst_height == 0) {
-        return;
-    }
+void auto_analyze_alpha_strided(const uint8_t* image_data, uint32_t width, uint32_t height, size_t stride,
+                                alpha_info* info) {
+    analyze_alpha_with(kernels.alpha_row, image_data, width, height, stride, info);
+}
 
-    const uint32_t channels = 4; // Asumiendo imagen RGBA
-    uint64_t x_ratio = ((uint64_t)src_width << 16) / dst_width;
-    uint64_t y_ratio = ((uint64_t)src_height << 16) / dst_height;
+void auto_blend_analyzed(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                         uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, const alpha_info* info) {
+    blend_analyzed_with(kernels.blend_row, kernels.copy_row, 1, 0, background, bg_width, bg_height, (size_t)bg_width * 4,
+                        overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y, info);
+}
 
-    for (uint32_t y = 0; y < dst_height; y++) {
-        uint32_t src_y = (y * y_ratio) >> 16;
-        uint8_t* dst_row = dst + y * dst_width * channels;
-        uint8_t* src_row = src + src_y * src_width * channels;
+void auto_blend_analyzed_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride,
+                                 uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride,
+                                 int32_t start_x, int32_t start_y, const alpha_info* info) {
+    blend_analyzed_with(kernels.blend_row, kernels.copy_row, 1, 0, background, bg_width, bg_height, bg_stride,
+                        overlay, ov_width, ov_height, ov_stride, start_x, start_y, info);
+}
 
-        uint32_t x = 0;
-        for (; x + 7 < dst_width; x += 8) {
-            // Calcular los índices fuente correctos para cada píxel de destino
-            uint32_t src_x0 = (x * x_ratio) >> 16;
-            uint32_t src_x1 = ((x + 1) * x_ratio) >> 16;
-            uint32_t src_x2 = ((x + 2) * x_ratio) >> 16;
-            uint32_t src_x3 = ((x + 3) * x_ratio) >> 16;
-            uint32_t src_x4 = ((x + 4) * x_ratio) >> 16;
-            uint32_t src_x5 = ((x + 5) * x_ratio) >> 16;
-            uint32_t src_x6 = ((x + 6) * x_ratio) >> 16;
-            uint32_t src_x7 = ((x + 7) * x_ratio) >> 16;
+void auto_blend_premultiplied_analyzed(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height,
+                                       uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y,
+                                       const alpha_info* info) {
+    blend_analyzed_with(kernels.blend_premultiplied_row, kernels.copy_row, 1, 1, background,
+                        bg_width, bg_height, (size_t)bg_width * 4,
+                        overlay, ov_width, ov_height, (size_t)ov_width * 4, start_x, start_y, info);
+}
 
-            // Cargar los píxeles correctos para estos índices de origen
-            __m256i pixels = _mm256_set_epi32(
-                *(uint32_t*)(src_row + src_x7 * channels),
-                *(uint32_t*)(src_row + src_x6 * channels),
-                *(uint32_t*)(src_row + src_x5 * channels),
-                *(uint32_t*)(src_row + src_x4 * channels),
-                *(uint32_t*)(src_row + src_x3 * channels),
-                *(uint32_t*)(src_row + src_x2 * channels),
-                *(uint32_t*)(src_row + src_x1 * channels),
-                *(uint32_t*)(src_row + src_x0 * channels)
-            );
+void auto_blend_premultiplied_analyzed_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height,
+                                               size_t bg_stride, uint8_t* overlay, uint32_t ov_width,
+                                               uint32_t ov_height, size_t ov_stride, int32_t start_x,
+                                               int32_t start_y, const alpha_info* info) {
+    blend_analyzed_with(kernels.blend_premultiplied_row, kernels.copy_row, 1, 1, background,
+                        bg_width, bg_height, bg_stride, overlay, ov_width, ov_height, ov_stride,
+                        start_x, start_y, info);
+}
 
-            // Almacenar los píxeles en el destino
-            _mm256_storeu_si256((__m256i*)(dst_row + x * channels), pixels);
-        }
+void auto_blend_mask(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height,
+                     uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y,
+                     uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(kernels.blend_mask_row, 1, dest, dest_width, dest_height, (size_t)dest_width * 4,
+                    mask, mask_width, mask_height, mask_width, start_x, start_y, r, g, b, a);
+}
 
-        // Procesar píxeles restantes
-        for (; x < dst_width; x++) {
-            uint32_t src_x = (x * x_ratio) >> 16;
-            *(uint32_t*)(dst_row + x * channels) = *(uint32_t*)(src_row + src_x * channels);
-        }
-    }
+void auto_blend_mask_strided(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride,
+                             uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride,
+                             int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a) {
+    blend_mask_with(kernels.blend_mask_row, 1, dest, dest_width, dest_height, dest_stride,
+                    mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a);
 }
-#else
-void nearest_neighbor_resize_avx2(uint8_t* src, uint8_t* dst,
-                                  uint32_t src_width, uint32_t src_height,
-                                  uint32_t dst_width, uint32_t dst_height) {
-    nearest_neighbor_resize(src, dst, src_width, src_height, dst_width, dst_height);
+
+int auto_convert_pixels(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format,
+                        uint32_t width, uint32_t height) {
+    return convert_pixels_with(kernels.formats, 1, src, src_format, 0, dst, dst_format, 0, width, height);
 }
-#endif
 
+int auto_convert_pixels_strided(const uint8_t* src, uint32_t src_format, size_t src_stride,
+                                uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height) {
+    return convert_pixels_with(kernels.formats, 1, src, src_format, src_stride, dst, dst_format, dst_stride,
+                               width, height);
+}
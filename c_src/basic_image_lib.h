@@ -20,26 +20,271 @@
 #include <arm_neon.h>
 #endif
 
-#if defined(__AVX2__)
+// AVX2 kernels are always compiled on x86_64 with per-function target
+// attributes; whether they are used is decided at runtime by init_dispatch().
+#if defined(__x86_64__) || defined(_M_X64)
 #define HAS_AVX2 1
 #else
 #define HAS_AVX2 0
 #endif
 
+#if defined(__GNUC__) || defined(__clang__)
+#define TARGET_AVX2 __attribute__((target("avx2")))
+#else
+#define TARGET_AVX2
+#endif
+
+#if defined(__ARM_NEON)
+#define HAS_NEON 1
+#else
+#define HAS_NEON 0
+#endif
+
+#define CPU_FEATURE_AVX2 1
+#define CPU_FEATURE_NEON 2
+
 uint8_t* create_image_rgba(uint32_t width, uint32_t height);
 void free_image_rgba(uint8_t* image_data);
+
+typedef struct {
+    uint64_t limit_bytes;
+    uint64_t cached_bytes;
+    uint64_t cached_blocks;
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t evictions;
+} pool_stats;
+
+void pool_set_limit(uint64_t limit_bytes);
+uint64_t pool_trim(uint64_t max_bytes);
+void pool_get_stats(pool_stats* stats);
+void set_huge_page_threshold(uint64_t bytes);
+
 void fill_image_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
 void fill_image_rgba_avx2(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
 void fill_image_rgba_neon(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void fill_image_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void fill_image_rgba_strided_avx2(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void fill_image_rgba_strided_neon(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
 void blend(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
 void blend_avx2(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
 void blend_neon(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
+void blend_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y);
+void blend_strided_avx2(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y);
+void blend_strided_neon(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y);
+void blend_mask(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height, uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void blend_mask_avx2(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height, uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void blend_mask_neon(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height, uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void blend_mask_strided(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void blend_mask_strided_avx2(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void blend_mask_strided_neon(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void premultiply(uint8_t* image_data, uint32_t width, uint32_t height);
+void premultiply_avx2(uint8_t* image_data, uint32_t width, uint32_t height);
+void premultiply_neon(uint8_t* image_data, uint32_t width, uint32_t height);
+void unpremultiply(uint8_t* image_data, uint32_t width, uint32_t height);
+void unpremultiply_avx2(uint8_t* image_data, uint32_t width, uint32_t height);
+void unpremultiply_neon(uint8_t* image_data, uint32_t width, uint32_t height);
+void multiply_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void multiply_rgba_avx2(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void multiply_rgba_neon(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void multiply_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void multiply_rgba_strided_avx2(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void multiply_rgba_strided_neon(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void blend_premultiplied(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
+void blend_premultiplied_avx2(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
+void blend_premultiplied_neon(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
 void blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y);
 void blit_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y);
 void blit_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y);
+void blit_strided(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, int32_t start_x, int32_t start_y);
+void blit_strided_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, int32_t start_x, int32_t start_y);
+void blit_strided_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, int32_t start_x, int32_t start_y);
 void blit_same_size(uint8_t* src, uint8_t* dst, uint32_t width, uint32_t height, uint32_t channels);
-void nearest_neighbor_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
-void nearest_neighbor_resize_avx2(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
-void nearest_neighbor_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int blit_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height, int32_t start_x, int32_t start_y);
+int blend_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height, int32_t start_x, int32_t start_y);
+
+#define PIXEL_FORMAT_RGBA 0
+#define PIXEL_FORMAT_BGRA 1
+#define PIXEL_FORMAT_ARGB 2
+#define PIXEL_FORMAT_RGB24 3
+#define PIXEL_FORMAT_A8 4
+#define PIXEL_FORMAT_COUNT 5
+
+int convert_pixels(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format, uint32_t width, uint32_t height);
+int convert_pixels_avx2(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format, uint32_t width, uint32_t height);
+int convert_pixels_neon(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format, uint32_t width, uint32_t height);
+int convert_pixels_strided(const uint8_t* src, uint32_t src_format, size_t src_stride, uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height);
+int convert_pixels_strided_avx2(const uint8_t* src, uint32_t src_format, size_t src_stride, uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height);
+int convert_pixels_strided_neon(const uint8_t* src, uint32_t src_format, size_t src_stride, uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height);
+
+int nearest_neighbor_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int nearest_neighbor_resize_avx2(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int nearest_neighbor_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int nearest_neighbor_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int nearest_neighbor_resize_strided_avx2(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int nearest_neighbor_resize_strided_neon(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int bilinear_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int bilinear_resize_avx2(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int bilinear_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int bilinear_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int bilinear_resize_strided_avx2(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int bilinear_resize_strided_neon(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int area_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int area_resize_avx2(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int area_resize_neon(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int area_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int area_resize_strided_avx2(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int area_resize_strided_neon(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+void resample_cache_clear(void);
+int scaled_blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int scaled_blit_avx2(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int scaled_blit_neon(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int scaled_blend(uint8_t* background, uint32_t bg_width, uint32_t bg_height, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int scaled_blend_avx2(uint8_t* background, uint32_t bg_width, uint32_t bg_height, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int scaled_blend_neon(uint8_t* background, uint32_t bg_width, uint32_t bg_height, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+
+void set_num_threads(uint32_t num_threads);
+uint32_t get_num_threads(void);
+void set_parallel_threshold(uint64_t pixels);
+void set_streaming_threshold(uint64_t bytes);
+uint64_t get_streaming_threshold(void);
+
+void init_dispatch(void);
+uint32_t cpu_features(void);
+const char* simd_tier(void);
+
+#define STATS_TIER_SCALAR 0
+#define STATS_TIER_AVX2 1
+#define STATS_TIER_NEON 2
+#define STATS_TIERS 3
+
+typedef struct {
+    uint64_t calls;
+    uint64_t pixels;
+    uint64_t bytes;
+    uint64_t total_ns;
+    uint64_t max_ns;
+} kernel_stats;
+
+void stats_enable(int enabled);
+int stats_enabled(void);
+uint32_t stats_op_count(void);
+const char* stats_op_name(uint32_t op);
+void stats_get(uint32_t op, uint32_t tier, kernel_stats* stats);
+void stats_reset(void);
+
+void auto_fill_image_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void auto_fill_image_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void auto_blend(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
+void auto_blend_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y);
+void auto_blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y);
+void auto_blit_strided(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, int32_t start_x, int32_t start_y);
+int auto_blit_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height, int32_t start_x, int32_t start_y);
+int auto_blend_region(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, uint32_t region_x, uint32_t region_y, uint32_t region_width, uint32_t region_height, int32_t start_x, int32_t start_y);
+int auto_nearest_neighbor_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int auto_nearest_neighbor_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int auto_bilinear_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int auto_bilinear_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int auto_area_resize(uint8_t* src, uint8_t* dst, uint32_t src_width, uint32_t src_height, uint32_t dst_width, uint32_t dst_height);
+int auto_area_resize_strided(uint8_t* src, uint32_t src_width, uint32_t src_height, size_t src_stride, uint8_t* dst, uint32_t dst_width, uint32_t dst_height, size_t dst_stride);
+int auto_scaled_blit(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, uint8_t* src_image, uint32_t src_width, uint32_t src_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int auto_scaled_blit_strided(uint8_t* dest_image, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* src_image, uint32_t src_width, uint32_t src_height, size_t src_stride, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int auto_scaled_blend(uint8_t* background, uint32_t bg_width, uint32_t bg_height, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+int auto_scaled_blend_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y, uint32_t width, uint32_t height);
+void auto_premultiply(uint8_t* image_data, uint32_t width, uint32_t height);
+void auto_premultiply_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride);
+void auto_unpremultiply(uint8_t* image_data, uint32_t width, uint32_t height);
+void auto_unpremultiply_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride);
+void auto_multiply_rgba(uint8_t* image_data, uint32_t width, uint32_t height, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void auto_multiply_rgba_strided(uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void auto_blend_premultiplied(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y);
+void auto_blend_premultiplied_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y);
+int auto_convert_pixels(const uint8_t* src, uint32_t src_format, uint8_t* dst, uint32_t dst_format, uint32_t width, uint32_t height);
+int auto_convert_pixels_strided(const uint8_t* src, uint32_t src_format, size_t src_stride, uint8_t* dst, uint32_t dst_format, size_t dst_stride, uint32_t width, uint32_t height);
+void auto_blend_mask(uint8_t* dest, uint8_t* mask, uint32_t dest_width, uint32_t dest_height, uint32_t mask_width, uint32_t mask_height, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+void auto_blend_mask_strided(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, uint8_t* mask, uint32_t mask_width, uint32_t mask_height, size_t mask_stride, int32_t start_x, int32_t start_y, uint8_t r, uint8_t g, uint8_t b, uint8_t a);
+
+#define DRAW_OP_BLIT 0
+#define DRAW_OP_BLEND 1
+#define DRAW_OP_BLEND_PREMULTIPLIED 2
+#define DRAW_BIN_TILES 1
+
+typedef struct {
+    uint8_t* image;
+    uint32_t width;
+    uint32_t height;
+    int32_t x;
+    int32_t y;
+    uint32_t op;
+    uint32_t stride;  // source row pitch in bytes, 0 for width * 4
+} draw_command;
+
+void draw_batch(uint8_t* background, uint32_t bg_width, uint32_t bg_height, const draw_command* commands, uint32_t count, uint32_t flags);
+void draw_batch_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, const draw_command* commands, uint32_t count, uint32_t flags);
+
+typedef struct {
+    uint32_t atlas_x;
+    uint32_t atlas_y;
+    uint32_t width;
+    uint32_t height;
+    int32_t x;
+    int32_t y;
+    uint8_t r;
+    uint8_t g;
+    uint8_t b;
+    uint8_t a;
+} mask_command;
+
+void blend_mask_batch(uint8_t* dest, uint32_t dest_width, uint32_t dest_height, size_t dest_stride, const uint8_t* atlas, uint32_t atlas_width, uint32_t atlas_height, size_t atlas_stride, const mask_command* commands, uint32_t count, uint32_t flags);
+
+#define DAMAGE_MAX_RECTS 32
+
+typedef struct {
+    int32_t x;
+    int32_t y;
+    uint32_t width;
+    uint32_t height;
+} image_rect;
+
+typedef struct {
+    uint32_t bound_width;
+    uint32_t bound_height;
+    uint32_t count;
+    image_rect rects[DAMAGE_MAX_RECTS];
+} damage_list;
+
+void damage_init(damage_list* damage, uint32_t width, uint32_t height);
+void damage_clear(damage_list* damage);
+void damage_add(damage_list* damage, int32_t x, int32_t y, uint32_t width, uint32_t height);
+void damage_add_commands(damage_list* damage, const draw_command* commands, uint32_t count);
+void recompose_damaged(uint8_t* dest, const uint8_t* clean, uint32_t width, uint32_t height, const draw_command* commands, uint32_t count, const damage_list* damage);
+void recompose_damaged_strided(uint8_t* dest, size_t dest_stride, const uint8_t* clean, size_t clean_stride, uint32_t width, uint32_t height, const draw_command* commands, uint32_t count, const damage_list* damage);
+int64_t diff_regions(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height, uint32_t tile, damage_list* damage);
+int64_t diff_regions_avx2(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height, uint32_t tile, damage_list* damage);
+int64_t diff_regions_neon(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height, uint32_t tile, damage_list* damage);
+int64_t diff_regions_strided(const uint8_t* prev, size_t prev_stride, const uint8_t* cur, size_t cur_stride, uint32_t width, uint32_t height, uint32_t tile, damage_list* damage);
+
+#define ALPHA_OPAQUE 1
+#define ALPHA_TRANSPARENT 2
+#define ALPHA_CLEAR 4
+
+typedef struct {
+    uint32_t flags;
+    image_rect bounds;
+    image_rect nonzero_bounds;
+} alpha_info;
+
+void analyze_alpha(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info);
+void analyze_alpha_avx2(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info);
+void analyze_alpha_neon(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info);
+void auto_analyze_alpha(const uint8_t* image_data, uint32_t width, uint32_t height, alpha_info* info);
+void auto_analyze_alpha_strided(const uint8_t* image_data, uint32_t width, uint32_t height, size_t stride, alpha_info* info);
+int64_t auto_diff_regions(const uint8_t* prev, const uint8_t* cur, uint32_t width, uint32_t height, uint32_t tile, damage_list* damage);
+int64_t auto_diff_regions_strided(const uint8_t* prev, size_t prev_stride, const uint8_t* cur, size_t cur_stride, uint32_t width, uint32_t height, uint32_t tile, damage_list* damage);
+void blend_analyzed(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, const alpha_info* info);
+void auto_blend_analyzed(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, const alpha_info* info);
+void auto_blend_analyzed_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y, const alpha_info* info);
+void auto_blend_premultiplied_analyzed(uint8_t* background, uint8_t* overlay, uint32_t bg_width, uint32_t bg_height, uint32_t ov_width, uint32_t ov_height, int32_t start_x, int32_t start_y, const alpha_info* info);
+void auto_blend_premultiplied_analyzed_strided(uint8_t* background, uint32_t bg_width, uint32_t bg_height, size_t bg_stride, uint8_t* overlay, uint32_t ov_width, uint32_t ov_height, size_t ov_stride, int32_t start_x, int32_t start_y, const alpha_info* info);
 
 #endif
\ No newline at end of file
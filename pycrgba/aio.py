@@ -0,0 +1,191 @@
+"""
+Asyncio support for pycrgba.
+
+The kernels release the GIL while they run, so they can run on a worker
+thread while the event loop keeps serving other tasks. The coroutines here
+submit kernels to a dedicated executor and return when they finish.
+`FrameRing` passes a fixed set of preallocated frames between a rendering
+task and a consuming (encoding, sending) task, so frame N+1 is rendered
+while frame N is consumed:
+
+```python
+from pycrgba import aio
+
+ring = aio.FrameRing(3840, 2160, count=3)
+
+async def render():
+    while True:
+        async with ring.render() as frame:          # waits for a free frame
+            await aio.blit(frame, background)
+            await aio.draw(sprites, frame)
+
+async def send():
+    while True:
+        async with ring.consume() as frame:         # oldest rendered frame
+            await encode(frame)
+```
+"""
+
+import asyncio
+import contextlib
+import functools
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .pycrgba import Image, DrawList, DamageTracker
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> Executor:
+    """Returns the executor the coroutines run kernels on, creating the default one on first use.
+
+    The default has a single worker thread, so kernels run one at a time and
+    in the order they were submitted, even when several calls on the same
+    image are in flight. Large kernels still use every core through
+    set_num_threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pycrgba")
+        return _executor
+
+def set_executor(executor: Optional[Executor] = None):
+    """Runs later kernels on executor; None goes back to a new default executor.
+
+    The previous executor is not shut down; the caller owns any executor it
+    passes in. With more than one worker, calls that touch the same image
+    must be awaited one after another.
+    """
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+async def run(function: Callable, *args, **kwargs):
+    """Calls function(*args, **kwargs) on the kernel executor and returns its result.
+
+    Any pycrgba function or Image method can be passed, e.g.
+    ``await aio.run(auto_blend, bg.data, ov.data, ...)``. Cancelling the
+    awaiting task does not stop a kernel that has already started. The
+    images involved must not be used from the event loop thread until the
+    call completes.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(function, *args, **kwargs))
+
+async def fill(image: Image, r: int, g: int, b: int, a: int):
+    await run(image.fill, r, g, b, a)
+
+async def blit(dest: Image, src: Image, x: int = 0, y: int = 0):
+    await run(dest.blit, src, x, y)
+
+async def blend(dest: Image, overlay: Image, x: int = 0, y: int = 0):
+    await run(dest.blend, overlay, x, y)
+
+async def blend_premultiplied(dest: Image, overlay: Image, x: int = 0, y: int = 0):
+    await run(dest.blend_premultiplied, overlay, x, y)
+
+async def scaled_blit(dest: Image, src: Image, x: int, y: int, width: int, height: int):
+    await run(dest.scaled_blit, src, x, y, width, height)
+
+async def scaled_blend(dest: Image, overlay: Image, x: int, y: int, width: int, height: int):
+    await run(dest.scaled_blend, overlay, x, y, width, height)
+
+async def resize_into(src: Image, dst: Image, filter: str = "nearest"):
+    await run(src.resize_into, dst, filter)
+
+async def resized(src: Image, width: int, height: int, filter: str = "nearest") -> Image:
+    return await run(src.resized, width, height, filter)
+
+async def draw(draw_list: DrawList, dest: Image):
+    await run(draw_list.draw, dest)
+
+async def export_pixels(image: Image, obj, format: str, stride: int = None):
+    await run(image.export_pixels, obj, format, stride)
+
+async def to_bytes(image: Image, format: str = "rgba") -> bytes:
+    return await run(image.to_bytes, format)
+
+async def diff(current: Image, previous: Image, tile: int = 64) -> DamageTracker:
+    return await run(current.diff, previous, tile)
+
+class FrameRing:
+    """count preallocated frames cycling between a renderer and a consumer.
+
+    A frame is free, being rendered, waiting to be consumed, or being
+    consumed. render() hands out free frames and queues them for the
+    consumer when the block ends; consume() hands them out in the same order
+    and frees them again when its block ends. With count=2 rendering overlaps
+    consuming (double buffering); count=3 also absorbs one slow frame on
+    either side. Nothing is allocated after construction.
+    """
+
+    def __init__(self, width: int, height: int, count: int = 3):
+        if count < 1:
+            raise ValueError(f"a frame ring needs at least one frame, got {count}")
+        self.width = width
+        self.height = height
+        self.frames = [Image(width, height) for _ in range(count)]
+        self._free = asyncio.Queue()
+        self._ready = asyncio.Queue()
+        for frame in self.frames:
+            self._free.put_nowait(frame)
+
+    def __enter__(self) -> "FrameRing":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self) -> str:
+        return (f"<pycrgba.aio.FrameRing {self.width}x{self.height} count={len(self.frames)} "
+                f"free={self._free.qsize()} ready={self._ready.qsize()}>")
+
+    def _check(self, frame: Image):
+        if not any(frame is own for own in self.frames):
+            raise ValueError("frame does not belong to this ring")
+
+    async def acquire(self) -> Image:
+        """Returns a free frame to render into, waiting while every frame is in use."""
+        return await self._free.get()
+
+    def submit(self, frame: Image):
+        """Queues a rendered frame for the consumer."""
+        self._check(frame)
+        self._ready.put_nowait(frame)
+
+    async def next(self) -> Image:
+        """Returns the oldest submitted frame, waiting until one is submitted."""
+        return await self._ready.get()
+
+    def release(self, frame: Image):
+        """Hands a frame back to the renderer, after it was consumed or when rendering it was abandoned."""
+        self._check(frame)
+        self._free.put_nowait(frame)
+
+    @contextlib.asynccontextmanager
+    async def render(self):
+        """Yields a free frame and submits it when the block ends; if the block raises, the frame is released instead."""
+        frame = await self.acquire()
+        try:
+            yield frame
+        except BaseException:
+            self.release(frame)
+            raise
+        self.submit(frame)
+
+    @contextlib.asynccontextmanager
+    async def consume(self):
+        """Yields the oldest rendered frame and releases it when the block ends."""
+        frame = await self.next()
+        try:
+            yield frame
+        finally:
+            self.release(frame)
+
+    def close(self):
+        """Frees every frame; the ring must not be used afterwards."""
+        for frame in self.frames:
+            frame.close()
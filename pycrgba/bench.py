@@ -0,0 +1,347 @@
+"""
+Kernel benchmarks for pycrgba.
+
+Every kernel variant (scalar, avx2, neon, auto) is timed with
+`time.perf_counter_ns` after a warm-up, over a sweep of image sizes and
+placements, and reported as median/p95/p99 latency plus GB/s. Results can be
+written as JSON and compared against a stored baseline:
+
+```
+python -m pycrgba.bench --output baseline.json
+python -m pycrgba.bench --baseline baseline.json --tolerance 0.10   # exits 1 on a slowdown
+python -m pycrgba.bench --kernels blend,blit --sizes 1920x1080 --offsets origin,negative
+```
+"""
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+from typing import Callable, Optional
+
+from . import pycrgba as _pycrgba
+from .pycrgba import Image, CPU_FEATURE_AVX2, CPU_FEATURE_NEON, PIXEL_FORMAT_RGBA, PIXEL_FORMAT_BGRA
+
+SIZES = {
+    "sprite": (64, 64),
+    "tile": (256, 256),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+
+# Where a source of the benchmarked size is placed on a destination of the same
+# size: aligned, one pixel off, half outside to the top-left, half outside to
+# the bottom-right. Kernels without a placement only run at "origin".
+OFFSETS = {
+    "origin": lambda w, h: (0, 0),
+    "odd": lambda w, h: (1, 1),
+    "negative": lambda w, h: (-(w // 2), -(h // 2)),
+    "clipped": lambda w, h: (w // 2, h // 2),
+}
+
+VARIANTS = ("scalar", "avx2", "neon", "auto")
+
+
+def _visible(width: int, height: int, x: int, y: int) -> int:
+    # Destination pixels a width x height source at (x, y) covers on a width x height destination.
+    return max(0, min(x + width, width) - max(x, 0)) * max(0, min(y + height, height) - max(y, 0))
+
+
+def _fill(fn, width, height, x, y):
+    image = Image(width, height)
+    return lambda: fn(image.data, width, height, 1, 2, 3, 255), width * height * 4
+
+
+def _multiply(fn, width, height, x, y):
+    image = Image(width, height)
+    image.fill(200, 100, 50, 255)
+    return lambda: fn(image.data, width, height, 128, 128, 128, 128), width * height * 8
+
+
+def _placed(bytes_per_pixel: int, prepare: Optional[Callable] = None):
+    # Source and destination are separate images, so nothing is copied onto itself.
+    def setup(fn, width, height, x, y):
+        dest, src = Image(width, height), Image(width, height)
+        dest.fill(40, 80, 120, 255)
+        src.fill(200, 100, 50, 128)
+        if prepare is not None:
+            prepare(dest, src)
+        return (lambda: fn(dest.data, src.data, width, height, width, height, x, y),
+                _visible(width, height, x, y) * bytes_per_pixel)
+    return setup
+
+
+def _blit(fn, width, height, x, y):
+    dest, src = Image(width, height), Image(width, height)
+    src.fill(200, 100, 50, 255)
+    return (lambda: fn(dest.data, width, height, src.data, width, height, x, y),
+            _visible(width, height, x, y) * 8)
+
+
+def _blit_same_size(fn, width, height, x, y):
+    dest, src = Image(width, height), Image(width, height)
+    return lambda: fn(src.data, dest.data, width, height, 4), width * height * 8
+
+
+def _blend_mask(fn, width, height, x, y):
+    dest = Image(width, height)
+    dest.fill(40, 80, 120, 255)
+    mask = _pycrgba._ffi.ffi.new("uint8_t[]", b"\x80" * (width * height))
+    return (lambda: fn(dest.data, mask, width, height, width, height, x, y, 255, 255, 255, 255),
+            _visible(width, height, x, y) * 9)
+
+
+def _resize(fn, width, height, x, y):
+    # Downscales by two, the common thumbnail/preview case.
+    dst_width, dst_height = max(1, width // 2), max(1, height // 2)
+    src, dst = Image(width, height), Image(dst_width, dst_height)
+    src.fill(200, 100, 50, 255)
+    return (lambda: fn(src.data, dst.data, width, height, dst_width, dst_height),
+            (width * height + dst_width * dst_height) * 4)
+
+
+def _convert(fn, width, height, x, y):
+    src, dst = Image(width, height), Image(width, height)
+    return (lambda: fn(src.data, PIXEL_FORMAT_RGBA, dst.data, PIXEL_FORMAT_BGRA, width, height),
+            width * height * 8)
+
+
+def _diff(fn, width, height, x, y):
+    # Identical frames: every tile is compared to the end, the worst case.
+    prev, cur = Image(width, height), Image(width, height)
+    prev.fill(1, 2, 3, 4)
+    cur.fill(1, 2, 3, 4)
+    damage = _pycrgba._ffi.ffi.new("damage_list*")
+    _pycrgba._lib.damage_init(damage, width, height)
+    return lambda: fn(prev.data, cur.data, width, height, 64, damage), width * height * 8
+
+
+# name -> (scalar function name, setup, takes a placement)
+KERNELS = {
+    "fill": ("fill_image_rgba", _fill, False),
+    "blit": ("blit", _blit, True),
+    "blit_same_size": ("blit_same_size", _blit_same_size, False),
+    "blend": ("blend", _placed(12), True),
+    "blend_premultiplied": ("blend_premultiplied", _placed(12, lambda dest, src: src.premultiply()), True),
+    "blend_mask": ("blend_mask", _blend_mask, True),
+    "nearest_resize": ("nearest_neighbor_resize", _resize, False),
+    "bilinear_resize": ("bilinear_resize", _resize, False),
+    "area_resize": ("area_resize", _resize, False),
+    "convert_bgra": ("convert_pixels", _convert, False),
+    "multiply": ("multiply_rgba", _multiply, False),
+    "diff_regions": ("diff_regions", _diff, False),
+}
+
+
+def available_variants() -> list:
+    """Returns the variants this CPU can really run; explicit SIMD entry points fall back to scalar otherwise."""
+    features = _pycrgba.cpu_features()
+    variants = ["scalar"]
+    if features & CPU_FEATURE_AVX2:
+        variants.append("avx2")
+    if features & CPU_FEATURE_NEON:
+        variants.append("neon")
+    variants.append("auto")
+    return variants
+
+
+def kernel_function(kernel: str, variant: str) -> Optional[Callable]:
+    """Returns the pycrgba function for a kernel variant, or None if the kernel has no such variant."""
+    name = KERNELS[kernel][0]
+    if variant == "auto":
+        name = "auto_" + name
+    elif variant != "scalar":
+        name = f"{name}_{variant}"
+    return getattr(_pycrgba, name, None)
+
+
+def percentile(samples: list, fraction: float) -> int:
+    """Nearest-rank percentile of an already sorted list."""
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+def measure(fn: Callable, warmup: int = 3, repeat: int = 20, min_time: float = 0.1, max_runs: int = 10000) -> list:
+    """Times fn after warmup calls. Runs at least repeat times and keeps going until min_time seconds have passed."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    deadline = time.perf_counter_ns() + int(min_time * 1e9)
+    while len(samples) < repeat or (time.perf_counter_ns() < deadline and len(samples) < max_runs):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    return samples
+
+
+def run(kernels=None, variants=None, sizes=None, offsets=None, warmup: int = 3, repeat: int = 20,
+        min_time: float = 0.1, log=None) -> dict:
+    """Benchmarks every kernel x variant x size x offset combination and returns the JSON-ready report."""
+    kernels = kernels or list(KERNELS)
+    variants = [v for v in (variants or VARIANTS) if v in available_variants()]
+    sizes = sizes or list(SIZES)
+    offsets = offsets or list(OFFSETS)
+    results = []
+
+    for kernel in kernels:
+        setup, placed = KERNELS[kernel][1], KERNELS[kernel][2]
+        for size in sizes:
+            width, height = parse_size(size)
+            for offset in (offsets if placed else ["origin"]):
+                x, y = OFFSETS[offset](width, height)
+                for variant in variants:
+                    fn = kernel_function(kernel, variant)
+                    if fn is None:
+                        continue
+                    call, nbytes = setup(fn, width, height, x, y)
+                    samples = measure(call, warmup, repeat, min_time)
+                    del call
+                    median = percentile(samples, 0.5)
+                    result = {
+                        "kernel": kernel,
+                        "variant": variant,
+                        "size": size,
+                        "width": width,
+                        "height": height,
+                        "offset": offset,
+                        "x": x,
+                        "y": y,
+                        "runs": len(samples),
+                        "bytes": nbytes,
+                        "min_ns": samples[0],
+                        "median_ns": median,
+                        "p95_ns": percentile(samples, 0.95),
+                        "p99_ns": percentile(samples, 0.99),
+                        "gb_per_s": nbytes / median if median else 0.0,
+                    }
+                    results.append(result)
+                    if log is not None:
+                        log(format_result(result))
+
+    return {"meta": machine_info(), "results": results}
+
+
+def machine_info() -> dict:
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "simd_tier": _pycrgba.simd_tier(),
+        "cpu_features": _pycrgba.cpu_features(),
+        "threads": _pycrgba.get_num_threads(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def parse_size(size: str) -> tuple:
+    """Accepts a SIZES name ("1080p") or WIDTHxHEIGHT."""
+    if size in SIZES:
+        return SIZES[size]
+    try:
+        width, height = (int(part) for part in size.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"size {size!r} is neither one of {', '.join(SIZES)} nor WIDTHxHEIGHT") from None
+    return width, height
+
+
+def result_key(result: dict) -> tuple:
+    return (result["kernel"], result["variant"], result["size"], result["offset"])
+
+
+def format_result(result: dict) -> str:
+    return (f"{result['kernel']:<20} {result['variant']:<7} {result['size']:>10} {result['offset']:<9}"
+            f" median {result['median_ns'] / 1000:>10.1f} us  p95 {result['p95_ns'] / 1000:>10.1f} us"
+            f"  p99 {result['p99_ns'] / 1000:>10.1f} us  {result['gb_per_s']:>7.2f} GB/s")
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.10) -> list:
+    """Returns (result, baseline result, ratio) for every median more than tolerance slower than the baseline."""
+    previous = {result_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        base = previous.get(result_key(result))
+        if base is None or not base["median_ns"]:
+            continue
+        ratio = result["median_ns"] / base["median_ns"]
+        if ratio > 1 + tolerance:
+            regressions.append((result, base, ratio))
+    return regressions
+
+
+def _split(value: Optional[str]) -> Optional[list]:
+    return [part.strip() for part in value.split(",") if part.strip()] if value else None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pycrgba.bench", description="Benchmarks pycrgba kernels.")
+    parser.add_argument("--kernels", help=f"comma-separated subset of: {', '.join(KERNELS)}")
+    parser.add_argument("--variants", help=f"comma-separated subset of: {', '.join(VARIANTS)} (default: all this CPU runs)")
+    parser.add_argument("--sizes", help=f"comma-separated {', '.join(SIZES)} or WIDTHxHEIGHT (default: all names)")
+    parser.add_argument("--offsets", help=f"comma-separated subset of: {', '.join(OFFSETS)}")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed calls before measuring (default: 3)")
+    parser.add_argument("--repeat", type=int, default=20, help="minimum timed calls (default: 20)")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimum seconds per case (default: 0.1)")
+    parser.add_argument("--threads", type=int, help="threads for the auto variants (default: one per CPU)")
+    parser.add_argument("--quick", action="store_true", help="sprite and 1080p only, fewer runs")
+    parser.add_argument("--output", "-o", help="write the JSON report to this file ('-' for stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare against; exits 1 on a slowdown")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed median slowdown (default: 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    kernels = _split(args.kernels)
+    for name in kernels or []:
+        if name not in KERNELS:
+            parser.error(f"unknown kernel {name!r}")
+    offsets = _split(args.offsets)
+    for name in offsets or []:
+        if name not in OFFSETS:
+            parser.error(f"unknown offset {name!r}")
+    sizes = _split(args.sizes)
+    try:
+        for size in sizes or []:
+            parse_size(size)
+    except ValueError as error:
+        parser.error(str(error))
+
+    repeat, min_time = args.repeat, args.min_time
+    if args.quick:
+        sizes = sizes or ["sprite", "1080p"]
+        repeat, min_time = min(repeat, 10), min(min_time, 0.02)
+    if args.threads is not None:
+        _pycrgba.set_num_threads(args.threads)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # The table goes to stderr when the JSON report is written to stdout.
+    out = sys.stderr if args.output == "-" else sys.stdout
+    report = run(kernels, _split(args.variants), sizes, offsets, args.warmup, repeat, min_time,
+                 log=lambda line: print(line, file=out, flush=True))
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for result, base, ratio in regressions:
+            print(f"SLOWER {result['kernel']} {result['variant']} {result['size']} {result['offset']}: "
+                  f"{base['median_ns'] / 1000:.1f} us -> {result['median_ns'] / 1000:.1f} us ({ratio:.2f}x)", file=out)
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}", file=out)
+            return 1
+        print(f"No case slower than the baseline by more than {args.tolerance:.0%}", file=out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
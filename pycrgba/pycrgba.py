@@ -1,107 +1,1918 @@
+import mmap
+import os
+import struct
+import sys
+import weakref
+from multiprocessing import shared_memory
 import pycrgba_cffi as _ffi
 from typing import Any
-import platform
 
-Image = Any
+ImageData = Any
 
-def create_image_rgba(width: int, height: int) -> Image:
+CPU_FEATURE_AVX2 = _ffi.lib.CPU_FEATURE_AVX2
+CPU_FEATURE_NEON = _ffi.lib.CPU_FEATURE_NEON
+DRAW_OP_BLIT = _ffi.lib.DRAW_OP_BLIT
+DRAW_OP_BLEND = _ffi.lib.DRAW_OP_BLEND
+DRAW_OP_BLEND_PREMULTIPLIED = _ffi.lib.DRAW_OP_BLEND_PREMULTIPLIED
+DRAW_BIN_TILES = _ffi.lib.DRAW_BIN_TILES
+DAMAGE_MAX_RECTS = _ffi.lib.DAMAGE_MAX_RECTS
+ALPHA_OPAQUE = _ffi.lib.ALPHA_OPAQUE
+ALPHA_TRANSPARENT = _ffi.lib.ALPHA_TRANSPARENT
+ALPHA_CLEAR = _ffi.lib.ALPHA_CLEAR
+PIXEL_FORMAT_RGBA = _ffi.lib.PIXEL_FORMAT_RGBA
+PIXEL_FORMAT_BGRA = _ffi.lib.PIXEL_FORMAT_BGRA
+PIXEL_FORMAT_ARGB = _ffi.lib.PIXEL_FORMAT_ARGB
+PIXEL_FORMAT_RGB24 = _ffi.lib.PIXEL_FORMAT_RGB24
+PIXEL_FORMAT_A8 = _ffi.lib.PIXEL_FORMAT_A8
+
+_ffi.lib.init_dispatch()
+
+_lib = _ffi.lib
+
+def create_image_rgba(width: int, height: int) -> ImageData:
     """Creates an RGBA image (4 bytes per pixel)."""
     return _ffi.lib.create_image_rgba(width, height)
 
-def free_image_rgba(image_data: Image):
+def free_image_rgba(image_data: ImageData):
     """Frees the memory allocated for an image."""
     _ffi.lib.free_image_rgba(image_data)
 
-def fill_image_rgba(image_data: Image, width: int, height: int, r: int, g: int, b: int, a: int):
+def pool_enable(limit_bytes: int = 256 * 1024 * 1024):
+    """Keeps freed image buffers in per-size free lists for reuse, caching at most limit_bytes."""
+    _ffi.lib.pool_set_limit(limit_bytes)
+
+def pool_disable():
+    """Stops pooling and releases every cached buffer."""
+    _ffi.lib.pool_set_limit(0)
+
+def pool_trim(max_bytes: int = 0) -> int:
+    """Releases least recently freed buffers until at most max_bytes stay cached. Returns the bytes released."""
+    return _ffi.lib.pool_trim(max_bytes)
+
+def set_huge_page_threshold(bytes: int):
+    """Requests transparent huge pages for image buffers of at least this many bytes (Linux). 0 disables it."""
+    _ffi.lib.set_huge_page_threshold(bytes)
+
+def pool_stats() -> dict:
+    """Returns the pool limit, cached bytes/blocks and hit, miss and eviction counters."""
+    stats = _ffi.ffi.new("pool_stats*")
+    _ffi.lib.pool_get_stats(stats)
+    return {
+        "limit_bytes": stats.limit_bytes,
+        "cached_bytes": stats.cached_bytes,
+        "cached_blocks": stats.cached_blocks,
+        "hits": stats.hits,
+        "misses": stats.misses,
+        "evictions": stats.evictions,
+    }
+
+def fill_image_rgba(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
     """Fills an image with a solid RGBA color."""
     _ffi.lib.fill_image_rgba(image_data, width, height, r, g, b, a)
 
-def fill_image_rgba_avx2(image_data: Image, width: int, height: int, r: int, g: int, b: int, a: int):
+def fill_image_rgba_avx2(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
     """Fills an image with a solid RGBA color using AVX2."""
     _ffi.lib.fill_image_rgba_avx2(image_data, width, height, r, g, b, a)
 
-def fill_image_rgba_neon(image_data: Image, width: int, height: int, r: int, g: int, b: int, a: int):
+def fill_image_rgba_neon(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
     """Fills an image with a solid RGBA color using NEON optimizations."""
     _ffi.lib.fill_image_rgba_neon(image_data, width, height, r, g, b, a)
 
-def blend(background: Image, overlay: Image, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+
+def fill_image_rgba_strided(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """Fills a width x height region whose rows are stride bytes apart with a solid RGBA color."""
+    _ffi.lib.fill_image_rgba_strided(image_data, width, height, stride, r, g, b, a)
+
+def fill_image_rgba_strided_avx2(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """Fills a width x height region whose rows are stride bytes apart with a solid RGBA color using AVX2."""
+    _ffi.lib.fill_image_rgba_strided_avx2(image_data, width, height, stride, r, g, b, a)
+
+def fill_image_rgba_strided_neon(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """Fills a width x height region whose rows are stride bytes apart with a solid RGBA color using NEON optimizations."""
+    _ffi.lib.fill_image_rgba_strided_neon(image_data, width, height, stride, r, g, b, a)
+
+def blend(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
     """Blends an image on top of another image with coordinates."""
     _ffi.lib.blend(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
 
-def blend_avx2(background: Image, overlay: Image, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+def blend_avx2(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
     """Blends an image on top of another image with coordinates using AVX2."""
     _ffi.lib.blend_avx2(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
 
-def blend_neon(background: Image, overlay: Image, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+def blend_neon(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
     """Blends an image on top of another image with coordinates using NEON optimizations."""
     _ffi.lib.blend_neon(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
 
-def blit(dest_image: Image, dest_width: int, dest_height: int, src_image: Image, src_width: int, src_height: int, start_x: int, start_y: int):
+
+def blend_strided(background: ImageData, bg_width: int, bg_height: int, bg_stride: int, overlay: ImageData, ov_width: int, ov_height: int, ov_stride: int, start_x: int, start_y: int):
+    """Blends like blend(), with the row pitch of each image given in bytes."""
+    _ffi.lib.blend_strided(background, bg_width, bg_height, bg_stride, overlay, ov_width, ov_height, ov_stride, start_x, start_y)
+
+def blend_strided_avx2(background: ImageData, bg_width: int, bg_height: int, bg_stride: int, overlay: ImageData, ov_width: int, ov_height: int, ov_stride: int, start_x: int, start_y: int):
+    """Blends like blend(), with the row pitch of each image given in bytes using AVX2."""
+    _ffi.lib.blend_strided_avx2(background, bg_width, bg_height, bg_stride, overlay, ov_width, ov_height, ov_stride, start_x, start_y)
+
+def blend_strided_neon(background: ImageData, bg_width: int, bg_height: int, bg_stride: int, overlay: ImageData, ov_width: int, ov_height: int, ov_stride: int, start_x: int, start_y: int):
+    """Blends like blend(), with the row pitch of each image given in bytes using NEON optimizations."""
+    _ffi.lib.blend_strided_neon(background, bg_width, bg_height, bg_stride, overlay, ov_width, ov_height, ov_stride, start_x, start_y)
+
+def blend_mask(dest: ImageData, mask: ImageData, dest_width: int, dest_height: int, mask_width: int, mask_height: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """Blends a solid color through a one-byte-per-pixel coverage mask, clipped like blend()."""
+    _ffi.lib.blend_mask(dest, mask, dest_width, dest_height, mask_width, mask_height, start_x, start_y, r, g, b, a)
+
+def blend_mask_avx2(dest: ImageData, mask: ImageData, dest_width: int, dest_height: int, mask_width: int, mask_height: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """Blends a solid color through a coverage mask using AVX2."""
+    _ffi.lib.blend_mask_avx2(dest, mask, dest_width, dest_height, mask_width, mask_height, start_x, start_y, r, g, b, a)
+
+def blend_mask_neon(dest: ImageData, mask: ImageData, dest_width: int, dest_height: int, mask_width: int, mask_height: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """Blends a solid color through a coverage mask using NEON optimizations."""
+    _ffi.lib.blend_mask_neon(dest, mask, dest_width, dest_height, mask_width, mask_height, start_x, start_y, r, g, b, a)
+
+def blend_mask_strided(dest: ImageData, dest_width: int, dest_height: int, dest_stride: int, mask: ImageData, mask_width: int, mask_height: int, mask_stride: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """Blends through a mask like blend_mask(), with the row pitch of each buffer given in bytes."""
+    _ffi.lib.blend_mask_strided(dest, dest_width, dest_height, dest_stride, mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a)
+
+def blend_mask_strided_avx2(dest: ImageData, dest_width: int, dest_height: int, dest_stride: int, mask: ImageData, mask_width: int, mask_height: int, mask_stride: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """Blends through a mask like blend_mask(), with the row pitch of each buffer given in bytes using AVX2."""
+    _ffi.lib.blend_mask_strided_avx2(dest, dest_width, dest_height, dest_stride, mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a)
+
+def blend_mask_strided_neon(dest: ImageData, dest_width: int, dest_height: int, dest_stride: int, mask: ImageData, mask_width: int, mask_height: int, mask_stride: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """Blends through a mask like blend_mask(), with the row pitch of each buffer given in bytes using NEON optimizations."""
+    _ffi.lib.blend_mask_strided_neon(dest, dest_width, dest_height, dest_stride, mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a)
+
+def premultiply(image_data: ImageData, width: int, height: int):
+    """Multiplies the color channels by alpha in place."""
+    _ffi.lib.premultiply(image_data, width, height)
+
+def premultiply_avx2(image_data: ImageData, width: int, height: int):
+    """Multiplies the color channels by alpha in place with AVX2."""
+    _ffi.lib.premultiply_avx2(image_data, width, height)
+
+def premultiply_neon(image_data: ImageData, width: int, height: int):
+    """Multiplies the color channels by alpha in place with NEON optimizations."""
+    _ffi.lib.premultiply_neon(image_data, width, height)
+
+def unpremultiply(image_data: ImageData, width: int, height: int):
+    """Divides the color channels by alpha in place, undoing premultiply."""
+    _ffi.lib.unpremultiply(image_data, width, height)
+
+def unpremultiply_avx2(image_data: ImageData, width: int, height: int):
+    """Divides the color channels by alpha in place, undoing premultiply with AVX2."""
+    _ffi.lib.unpremultiply_avx2(image_data, width, height)
+
+def unpremultiply_neon(image_data: ImageData, width: int, height: int):
+    """Divides the color channels by alpha in place, undoing premultiply with NEON optimizations."""
+    _ffi.lib.unpremultiply_neon(image_data, width, height)
+
+def multiply_rgba(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
+    """Scales every channel in place by the matching color channel / 255, e.g. (o, o, o, o) fades premultiplied pixels."""
+    _ffi.lib.multiply_rgba(image_data, width, height, r, g, b, a)
+
+def multiply_rgba_avx2(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
+    """Scales every channel in place by the matching color channel / 255 with AVX2 optimizations."""
+    _ffi.lib.multiply_rgba_avx2(image_data, width, height, r, g, b, a)
+
+def multiply_rgba_neon(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
+    """Scales every channel in place by the matching color channel / 255 with NEON optimizations."""
+    _ffi.lib.multiply_rgba_neon(image_data, width, height, r, g, b, a)
+
+def multiply_rgba_strided(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """multiply_rgba for a region whose rows are stride bytes apart."""
+    _ffi.lib.multiply_rgba_strided(image_data, width, height, stride, r, g, b, a)
+
+def multiply_rgba_strided_avx2(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """multiply_rgba_strided with AVX2 optimizations."""
+    _ffi.lib.multiply_rgba_strided_avx2(image_data, width, height, stride, r, g, b, a)
+
+def multiply_rgba_strided_neon(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """multiply_rgba_strided with NEON optimizations."""
+    _ffi.lib.multiply_rgba_strided_neon(image_data, width, height, stride, r, g, b, a)
+
+def blend_premultiplied(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+    """Blends a premultiplied overlay onto a premultiplied background ("over")."""
+    _ffi.lib.blend_premultiplied(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
+
+def blend_premultiplied_avx2(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+    """Blends a premultiplied overlay onto a premultiplied background ("over") with AVX2."""
+    _ffi.lib.blend_premultiplied_avx2(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
+
+def blend_premultiplied_neon(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+    """Blends a premultiplied overlay onto a premultiplied background ("over") with NEON optimizations."""
+    _ffi.lib.blend_premultiplied_neon(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
+
+def analyze_alpha(image_data: ImageData, width: int, height: int) -> Any:
+    """Returns an alpha_info* with the ALPHA_* flags and the boxes of non-zero alpha and non-zero pixels."""
+    info = _ffi.ffi.new("alpha_info*")
+    _ffi.lib.analyze_alpha(image_data, width, height, info)
+    return info
+
+def analyze_alpha_avx2(image_data: ImageData, width: int, height: int) -> Any:
+    """Returns an alpha_info* with the ALPHA_* flags and the boxes of non-zero alpha and non-zero pixels with AVX2."""
+    info = _ffi.ffi.new("alpha_info*")
+    _ffi.lib.analyze_alpha_avx2(image_data, width, height, info)
+    return info
+
+def analyze_alpha_neon(image_data: ImageData, width: int, height: int) -> Any:
+    """Returns an alpha_info* with the ALPHA_* flags and the boxes of non-zero alpha and non-zero pixels with NEON optimizations."""
+    info = _ffi.ffi.new("alpha_info*")
+    _ffi.lib.analyze_alpha_neon(image_data, width, height, info)
+    return info
+
+def blend_analyzed(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int, info: Any):
+    """Blends like blend(), but skips, copies or crops the overlay according to its analyze_alpha() info."""
+    _ffi.lib.blend_analyzed(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y, info)
+
+def blit(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int):
     """Blits an image to another image with different sizes."""
     _ffi.lib.blit(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y)
 
-def blit_neon(dest_image: Image, dest_width: int, dest_height: int, src_image: Image, src_width: int, src_height: int, start_x: int, start_y: int):
+def blit_neon(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int):
     """Blits an image to another image with different sizes using NEON optimizations."""
     _ffi.lib.blit_neon(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y)
 
-def blit_same_size(src: Image, dst: Image, width: int, height: int, channels: int):
+def blit_same_size(src: ImageData, dst: ImageData, width: int, height: int, channels: int):
     """Blits an image of the same size."""
     _ffi.lib.blit_same_size(src, dst, width, height, channels)
 
-def blit_avx2(dest_image: Image, dest_width: int, dest_height: int, src_image: Image, src_width: int, src_height: int, start_x: int, start_y: int):
+def blit_region(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, region_x: int, region_y: int, region_width: int, region_height: int, start_x: int, start_y: int):
+    """Copies the region_width x region_height rectangle at (region_x, region_y) of src onto dest at (start_x, start_y)."""
+    if _ffi.lib.blit_region(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, region_x, region_y, region_width, region_height, start_x, start_y) != 0:
+        raise ValueError("region is outside the source image")
+
+def blend_region(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, region_x: int, region_y: int, region_width: int, region_height: int, start_x: int, start_y: int):
+    """Blends the region_width x region_height rectangle at (region_x, region_y) of src onto dest at (start_x, start_y)."""
+    if _ffi.lib.blend_region(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, region_x, region_y, region_width, region_height, start_x, start_y) != 0:
+        raise ValueError("region is outside the source image")
+
+def convert_pixels(src: ImageData, src_format: int, dst: ImageData, dst_format: int, width: int, height: int):
+    """Converts packed pixels between PIXEL_FORMAT_* layouts; 4-byte formats may convert in place."""
+    if _ffi.lib.convert_pixels(src, src_format, dst, dst_format, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+
+def convert_pixels_avx2(src: ImageData, src_format: int, dst: ImageData, dst_format: int, width: int, height: int):
+    """Converts packed pixels between PIXEL_FORMAT_* layouts with AVX2; 4-byte formats may convert in place."""
+    if _ffi.lib.convert_pixels_avx2(src, src_format, dst, dst_format, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+
+def convert_pixels_neon(src: ImageData, src_format: int, dst: ImageData, dst_format: int, width: int, height: int):
+    """Converts packed pixels between PIXEL_FORMAT_* layouts with NEON optimizations; 4-byte formats may convert in place."""
+    if _ffi.lib.convert_pixels_neon(src, src_format, dst, dst_format, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+
+def convert_pixels_strided(src: ImageData, src_format: int, src_stride: int, dst: ImageData, dst_format: int, dst_stride: int, width: int, height: int):
+    """convert_pixels() with the row pitch of each buffer given in bytes (0 = packed)."""
+    if _ffi.lib.convert_pixels_strided(src, src_format, src_stride, dst, dst_format, dst_stride, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+
+def convert_pixels_strided_avx2(src: ImageData, src_format: int, src_stride: int, dst: ImageData, dst_format: int, dst_stride: int, width: int, height: int):
+    """convert_pixels() with the row pitch of each buffer given in bytes (0 = packed) with AVX2."""
+    if _ffi.lib.convert_pixels_strided_avx2(src, src_format, src_stride, dst, dst_format, dst_stride, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+
+def convert_pixels_strided_neon(src: ImageData, src_format: int, src_stride: int, dst: ImageData, dst_format: int, dst_stride: int, width: int, height: int):
+    """convert_pixels() with the row pitch of each buffer given in bytes (0 = packed) with NEON optimizations."""
+    if _ffi.lib.convert_pixels_strided_neon(src, src_format, src_stride, dst, dst_format, dst_stride, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+
+def blit_avx2(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int):
     """Blits an image to another image with different sizes using AVX2."""
     _ffi.lib.blit_avx2(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y)
 
-def nearest_neighbor_resize(src: Image, dst: Image, src_width: int, src_height: int, dst_width: int, dst_height: int):
+
+def blit_strided(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, start_x: int, start_y: int):
+    """Blits like blit(), with the row pitch of each image given in bytes."""
+    _ffi.lib.blit_strided(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, start_x, start_y)
+
+def blit_strided_avx2(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, start_x: int, start_y: int):
+    """Blits like blit(), with the row pitch of each image given in bytes using AVX2."""
+    _ffi.lib.blit_strided_avx2(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, start_x, start_y)
+
+def blit_strided_neon(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, start_x: int, start_y: int):
+    """Blits like blit(), with the row pitch of each image given in bytes using NEON optimizations."""
+    _ffi.lib.blit_strided_neon(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, start_x, start_y)
+
+def nearest_neighbor_resize(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
     """Resizes an image using nearest neighbor interpolation."""
-    _ffi.lib.nearest_neighbor_resize(src, dst, src_width, src_height, dst_width, dst_height)
+    if _ffi.lib.nearest_neighbor_resize(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
 
-def nearest_neighbor_resize_avx2(src: Image, dst: Image, src_width: int, src_height: int, dst_width: int, dst_height: int):
+def nearest_neighbor_resize_avx2(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
     """Resizes an image using nearest neighbor interpolation with AVX2."""
-    _ffi.lib.nearest_neighbor_resize_avx2(src, dst, src_width, src_height, dst_width, dst_height)
+    if _ffi.lib.nearest_neighbor_resize_avx2(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
 
-def nearest_neighbor_resize_neon(src: Image, dst: Image, src_width: int, src_height: int, dst_width: int, dst_height: int):
+def nearest_neighbor_resize_neon(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
     """Resizes an image using nearest neighbor interpolation with NEON optimizations."""
-    _ffi.lib.nearest_neighbor_resize_neon(src, dst, src_width, src_height, dst_width, dst_height)
-
-def _is_arm():
-    return platform.machine().startswith('arm') or platform.machine().startswith('aarch')
-
-def _is_x86_64():
-    return platform.machine() == 'x86_64' or platform.machine() == 'AMD64'
-
-def auto_fill_image_rgba(image_data: Image, width: int, height: int, r: int, g: int, b: int, a: int):
-    """Automatically selects the best fill_image_rgba function based on hardware."""
-    if _is_arm():
-        fill_image_rgba_neon(image_data, width, height, r, g, b, a)
-    elif _is_x86_64():
-        fill_image_rgba_avx2(image_data, width, height, r, g, b, a)
-    else:
-        fill_image_rgba(image_data, width, height, r, g, b, a)
-
-def auto_blend(background: Image, overlay: Image, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
-    """Automatically selects the best blend function based on hardware."""
-    if _is_arm():
-        blend_neon(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
-    elif _is_x86_64():
-        blend_avx2(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
-    else:
-        blend(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
-
-def auto_blit(dest_image: Image, dest_width: int, dest_height: int, src_image: Image, src_width: int, src_height: int, start_x: int, start_y: int):
-    """Automatically selects the best blit function based on hardware."""
-    if _is_arm():
-        blit_neon(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y)
-    elif _is_x86_64():
-        blit_avx2(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y)
-    else:
-        blit(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y)
-
-def auto_nearest_neighbor_resize(src: Image, dst: Image, src_width: int, src_height: int, dst_width: int, dst_height: int):
-    """Automatically selects the best nearest neighbor resize function based on hardware."""
-    if _is_arm():
-        nearest_neighbor_resize_neon(src, dst, src_width, src_height, dst_width, dst_height)
-    elif _is_x86_64():
-        nearest_neighbor_resize_avx2(src, dst, src_width, src_height, dst_width, dst_height)
-    else:
-        nearest_neighbor_resize(src, dst, src_width, src_height, dst_width, dst_height)
+    if _ffi.lib.nearest_neighbor_resize_neon(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+
+def nearest_neighbor_resize_strided(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like nearest_neighbor_resize(), with the row pitch of each image given in bytes."""
+    if _ffi.lib.nearest_neighbor_resize_strided(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def nearest_neighbor_resize_strided_avx2(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like nearest_neighbor_resize(), with the row pitch of each image given in bytes using AVX2."""
+    if _ffi.lib.nearest_neighbor_resize_strided_avx2(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def nearest_neighbor_resize_strided_neon(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like nearest_neighbor_resize(), with the row pitch of each image given in bytes using NEON optimizations."""
+    if _ffi.lib.nearest_neighbor_resize_strided_neon(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def bilinear_resize(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes an image using bilinear interpolation."""
+    if _ffi.lib.bilinear_resize(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def bilinear_resize_avx2(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes an image using bilinear interpolation with AVX2."""
+    if _ffi.lib.bilinear_resize_avx2(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def bilinear_resize_neon(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes an image using bilinear interpolation with NEON optimizations."""
+    if _ffi.lib.bilinear_resize_neon(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+
+def bilinear_resize_strided(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like bilinear_resize(), with the row pitch of each image given in bytes."""
+    if _ffi.lib.bilinear_resize_strided(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def bilinear_resize_strided_avx2(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like bilinear_resize(), with the row pitch of each image given in bytes using AVX2."""
+    if _ffi.lib.bilinear_resize_strided_avx2(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def bilinear_resize_strided_neon(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like bilinear_resize(), with the row pitch of each image given in bytes using NEON optimizations."""
+    if _ffi.lib.bilinear_resize_strided_neon(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def area_resize(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes an image using area averaging (box filter), best for downscaling."""
+    if _ffi.lib.area_resize(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def area_resize_avx2(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes an image using area averaging (box filter), best for downscaling with AVX2."""
+    if _ffi.lib.area_resize_avx2(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def area_resize_neon(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes an image using area averaging (box filter), best for downscaling with NEON optimizations."""
+    if _ffi.lib.area_resize_neon(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+
+def area_resize_strided(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like area_resize(), with the row pitch of each image given in bytes."""
+    if _ffi.lib.area_resize_strided(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def area_resize_strided_avx2(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like area_resize(), with the row pitch of each image given in bytes using AVX2."""
+    if _ffi.lib.area_resize_strided_avx2(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def area_resize_strided_neon(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Resizes like area_resize(), with the row pitch of each image given in bytes using NEON optimizations."""
+    if _ffi.lib.area_resize_strided_neon(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def scaled_blit(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Copies src_image, resized to width x height (nearest neighbor), onto dest_image at (start_x, start_y)."""
+    if _ffi.lib.scaled_blit(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def scaled_blit_avx2(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Copies src_image, resized to width x height (nearest neighbor), onto dest_image at (start_x, start_y) with AVX2."""
+    if _ffi.lib.scaled_blit_avx2(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def scaled_blit_neon(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Copies src_image, resized to width x height (nearest neighbor), onto dest_image at (start_x, start_y) with NEON optimizations."""
+    if _ffi.lib.scaled_blit_neon(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def scaled_blend(background: ImageData, bg_width: int, bg_height: int, overlay: ImageData, ov_width: int, ov_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Blends overlay, resized to width x height (nearest neighbor), onto background at (start_x, start_y)."""
+    if _ffi.lib.scaled_blend(background, bg_width, bg_height, overlay, ov_width, ov_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def scaled_blend_avx2(background: ImageData, bg_width: int, bg_height: int, overlay: ImageData, ov_width: int, ov_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Blends overlay, resized to width x height (nearest neighbor), onto background at (start_x, start_y) with AVX2."""
+    if _ffi.lib.scaled_blend_avx2(background, bg_width, bg_height, overlay, ov_width, ov_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def scaled_blend_neon(background: ImageData, bg_width: int, bg_height: int, overlay: ImageData, ov_width: int, ov_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Blends overlay, resized to width x height (nearest neighbor), onto background at (start_x, start_y) with NEON optimizations."""
+    if _ffi.lib.scaled_blend_neon(background, bg_width, bg_height, overlay, ov_width, ov_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def resample_cache_clear():
+    """Frees the cached bilinear/area coefficient tables."""
+    _ffi.lib.resample_cache_clear()
+
+def cpu_features() -> int:
+    """Returns the CPU feature bits (CPU_FEATURE_AVX2, CPU_FEATURE_NEON) detected at import."""
+    return _ffi.lib.cpu_features()
+
+def simd_tier() -> str:
+    """Returns the SIMD tier used by the auto_* functions: "avx2", "neon" or "scalar"."""
+    return _ffi.ffi.string(_ffi.lib.simd_tier()).decode()
+
+_STATS_TIERS = ("scalar", "avx2", "neon")
+
+def enable_stats(enabled: bool = True):
+    """Turns the per-kernel call, pixel, byte and time counters on or off (off by default)."""
+    _ffi.lib.stats_enable(1 if enabled else 0)
+    if enabled and not _ffi.lib.stats_enabled():
+        raise RuntimeError("pycrgba was built with PYCRGBA_NO_STATS")
+
+def stats_enabled() -> bool:
+    """Returns whether the kernel counters are collecting."""
+    return bool(_ffi.lib.stats_enabled())
+
+def stats() -> dict:
+    """Returns the kernel counters as {kernel: {tier: {...}}}, listing only the kernels and tiers that ran.
+
+    Each entry holds calls, pixels (destination pixels touched), bytes (read
+    plus written), total_ns and max_ns. All entry points of a kernel (plain,
+    _avx2, _neon, _strided, auto_) count together under the tier that really ran.
+    """
+    result = {}
+    counters = _ffi.ffi.new("kernel_stats*")
+    for op in range(_ffi.lib.stats_op_count()):
+        name = _ffi.ffi.string(_ffi.lib.stats_op_name(op)).decode()
+        for tier, tier_name in enumerate(_STATS_TIERS):
+            _ffi.lib.stats_get(op, tier, counters)
+            if counters.calls:
+                result.setdefault(name, {})[tier_name] = {
+                    "calls": counters.calls,
+                    "pixels": counters.pixels,
+                    "bytes": counters.bytes,
+                    "total_ns": counters.total_ns,
+                    "max_ns": counters.max_ns,
+                }
+    return result
+
+def reset_stats():
+    """Zeroes every kernel counter."""
+    _ffi.lib.stats_reset()
+
+def set_num_threads(num_threads: int = 0):
+    """Sets how many threads the auto_* functions may use (0 = one per CPU, 1 = single-threaded)."""
+    _ffi.lib.set_num_threads(num_threads)
+
+def get_num_threads() -> int:
+    """Returns how many threads the auto_* functions may use."""
+    return _ffi.lib.get_num_threads()
+
+def set_parallel_threshold(pixels: int):
+    """Sets the smallest job, in destination pixels, that the auto_* functions split across threads."""
+    _ffi.lib.set_parallel_threshold(pixels)
+
+def set_streaming_threshold(bytes: int):
+    """Sets the smallest fill or copy, in bytes written, that uses non-temporal (cache-bypassing) stores. 0 disables them."""
+    _ffi.lib.set_streaming_threshold(bytes)
+
+def get_streaming_threshold() -> int:
+    """Returns the smallest fill or copy, in bytes written, that uses non-temporal stores."""
+    return _ffi.lib.get_streaming_threshold()
+
+def auto_fill_image_rgba(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
+    """Fills an image using the fastest fill_image_rgba variant supported by this CPU."""
+    _ffi.lib.auto_fill_image_rgba(image_data, width, height, r, g, b, a)
+
+
+def auto_fill_image_rgba_strided(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """Strided fill using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_fill_image_rgba_strided(image_data, width, height, stride, r, g, b, a)
+
+def auto_blend(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+    """Blends using the fastest blend variant supported by this CPU."""
+    _ffi.lib.auto_blend(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
+
+
+def auto_blend_strided(background: ImageData, bg_width: int, bg_height: int, bg_stride: int, overlay: ImageData, ov_width: int, ov_height: int, ov_stride: int, start_x: int, start_y: int):
+    """Strided blend using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_blend_strided(background, bg_width, bg_height, bg_stride, overlay, ov_width, ov_height, ov_stride, start_x, start_y)
+
+def auto_blit(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int):
+    """Blits using the fastest blit variant supported by this CPU."""
+    _ffi.lib.auto_blit(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y)
+
+
+def auto_blit_strided(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, start_x: int, start_y: int):
+    """Strided blit using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_blit_strided(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, start_x, start_y)
+def auto_blit_region(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, region_x: int, region_y: int, region_width: int, region_height: int, start_x: int, start_y: int):
+    """blit_region using the fastest variant supported by this CPU."""
+    if _ffi.lib.auto_blit_region(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, region_x, region_y, region_width, region_height, start_x, start_y) != 0:
+        raise ValueError("region is outside the source image")
+
+def auto_blend_region(dest_image: ImageData, dest_width: int, dest_height: int, dest_stride: int, src_image: ImageData, src_width: int, src_height: int, src_stride: int, region_x: int, region_y: int, region_width: int, region_height: int, start_x: int, start_y: int):
+    """blend_region using the fastest variant supported by this CPU."""
+    if _ffi.lib.auto_blend_region(dest_image, dest_width, dest_height, dest_stride, src_image, src_width, src_height, src_stride, region_x, region_y, region_width, region_height, start_x, start_y) != 0:
+        raise ValueError("region is outside the source image")
+
+
+def auto_nearest_neighbor_resize(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes using the fastest nearest neighbor variant supported by this CPU."""
+    if _ffi.lib.auto_nearest_neighbor_resize(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+
+def auto_nearest_neighbor_resize_strided(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Strided resize using the fastest nearest neighbor variant supported by this CPU."""
+    if _ffi.lib.auto_nearest_neighbor_resize_strided(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def auto_bilinear_resize(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes using the fastest bilinear variant supported by this CPU."""
+    if _ffi.lib.auto_bilinear_resize(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+
+def auto_bilinear_resize_strided(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Strided resize using the fastest bilinear variant supported by this CPU."""
+    if _ffi.lib.auto_bilinear_resize_strided(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def auto_area_resize(src: ImageData, dst: ImageData, src_width: int, src_height: int, dst_width: int, dst_height: int):
+    """Resizes using the fastest area averaging variant supported by this CPU."""
+    if _ffi.lib.auto_area_resize(src, dst, src_width, src_height, dst_width, dst_height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+
+def auto_area_resize_strided(src: ImageData, src_width: int, src_height: int, src_stride: int, dst: ImageData, dst_width: int, dst_height: int, dst_stride: int):
+    """Strided resize using the fastest area averaging variant supported by this CPU."""
+    if _ffi.lib.auto_area_resize_strided(src, src_width, src_height, src_stride, dst, dst_width, dst_height, dst_stride) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def auto_scaled_blit(dest_image: ImageData, dest_width: int, dest_height: int, src_image: ImageData, src_width: int, src_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Scaled blit using the fastest variant supported by this CPU."""
+    if _ffi.lib.auto_scaled_blit(dest_image, dest_width, dest_height, src_image, src_width, src_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def auto_scaled_blend(background: ImageData, bg_width: int, bg_height: int, overlay: ImageData, ov_width: int, ov_height: int, start_x: int, start_y: int, width: int, height: int):
+    """Scaled blend using the fastest variant supported by this CPU."""
+    if _ffi.lib.auto_scaled_blend(background, bg_width, bg_height, overlay, ov_width, ov_height, start_x, start_y, width, height) != 0:
+        raise MemoryError("Could not allocate resampling buffers")
+
+def auto_premultiply(image_data: ImageData, width: int, height: int):
+    """Premultiplies using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_premultiply(image_data, width, height)
+
+def auto_unpremultiply(image_data: ImageData, width: int, height: int):
+    """Unpremultiplies using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_unpremultiply(image_data, width, height)
+
+def auto_multiply_rgba(image_data: ImageData, width: int, height: int, r: int, g: int, b: int, a: int):
+    """multiply_rgba using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_multiply_rgba(image_data, width, height, r, g, b, a)
+
+def auto_multiply_rgba_strided(image_data: ImageData, width: int, height: int, stride: int, r: int, g: int, b: int, a: int):
+    """multiply_rgba_strided using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_multiply_rgba_strided(image_data, width, height, stride, r, g, b, a)
+
+def auto_blend_premultiplied(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int):
+    """Premultiplied blend using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_blend_premultiplied(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y)
+
+def auto_analyze_alpha(image_data: ImageData, width: int, height: int) -> Any:
+    """analyze_alpha using the fastest variant supported by this CPU."""
+    info = _ffi.ffi.new("alpha_info*")
+    _ffi.lib.auto_analyze_alpha(image_data, width, height, info)
+    return info
+
+def auto_blend_analyzed(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int, info: Any):
+    """blend_analyzed using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_blend_analyzed(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y, info)
+
+def auto_blend_premultiplied_analyzed(background: ImageData, overlay: ImageData, bg_width: int, bg_height: int, ov_width: int, ov_height: int, start_x: int, start_y: int, info: Any):
+    """Premultiplied blend that skips, copies or crops the overlay according to its analyze_alpha() info."""
+    _ffi.lib.auto_blend_premultiplied_analyzed(background, overlay, bg_width, bg_height, ov_width, ov_height, start_x, start_y, info)
+
+def auto_convert_pixels(src: ImageData, src_format: int, dst: ImageData, dst_format: int, width: int, height: int):
+    """Pixel format conversion using the fastest variant supported by this CPU."""
+    if _ffi.lib.auto_convert_pixels(src, src_format, dst, dst_format, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+
+def auto_convert_pixels_strided(src: ImageData, src_format: int, src_stride: int, dst: ImageData, dst_format: int, dst_stride: int, width: int, height: int):
+    """Strided pixel format conversion using the fastest variant supported by this CPU."""
+    if _ffi.lib.auto_convert_pixels_strided(src, src_format, src_stride, dst, dst_format, dst_stride, width, height) != 0:
+        raise ValueError("Unsupported pixel format conversion")
+def auto_blend_mask(dest: ImageData, mask: ImageData, dest_width: int, dest_height: int, mask_width: int, mask_height: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """blend_mask using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_blend_mask(dest, mask, dest_width, dest_height, mask_width, mask_height, start_x, start_y, r, g, b, a)
+
+def auto_blend_mask_strided(dest: ImageData, dest_width: int, dest_height: int, dest_stride: int, mask: ImageData, mask_width: int, mask_height: int, mask_stride: int, start_x: int, start_y: int, r: int, g: int, b: int, a: int):
+    """blend_mask_strided using the fastest variant supported by this CPU."""
+    _ffi.lib.auto_blend_mask_strided(dest, dest_width, dest_height, dest_stride, mask, mask_width, mask_height, mask_stride, start_x, start_y, r, g, b, a)
+
+
+def draw_batch(background: ImageData, bg_width: int, bg_height: int, commands: Any, count: int, flags: int = DRAW_BIN_TILES):
+    """Runs count packed draw_command records (blits and blends) against background in one call."""
+    _ffi.lib.draw_batch(background, bg_width, bg_height, commands, count, flags)
+
+def draw_batch_strided(background: ImageData, bg_width: int, bg_height: int, bg_stride: int, commands: Any, count: int, flags: int = DRAW_BIN_TILES):
+    """draw_batch() onto a background whose rows are bg_stride bytes apart."""
+    _ffi.lib.draw_batch_strided(background, bg_width, bg_height, bg_stride, commands, count, flags)
+def blend_mask_batch(dest: ImageData, dest_width: int, dest_height: int, dest_stride: int, atlas: ImageData, atlas_width: int, atlas_height: int, atlas_stride: int, commands: Any, count: int, flags: int = DRAW_BIN_TILES):
+    """Blends count mask_command records, each a colored rectangle of one A8 atlas, in one call."""
+    _ffi.lib.blend_mask_batch(dest, dest_width, dest_height, dest_stride, atlas, atlas_width, atlas_height, atlas_stride, commands, count, flags)
+
+def _check_diff(changed: int) -> int:
+    if changed < 0:
+        raise ValueError("diff_regions needs two frames and a tile size of at least 1")
+    return changed
+
+def diff_regions(prev: ImageData, cur: ImageData, width: int, height: int, tile: int, damage: Any) -> int:
+    """Adds the tile x tile blocks that differ between two frames to a damage_list. Returns how many changed."""
+    return _check_diff(_ffi.lib.diff_regions(prev, cur, width, height, tile, damage))
+
+def diff_regions_avx2(prev: ImageData, cur: ImageData, width: int, height: int, tile: int, damage: Any) -> int:
+    """diff_regions using AVX2."""
+    return _check_diff(_ffi.lib.diff_regions_avx2(prev, cur, width, height, tile, damage))
+
+def diff_regions_neon(prev: ImageData, cur: ImageData, width: int, height: int, tile: int, damage: Any) -> int:
+    """diff_regions using NEON."""
+    return _check_diff(_ffi.lib.diff_regions_neon(prev, cur, width, height, tile, damage))
+
+def diff_regions_strided(prev: ImageData, prev_stride: int, cur: ImageData, cur_stride: int, width: int, height: int, tile: int, damage: Any) -> int:
+    """diff_regions on frames whose rows are prev_stride and cur_stride bytes apart."""
+    return _check_diff(_ffi.lib.diff_regions_strided(prev, prev_stride, cur, cur_stride, width, height, tile, damage))
+
+def auto_diff_regions(prev: ImageData, cur: ImageData, width: int, height: int, tile: int, damage: Any) -> int:
+    """diff_regions using the fastest variant supported by this CPU."""
+    return _check_diff(_ffi.lib.auto_diff_regions(prev, cur, width, height, tile, damage))
+
+def auto_diff_regions_strided(prev: ImageData, prev_stride: int, cur: ImageData, cur_stride: int, width: int, height: int, tile: int, damage: Any) -> int:
+    """diff_regions_strided using the fastest variant supported by this CPU."""
+    return _check_diff(_ffi.lib.auto_diff_regions_strided(prev, prev_stride, cur, cur_stride, width, height, tile, damage))
+
+
+def _span(width: int, height: int, stride: int, pixel_bytes: int = 4) -> int:
+    # Bytes from the first pixel to the last; the padding after the last row is not needed.
+    return stride * (height - 1) + width * pixel_bytes if width and height else 0
+
+# Name -> (PIXEL_FORMAT_*, bytes per pixel) for Image.import_pixels/export_pixels.
+_PIXEL_FORMATS = {
+    "rgba": (PIXEL_FORMAT_RGBA, 4),
+    "bgra": (PIXEL_FORMAT_BGRA, 4),
+    "argb": (PIXEL_FORMAT_ARGB, 4),
+    "rgb24": (PIXEL_FORMAT_RGB24, 3),
+    "a8": (PIXEL_FORMAT_A8, 1),
+}
+
+def _pixel_buffer(obj, width: int, height: int, format: str, stride, writable: bool):
+    # Returns (cdata, PIXEL_FORMAT_*, stride) for a buffer holding width x height pixels in format.
+    pixel_format, pixel_bytes = _PIXEL_FORMATS[format]
+    if stride is None:
+        stride = width * pixel_bytes
+    if stride < width * pixel_bytes:
+        raise ValueError(f"stride {stride} is shorter than a {width} pixel {format} row")
+    data = _ffi.ffi.from_buffer("uint8_t[]", obj, require_writable=writable)
+    needed = _span(width, height, stride, pixel_bytes)
+    if len(data) < needed:
+        raise ValueError(f"buffer holds {len(data)} bytes, {width}x{height} {format} needs {needed}")
+    return data, pixel_format, stride
+
+# Image files are a small header followed by height rows of stride bytes. The
+# pixels start on their own page, so they can be mapped without decoding.
+_IMAGE_FILE_MAGIC = b"PYCRGBA\x01"
+_IMAGE_FILE_HEADER = struct.Struct("<8sIIQQ")  # magic, width, height, stride, pixel offset
+_IMAGE_FILE_OFFSET = 4096
+
+class _MappedFile:
+    # Owner of a file-backed image: the mapping and the cdata buffer exported from it.
+    __slots__ = ("mapping", "buffer")
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.buffer = _ffi.ffi.from_buffer("uint8_t[]", mapping, require_writable=True)
+
+    def close(self):
+        _ffi.ffi.release(self.buffer)
+        try:
+            self.mapping.close()
+        except BufferError:
+            pass  # A memoryview of the pixels is still alive; the mapping goes away with it.
+
+class _SharedSegment:
+    # Owner of a shared-memory image. The process that created the segment
+    # unlinks it on close() or when the owner is collected; processes that
+    # attached to it by name only unmap it.
+    __slots__ = ("segment", "buffer", "_close", "__weakref__")
+
+    def __init__(self, segment, created: bool):
+        self.segment = segment
+        self.buffer = _ffi.ffi.from_buffer("uint8_t[]", segment.buf, require_writable=True)
+        # The cffi buffer must be released before the segment is closed, also
+        # when the owner is collected or still alive at interpreter exit.
+        self._close = weakref.finalize(self, _SharedSegment._release, self.buffer, segment, created)
+
+    @staticmethod
+    def _release(buffer, segment, created: bool):
+        _ffi.ffi.release(buffer)
+        try:
+            segment.close()
+        except BufferError:
+            pass  # A memoryview of the pixels is still alive; the mapping goes away with it.
+        if created:
+            segment.unlink()
+
+    def close(self):
+        self._close()
+
+def _attach_segment(name: str):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    # Older versions register every attach with the resource tracker. Pool
+    # workers share the creator's tracker, so this only unlinks the segment
+    # when the creating program exits.
+    return shared_memory.SharedMemory(name)
+
+# Shared segments carry a random token after the image header, so a pickled
+# reference can tell its segment apart from a later one created under the same name.
+_SHARED_TOKEN_OFFSET = _IMAGE_FILE_HEADER.size
+_SHARED_TOKEN_SIZE = 16
+
+def _shared_token(segment) -> bytes:
+    return bytes(segment.buf[_SHARED_TOKEN_OFFSET:_SHARED_TOKEN_OFFSET + _SHARED_TOKEN_SIZE])
+
+def _open_shared_view(name: str, token: bytes, x: int, y: int, width: int, height: int) -> "Image":
+    # Maps the segment again for every unpickled image; the mapping is dropped
+    # with the image, so workers do not keep segments alive after their creator closed them.
+    image = Image.open_shared(name)
+    if _shared_token(image._owner.segment) != token:
+        image.close()
+        raise ValueError(f"shared image {name!r} was closed; the name now belongs to another segment")
+    if (x, y, width, height) == (0, 0, image.width, image.height):
+        return image
+    return image.view(x, y, width, height)
+
+_RESIZE_FILTERS = {
+    "nearest": _lib.auto_nearest_neighbor_resize_strided,
+    "bilinear": _lib.auto_bilinear_resize_strided,
+    "area": _lib.auto_area_resize_strided,
+}
+
+class Image:
+    """An RGBA image that owns its pixel buffer and knows its own size.
+
+    The buffer is freed by close(), at the end of a ``with`` block, or by the
+    finalizer when the object is collected, whichever happens first. Methods
+    call straight into the dispatched C kernels without re-checking sizes.
+    Rows are stride bytes apart, so an image can also be a view() of a
+    rectangle inside a larger one.
+    """
+    __slots__ = ("data", "width", "height", "stride", "damage", "_owner", "_alpha", "_origin")
+
+    def __init__(self, width: int, height: int):
+        data = _lib.create_image_rgba(width, height)
+        if data == _ffi.ffi.NULL:
+            raise MemoryError(f"Could not allocate a {width}x{height} RGBA image")
+        self.data = _ffi.ffi.gc(data, _lib.free_image_rgba, width * height * 4)
+        self.width = width
+        self.height = height
+        self.stride = width * 4
+        self.damage = None
+        self._owner = None
+        self._alpha = None
+        self._origin = None
+
+    @classmethod
+    def from_buffer(cls, obj, width: int, height: int, stride: int = None) -> "Image":
+        """Wraps a writable buffer (bytearray, mmap, NumPy array...) without copying.
+
+        The buffer must hold height rows of width RGBA pixels, stride bytes
+        apart (width * 4 by default), and be 4-byte aligned. The returned
+        image keeps obj alive; close() only drops the reference, the memory
+        stays owned by obj.
+        """
+        if stride is None:
+            stride = width * 4
+        if stride < width * 4 or stride % 4:
+            raise ValueError(f"stride {stride} must be a multiple of 4 and at least {width * 4}")
+        data = _ffi.ffi.from_buffer("uint8_t[]", obj, require_writable=True)
+        needed = _span(width, height, stride)
+        if len(data) < needed:
+            raise ValueError(f"buffer holds {len(data)} bytes, {width}x{height} RGBA needs {needed}")
+        if int(_ffi.ffi.cast("uintptr_t", data)) % 4:
+            raise ValueError("buffer is not aligned to a 4-byte pixel boundary")
+        return cls._wrap(data, width, height, stride, obj)
+
+    @classmethod
+    def _wrap(cls, data, width: int, height: int, stride: int, owner, origin=None) -> "Image":
+        image = cls.__new__(cls)
+        image.data = data
+        image.width = width
+        image.height = height
+        image.stride = stride
+        image.damage = None
+        image._owner = owner
+        image._alpha = None
+        image._origin = origin
+        return image
+
+    @classmethod
+    def from_array(cls, array) -> "Image":
+        """Wraps a (height, width, 4) uint8 NumPy array without copying.
+
+        Pixels must be packed within a row, but rows may be further apart, so
+        a slice such as ``frame[y:y + h, x:x + w]`` is wrapped in place.
+        """
+        interface = array.__array_interface__
+        shape = interface["shape"]
+        if len(shape) != 3 or shape[2] != 4 or interface["typestr"] != "|u1":
+            raise ValueError(f"expected a (height, width, 4) uint8 array, got shape {shape} {interface['typestr']}")
+        height, width = shape[0], shape[1]
+        strides = interface.get("strides")
+        if strides is None or tuple(strides) == (width * 4, 4, 1):
+            return cls.from_buffer(array, width, height)
+        if tuple(strides[1:]) != (4, 1) or strides[0] < width * 4 or strides[0] % 4:
+            raise ValueError(f"array rows must hold packed RGBA pixels (strides {strides})")
+        address, readonly = interface["data"]
+        if readonly:
+            raise ValueError("array is read-only")
+        if address % 4:
+            raise ValueError("array is not aligned to a 4-byte pixel boundary")
+        return cls._wrap(_ffi.ffi.cast("uint8_t*", address), width, height, strides[0], array)
+
+    @classmethod
+    def create_file(cls, path, width: int, height: int) -> "Image":
+        """Creates (or overwrites) an image file at path and returns an image mapped onto it.
+
+        The pixels start transparent black and are paged in and out by the OS
+        on demand, so the image may be larger than RAM. On file systems with
+        sparse files only the pages that are written take disk space. Call
+        flush() or close() to make sure every write has reached the file.
+        """
+        stride = width * 4
+        size = _IMAGE_FILE_OFFSET + stride * height
+        with open(path, "w+b") as file:
+            file.write(_IMAGE_FILE_HEADER.pack(_IMAGE_FILE_MAGIC, width, height, stride, _IMAGE_FILE_OFFSET))
+            file.truncate(size)
+            mapping = mmap.mmap(file.fileno(), size)
+        return cls._map(mapping, width, height, stride, _IMAGE_FILE_OFFSET)
+
+    @classmethod
+    def open_file(cls, path, writable: bool = True) -> "Image":
+        """Maps an image file written by create_file(); nothing is read or decoded up front.
+
+        With writable=False the file is mapped copy-on-write: the image can
+        still be drawn on, but the changes are never written back.
+        """
+        with open(path, "r+b" if writable else "rb") as file:
+            header = file.read(_IMAGE_FILE_HEADER.size)
+            if len(header) < _IMAGE_FILE_HEADER.size or header[:8] != _IMAGE_FILE_MAGIC:
+                raise ValueError(f"{path} is not a pycrgba image file")
+            _, width, height, stride, offset = _IMAGE_FILE_HEADER.unpack(header)
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_COPY)
+        if stride < width * 4 or stride % 4 or offset % 4 or len(mapping) < offset + _span(width, height, stride):
+            mapping.close()
+            raise ValueError(f"{path} is truncated or has an invalid header")
+        return cls._map(mapping, width, height, stride, offset)
+
+    @classmethod
+    def create_shared(cls, width: int, height: int, name: str = None) -> "Image":
+        """Creates an image in a new shared-memory segment that other processes can open by name.
+
+        The segment has the same layout as an image file, so open_shared()
+        needs nothing but the name (see shared_name). The pixels start
+        transparent black. The segment is removed when this image is closed
+        or collected; processes that still have it open keep their mapping.
+        """
+        stride = width * 4
+        segment = shared_memory.SharedMemory(name, create=True, size=_IMAGE_FILE_OFFSET + stride * height)
+        segment.buf[:_IMAGE_FILE_HEADER.size] = _IMAGE_FILE_HEADER.pack(_IMAGE_FILE_MAGIC, width, height, stride, _IMAGE_FILE_OFFSET)
+        segment.buf[_SHARED_TOKEN_OFFSET:_SHARED_TOKEN_OFFSET + _SHARED_TOKEN_SIZE] = os.urandom(_SHARED_TOKEN_SIZE)
+        owner = _SharedSegment(segment, True)
+        return cls._wrap(owner.buffer + _IMAGE_FILE_OFFSET, width, height, stride, owner)
+
+    @classmethod
+    def open_shared(cls, name: str) -> "Image":
+        """Maps the shared image called name, created by create_shared() in any process, without copying.
+
+        Writes are visible to every process that has the image open. close()
+        unmaps it but leaves the segment to its creator.
+        """
+        segment = _attach_segment(name)
+        header = bytes(segment.buf[:_IMAGE_FILE_HEADER.size])
+        magic, width, height, stride, offset = _IMAGE_FILE_HEADER.unpack(header)
+        if magic != _IMAGE_FILE_MAGIC or stride < width * 4 or stride % 4 or offset % 4 or segment.size < offset + _span(width, height, stride):
+            segment.close()
+            raise ValueError(f"shared memory {name!r} does not hold a pycrgba image")
+        owner = _SharedSegment(segment, False)
+        return cls._wrap(owner.buffer + offset, width, height, stride, owner)
+
+    def _root(self) -> "Image":
+        # The image that owns the memory this image (or view) points into.
+        image = self
+        while isinstance(image._owner, Image):
+            image = image._owner
+        return image
+
+    @property
+    def shared_name(self) -> str:
+        """Name of the shared-memory segment holding the pixels, or None for a private image."""
+        owner = self._root()._owner
+        return owner.segment.name if isinstance(owner, _SharedSegment) else None
+
+    def __reduce__(self):
+        # Shared images (and views of them) pickle as their segment name, token
+        # and rectangle, so they reach worker processes without copying pixels.
+        root = self._root()
+        if self.data is None or not isinstance(root._owner, _SharedSegment):
+            raise TypeError("only shared images can be pickled; create them with Image.create_shared()")
+        offset = int(_ffi.ffi.cast("uintptr_t", self.data)) - int(_ffi.ffi.cast("uintptr_t", root.data))
+        segment = root._owner.segment
+        return (_open_shared_view, (segment.name, _shared_token(segment),
+                                    offset % root.stride // 4, offset // root.stride, self.width, self.height))
+
+    @classmethod
+    def _map(cls, mapping, width: int, height: int, stride: int, offset: int) -> "Image":
+        owner = _MappedFile(mapping)
+        return cls._wrap(owner.buffer + offset, width, height, stride, owner)
+
+    def flush(self):
+        """Writes the pixels of a file-backed image (or of a view of one) to the file."""
+        owner = self._owner
+        while isinstance(owner, Image):
+            owner = owner._owner
+        if isinstance(owner, _MappedFile):
+            owner.mapping.flush()
+
+    @classmethod
+    def from_pixels(cls, obj, width: int, height: int, format: str, stride: int = None) -> "Image":
+        """Returns a new RGBA image converted from a buffer of "bgra", "argb", "rgb24", "a8" or "rgba" pixels."""
+        image = cls(width, height)
+        image.import_pixels(obj, format, stride)
+        return image
+
+    def view(self, x: int, y: int, width: int, height: int) -> "Image":
+        """Returns an image over the width x height rectangle at (x, y) that shares this image's pixels.
+
+        Every method works on the view in place, so a tile of a canvas or an
+        atlas entry can be filled, blended or resized without copying it out
+        and back. Writes through the view invalidate this image's alpha
+        analysis and are recorded by its damage tracker. The view keeps this
+        image alive, but must not be used after close().
+        """
+        if x < 0 or y < 0 or width < 0 or height < 0 or x + width > self.width or y + height > self.height:
+            raise ValueError(f"view {width}x{height} at ({x}, {y}) is outside the {self.width}x{self.height} image")
+        data = self.data + (y * self.stride + x * 4)
+        return Image._wrap(data, width, height, self.stride, self, (x, y))
+
+    @property
+    def __array_interface__(self) -> dict:
+        # Lets np.asarray(image) view the pixels without copying; the array keeps the image alive.
+        return {
+            "shape": (self.height, self.width, 4),
+            "typestr": "|u1",
+            "data": (int(_ffi.ffi.cast("uintptr_t", self.data)), False),
+            "strides": (self.stride, 4, 1),
+            "version": 3,
+        }
+
+    def __repr__(self) -> str:
+        state = "closed" if self.data is None else f"stride={self.stride}"
+        return f"<pycrgba.Image {self.width}x{self.height} {state}>"
+
+    def __enter__(self) -> "Image":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Frees the pixel buffer now instead of waiting for the finalizer.
+
+        Arrays or memoryviews still exported from the image must not be used afterwards.
+        """
+        if self.data is not None:
+            # Views and wrapped NumPy slices are plain pointers into memory owned elsewhere.
+            if self._owner is None or _ffi.ffi.typeof(self.data).kind == "array":
+                _ffi.ffi.release(self.data)
+            elif isinstance(self._owner, (_MappedFile, _SharedSegment)):
+                self._owner.close()
+            self.data = None
+            self._owner = None
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes from the first pixel to the last, including any padding between rows."""
+        return _span(self.width, self.height, self.stride)
+
+    def buffer(self):
+        """Returns a writable cffi buffer over the pixels (no copy)."""
+        return _ffi.ffi.buffer(self.data, self.nbytes)
+
+    def memoryview(self) -> memoryview:
+        """Returns a writable memoryview over the pixels (no copy)."""
+        return memoryview(_ffi.ffi.buffer(self.data, self.nbytes))
+
+    def __buffer__(self, flags: int) -> memoryview:
+        return memoryview(_ffi.ffi.buffer(self.data, self.nbytes))
+
+    def track_damage(self) -> "DamageTracker":
+        """Starts recording the rectangles written by fill/blit/blend and draw lists."""
+        if self.damage is None:
+            self.damage = DamageTracker(self.width, self.height)
+        return self.damage
+
+    def diff(self, previous: "Image", tile: int = 64) -> "DamageTracker":
+        """Returns a DamageTracker holding the tile x tile blocks that differ from previous.
+
+        Its rects() are the changed regions to encode and send, and bounds()
+        is the box around all of them.
+        """
+        damage = DamageTracker(self.width, self.height)
+        damage.add_diff(previous, self, tile)
+        return damage
+
+    def _written(self, x: int, y: int, width: int, height: int):
+        # Every method that changes pixels reports the rectangle here.
+        self._alpha = None
+        if self.damage is not None:
+            _lib.damage_add(self.damage.list, x, y, width, height)
+        if self._origin is not None:
+            # A view reports the part inside its bounds to the image it was taken from.
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + width, self.width), min(y + height, self.height)
+            if x0 < x1 and y0 < y1:
+                self._owner._written(self._origin[0] + x0, self._origin[1] + y0, x1 - x0, y1 - y0)
+
+    def _written_box(self, x: int, y: int, info, premultiplied: bool = False):
+        # Only the visible box of an analyzed overlay placed at (x, y) changes;
+        # for premultiplied blends that is the box of non-zero pixels.
+        if not info.flags & (ALPHA_CLEAR if premultiplied else ALPHA_TRANSPARENT):
+            bounds = info.nonzero_bounds if premultiplied else info.bounds
+            self._written(x + bounds.x, y + bounds.y, bounds.width, bounds.height)
+
+    def analyze_alpha(self) -> dict:
+        """Scans the pixels once and caches the result until a method writes to the image.
+
+        blend() and blend_premultiplied() use the cached result to skip fully
+        transparent overlays, copy fully opaque ones, and only blend the box
+        of visible pixels. For blend() that is the box of non-zero alpha
+        ("bounds"); blend_premultiplied() uses the box of pixels with any
+        non-zero channel ("nonzero_bounds") and skips only "clear" images,
+        because premultiplied pixels with zero alpha and some color still add
+        to the background. Writes made through buffer(), memoryview(), NumPy
+        views or the image a view() was taken from are not seen; call
+        invalidate_alpha() after them.
+        """
+        if self._alpha is None:
+            info = _ffi.ffi.new("alpha_info*")
+            _lib.auto_analyze_alpha_strided(self.data, self.width, self.height, self.stride, info)
+            self._alpha = info
+        info = self._alpha
+        bounds = info.bounds
+        nonzero = info.nonzero_bounds
+        return {
+            "opaque": bool(info.flags & ALPHA_OPAQUE),
+            "transparent": bool(info.flags & ALPHA_TRANSPARENT),
+            "clear": bool(info.flags & ALPHA_CLEAR),
+            "bounds": (bounds.x, bounds.y, bounds.width, bounds.height),
+            "nonzero_bounds": (nonzero.x, nonzero.y, nonzero.width, nonzero.height),
+        }
+
+    def invalidate_alpha(self):
+        """Drops the cached analyze_alpha() result after writing to the pixels directly."""
+        self._alpha = None
+
+    def fill(self, r: int, g: int, b: int, a: int):
+        """Fills the image with a solid RGBA color."""
+        _lib.auto_fill_image_rgba_strided(self.data, self.width, self.height, self.stride, r, g, b, a)
+        self._written(0, 0, self.width, self.height)
+
+    def blit(self, src: "Image", x: int = 0, y: int = 0):
+        """Copies src onto this image at (x, y), clipping at the edges."""
+        _lib.auto_blit_strided(self.data, self.width, self.height, self.stride,
+                               src.data, src.width, src.height, src.stride, x, y)
+        self._written(x, y, src.width, src.height)
+
+    def blend(self, overlay: "Image", x: int = 0, y: int = 0):
+        """Alpha-blends overlay onto this image at (x, y), clipping at the edges."""
+        info = overlay._alpha
+        if info is None:
+            _lib.auto_blend_strided(self.data, self.width, self.height, self.stride,
+                                    overlay.data, overlay.width, overlay.height, overlay.stride, x, y)
+            self._written(x, y, overlay.width, overlay.height)
+        else:
+            _lib.auto_blend_analyzed_strided(self.data, self.width, self.height, self.stride,
+                                             overlay.data, overlay.width, overlay.height, overlay.stride, x, y, info)
+            self._written_box(x, y, info)
+
+    def blit_region(self, src: "Image", src_x: int, src_y: int, width: int, height: int, x: int = 0, y: int = 0):
+        """Copies the width x height rectangle at (src_x, src_y) of src onto this image at (x, y)."""
+        if _lib.auto_blit_region(self.data, self.width, self.height, self.stride,
+                                 src.data, src.width, src.height, src.stride,
+                                 src_x, src_y, width, height, x, y) != 0:
+            raise ValueError(f"region {width}x{height} at ({src_x}, {src_y}) is outside the {src.width}x{src.height} source")
+        self._written(x, y, width, height)
+
+    def blend_region(self, src: "Image", src_x: int, src_y: int, width: int, height: int, x: int = 0, y: int = 0):
+        """Alpha-blends the width x height rectangle at (src_x, src_y) of src onto this image at (x, y)."""
+        if _lib.auto_blend_region(self.data, self.width, self.height, self.stride,
+                                  src.data, src.width, src.height, src.stride,
+                                  src_x, src_y, width, height, x, y) != 0:
+            raise ValueError(f"region {width}x{height} at ({src_x}, {src_y}) is outside the {src.width}x{src.height} source")
+        self._written(x, y, width, height)
+
+    def blend_premultiplied(self, overlay: "Image", x: int = 0, y: int = 0):
+        """Blends a premultiplied overlay onto this premultiplied image at (x, y)."""
+        info = overlay._alpha
+        if info is None:
+            _lib.auto_blend_premultiplied_strided(self.data, self.width, self.height, self.stride,
+                                                  overlay.data, overlay.width, overlay.height, overlay.stride, x, y)
+            self._written(x, y, overlay.width, overlay.height)
+        else:
+            _lib.auto_blend_premultiplied_analyzed_strided(self.data, self.width, self.height, self.stride,
+                                                           overlay.data, overlay.width, overlay.height, overlay.stride,
+                                                           x, y, info)
+            self._written_box(x, y, info, premultiplied=True)
+
+    def blend_mask(self, mask, width: int, height: int, x: int, y: int,
+                   r: int, g: int, b: int, a: int = 255, stride: int = None):
+        """Blends the color (r, g, b, a) through an A8 coverage mask placed at (x, y).
+
+        mask is any buffer holding height rows of width coverage bytes, stride
+        bytes apart (packed by default). The result matches blend() with an
+        overlay of that color whose alpha is coverage * a / 255.
+        """
+        data, _, stride = _pixel_buffer(mask, width, height, "a8", stride, False)
+        _lib.auto_blend_mask_strided(self.data, self.width, self.height, self.stride,
+                                     data, width, height, stride, x, y, r, g, b, a)
+        self._written(x, y, width, height)
+
+    def premultiply(self):
+        """Converts this image from straight to premultiplied alpha in place."""
+        _lib.auto_premultiply_strided(self.data, self.width, self.height, self.stride)
+        self._written(0, 0, self.width, self.height)
+
+    def unpremultiply(self):
+        """Converts this image from premultiplied back to straight alpha in place."""
+        _lib.auto_unpremultiply_strided(self.data, self.width, self.height, self.stride)
+        self._written(0, 0, self.width, self.height)
+
+    def multiply(self, r: int, g: int, b: int, a: int):
+        """Scales each channel in place by the matching color channel / 255.
+
+        multiply(255, 255, 255, o) fades a straight-alpha image to opacity o;
+        multiply(o, o, o, o) does the same to a premultiplied one.
+        """
+        _lib.auto_multiply_rgba_strided(self.data, self.width, self.height, self.stride, r, g, b, a)
+        self._written(0, 0, self.width, self.height)
+
+    def scaled_blit(self, src: "Image", x: int, y: int, width: int, height: int):
+        """Copies src resized to width x height (nearest neighbor) onto this image at (x, y)."""
+        if _lib.auto_scaled_blit_strided(self.data, self.width, self.height, self.stride,
+                                         src.data, src.width, src.height, src.stride, x, y, width, height) != 0:
+            raise MemoryError("Could not allocate resampling buffers")
+        self._written(x, y, width, height)
+
+    def scaled_blend(self, overlay: "Image", x: int, y: int, width: int, height: int):
+        """Alpha-blends overlay resized to width x height (nearest neighbor) onto this image at (x, y)."""
+        if _lib.auto_scaled_blend_strided(self.data, self.width, self.height, self.stride,
+                                          overlay.data, overlay.width, overlay.height, overlay.stride,
+                                          x, y, width, height) != 0:
+            raise MemoryError("Could not allocate resampling buffers")
+        self._written(x, y, width, height)
+
+    def import_pixels(self, obj, format: str, stride: int = None):
+        """Overwrites this image with pixels read from a buffer in another format.
+
+        obj holds height rows of width pixels in format ("rgba", "bgra",
+        "argb", "rgb24" or "a8"), stride bytes apart (packed by default).
+        RGB24 imports as opaque, A8 as white with that alpha.
+        """
+        data, pixel_format, stride = _pixel_buffer(obj, self.width, self.height, format, stride, False)
+        _lib.auto_convert_pixels_strided(data, pixel_format, stride, self.data, PIXEL_FORMAT_RGBA, self.stride,
+                                         self.width, self.height)
+        self._written(0, 0, self.width, self.height)
+
+    def export_pixels(self, obj, format: str, stride: int = None):
+        """Writes this image into a writable buffer in another format (see import_pixels).
+
+        The buffer may be this image's own memory for the 4-byte formats, which
+        converts it in place.
+        """
+        data, pixel_format, stride = _pixel_buffer(obj, self.width, self.height, format, stride, True)
+        if _lib.auto_convert_pixels_strided(self.data, PIXEL_FORMAT_RGBA, self.stride, data, pixel_format, stride,
+                                            self.width, self.height) != 0:
+            raise ValueError(f"cannot convert to {format} in place")
+
+    def to_bytes(self, format: str = "rgba") -> bytes:
+        """Returns the pixels as packed bytes in format."""
+        out = bytearray(self.width * self.height * _PIXEL_FORMATS[format][1])
+        self.export_pixels(out, format)
+        return bytes(out)
+
+    def resize_into(self, dst: "Image", filter: str = "nearest"):
+        """Resizes this image into dst with the "nearest", "bilinear" or "area" filter."""
+        if _RESIZE_FILTERS[filter](self.data, self.width, self.height, self.stride,
+                                   dst.data, dst.width, dst.height, dst.stride) == -1:
+            raise MemoryError("Could not allocate resampling buffers")
+        dst._written(0, 0, dst.width, dst.height)
+
+    def resized(self, width: int, height: int, filter: str = "nearest") -> "Image":
+        """Returns a new image with this one resized to width x height."""
+        dst = Image(width, height)
+        self.resize_into(dst, filter)
+        return dst
+
+    def copy(self) -> "Image":
+        """Returns a new, packed image with the same size and pixels."""
+        dst = Image(self.width, self.height)
+        if self.stride == self.width * 4:
+            _lib.blit_same_size(self.data, dst.data, self.width, self.height, 4)
+        else:
+            _lib.auto_blit_strided(dst.data, dst.width, dst.height, dst.stride,
+                                   self.data, self.width, self.height, self.stride, 0, 0)
+        dst._alpha = self._alpha
+        return dst
+
+
+class Atlas:
+    """Sprites packed into one RGBA image and addressed by index or name.
+
+    Indexing returns a view() of the entry that is created once and reused,
+    so it keeps its own analyze_alpha() result, and every Image method and
+    DrawList command reads the sprite straight from the atlas. insert()
+    copies a sprite in with a simple shelf packer; add() registers a
+    rectangle whose pixels are already in place (e.g. after
+    ``atlas.image.import_pixels(texture, "bgra")``).
+    """
+    __slots__ = ("image", "padding", "_rects", "_views", "_names", "_shelf_x", "_shelf_y", "_shelf_height")
+
+    def __init__(self, width: int, height: int, padding: int = 0):
+        self.image = Image(width, height)
+        self.image.fill(0, 0, 0, 0)
+        self.padding = padding
+        self._rects = []
+        self._views = []
+        self._names = {}
+        self._shelf_x = 0
+        self._shelf_y = 0
+        self._shelf_height = 0
+
+    def __enter__(self) -> "Atlas":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Frees the atlas image; views returned earlier must not be used afterwards."""
+        self._views = [None] * len(self._rects)
+        self.image.close()
+
+    def __len__(self) -> int:
+        return len(self._rects)
+
+    def __contains__(self, key) -> bool:
+        return key in self._names if isinstance(key, str) else 0 <= key < len(self._rects)
+
+    def _index(self, key) -> int:
+        return self._names[key] if isinstance(key, str) else key
+
+    def add(self, x: int, y: int, width: int, height: int, name: str = None) -> int:
+        """Registers the width x height rectangle at (x, y) as an entry and returns its index."""
+        if x < 0 or y < 0 or width < 0 or height < 0 or x + width > self.image.width or y + height > self.image.height:
+            raise ValueError(f"entry {width}x{height} at ({x}, {y}) is outside the "
+                             f"{self.image.width}x{self.image.height} atlas")
+        if name is not None and name in self._names:
+            raise ValueError(f"atlas already has an entry named {name!r}")
+        index = len(self._rects)
+        self._rects.append((x, y, width, height))
+        self._views.append(None)
+        if name is not None:
+            self._names[name] = index
+        return index
+
+    def insert(self, sprite: Image, name: str = None) -> int:
+        """Copies sprite into free space and returns the index of its entry.
+
+        Entries are placed left to right on shelves as tall as their tallest
+        entry, padding pixels apart, so inserting the tallest sprites first
+        packs tightest. Raises ValueError when it does not fit.
+        """
+        width, height = sprite.width, sprite.height
+        x, y, shelf_height = self._shelf_x, self._shelf_y, self._shelf_height
+        if x + width > self.image.width and x > 0:
+            x, y, shelf_height = 0, y + shelf_height + self.padding, 0
+        if x + width > self.image.width or y + height > self.image.height:
+            raise ValueError(f"no room for a {width}x{height} sprite in the atlas")
+        self.image.blit(sprite, x, y)
+        index = self.add(x, y, width, height, name)
+        self._shelf_x = x + width + self.padding
+        self._shelf_y = y
+        self._shelf_height = max(shelf_height, height)
+        return index
+
+    def rect(self, key) -> tuple:
+        """Returns the (x, y, width, height) of an entry inside the atlas image."""
+        return self._rects[self._index(key)]
+
+    def __getitem__(self, key) -> Image:
+        index = self._index(key)
+        view = self._views[index]
+        if view is None:
+            view = self.image.view(*self._rects[index])
+            self._views[index] = view
+        return view
+
+    def blit(self, dest: Image, key, x: int, y: int):
+        """Copies an entry onto dest at (x, y)."""
+        dest.blit(self[key], x, y)
+
+    def blend(self, dest: Image, key, x: int, y: int):
+        """Alpha-blends an entry onto dest at (x, y)."""
+        dest.blend(self[key], x, y)
+
+
+class TiledCanvas:
+    """A large RGBA canvas stored as tile_size x tile_size tiles that are only allocated when drawn on.
+
+    A tile that has not been drawn on, or that a fill covered completely,
+    is stored as a single color, so empty and solid areas cost no pixel
+    memory and fill() of a whole tile writes nothing. fill, blit and blend
+    are split per tile and run the same kernels as Image. flatten() copies
+    any rectangle out into a contiguous Image.
+    """
+    __slots__ = ("width", "height", "tile_size", "columns", "rows", "_tiles", "_background")
+
+    def __init__(self, width: int, height: int, tile_size: int = 256, background: tuple = (0, 0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.columns = (width + tile_size - 1) // tile_size
+        self.rows = (height + tile_size - 1) // tile_size
+        # (column, row) -> Image, or an (r, g, b, a) tuple for a uniform tile.
+        # Tiles that are not in the dict have the background color.
+        self._tiles = {}
+        self._background = tuple(background)
+
+    def __enter__(self) -> "TiledCanvas":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self) -> str:
+        return (f"<pycrgba.TiledCanvas {self.width}x{self.height} tile={self.tile_size} "
+                f"allocated={self.allocated_tiles}/{self.columns * self.rows}>")
+
+    def close(self):
+        """Frees every allocated tile; the canvas reads as the background color afterwards."""
+        for tile in self._tiles.values():
+            if isinstance(tile, Image):
+                tile.close()
+        self._tiles.clear()
+
+    @property
+    def allocated_tiles(self) -> int:
+        """Number of tiles that hold pixels rather than a single color."""
+        return sum(1 for tile in self._tiles.values() if isinstance(tile, Image))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of pixel memory held by the allocated tiles."""
+        return sum(tile.nbytes for tile in self._tiles.values() if isinstance(tile, Image))
+
+    def _spans(self, x: int, y: int, width: int, height: int):
+        # Yields (column, row, x0, y0, x1, y1) for every tile that the rectangle,
+        # clipped to the canvas, touches; the bounds are in canvas coordinates.
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        size = self.tile_size
+        for row in range(y0 // size, (y1 - 1) // size + 1):
+            for column in range(x0 // size, (x1 - 1) // size + 1):
+                yield (column, row, max(x0, column * size), max(y0, row * size),
+                       min(x1, (column + 1) * size), min(y1, (row + 1) * size))
+
+    def _tile_box(self, column: int, row: int) -> tuple:
+        size = self.tile_size
+        x, y = column * size, row * size
+        return x, y, min(size, self.width - x), min(size, self.height - y)
+
+    def _covers(self, column: int, row: int, x0: int, y0: int, x1: int, y1: int) -> bool:
+        x, y, width, height = self._tile_box(column, row)
+        return x0 == x and y0 == y and x1 == x + width and y1 == y + height
+
+    def _pixels(self, column: int, row: int, overwritten: bool = False) -> Image:
+        # Returns the tile's pixels, allocating them on first use. A tile that is
+        # about to be overwritten completely is not filled with its old color.
+        tile = self._tiles.get((column, row), self._background)
+        if isinstance(tile, Image):
+            return tile
+        _, _, width, height = self._tile_box(column, row)
+        image = Image(width, height)
+        if not overwritten:
+            image.fill(*tile)
+        self._tiles[(column, row)] = image
+        return image
+
+    def _set_color(self, column: int, row: int, color: tuple):
+        tile = self._tiles.pop((column, row), None)
+        if isinstance(tile, Image):
+            tile.close()
+        if color != self._background:
+            self._tiles[(column, row)] = color
+
+    def tile(self, column: int, row: int):
+        """Returns the Image of an allocated tile, or its (r, g, b, a) color when it is uniform."""
+        return self._tiles.get((column, row), self._background)
+
+    def fill(self, r: int, g: int, b: int, a: int):
+        """Fills the whole canvas with a solid color, releasing every tile."""
+        self.close()
+        self._background = (r, g, b, a)
+
+    def fill_rect(self, x: int, y: int, width: int, height: int, r: int, g: int, b: int, a: int):
+        """Fills a rectangle with a solid color, clipping at the edges.
+
+        Tiles the rectangle covers completely become uniform and release
+        their pixels; only partially covered tiles are written.
+        """
+        color = (r, g, b, a)
+        for column, row, x0, y0, x1, y1 in self._spans(x, y, width, height):
+            if self._covers(column, row, x0, y0, x1, y1):
+                self._set_color(column, row, color)
+            elif self.tile(column, row) != color:
+                tile_x, tile_y, _, _ = self._tile_box(column, row)
+                self._pixels(column, row).view(x0 - tile_x, y0 - tile_y, x1 - x0, y1 - y0).fill(r, g, b, a)
+
+    def blit(self, src: Image, x: int = 0, y: int = 0):
+        """Copies src onto the canvas at (x, y), clipping at the edges."""
+        for column, row, x0, y0, x1, y1 in self._spans(x, y, src.width, src.height):
+            tile_x, tile_y, _, _ = self._tile_box(column, row)
+            tile = self._pixels(column, row, self._covers(column, row, x0, y0, x1, y1))
+            tile.blit_region(src, x0 - x, y0 - y, x1 - x0, y1 - y0, x0 - tile_x, y0 - tile_y)
+
+    def blend(self, overlay: Image, x: int = 0, y: int = 0):
+        """Alpha-blends overlay onto the canvas at (x, y), clipping at the edges.
+
+        When overlay has a cached analyze_alpha() result, only tiles under
+        its visible box are touched, so transparent padding allocates nothing.
+        """
+        info = overlay._alpha
+        bounds = (0, 0, overlay.width, overlay.height)
+        if info is not None:
+            if info.flags & ALPHA_TRANSPARENT:
+                return
+            bounds = (info.bounds.x, info.bounds.y, info.bounds.width, info.bounds.height)
+        for column, row, x0, y0, x1, y1 in self._spans(x + bounds[0], y + bounds[1], bounds[2], bounds[3]):
+            tile_x, tile_y, _, _ = self._tile_box(column, row)
+            self._pixels(column, row).blend_region(overlay, x0 - x, y0 - y, x1 - x0, y1 - y0,
+                                                   x0 - tile_x, y0 - tile_y)
+
+    def flatten_into(self, dest: Image, x: int = 0, y: int = 0):
+        """Copies the dest-sized rectangle of the canvas at (x, y) into dest.
+
+        Parts of the rectangle outside the canvas are left untouched.
+        """
+        for column, row, x0, y0, x1, y1 in self._spans(x, y, dest.width, dest.height):
+            tile = self.tile(column, row)
+            if isinstance(tile, Image):
+                tile_x, tile_y, _, _ = self._tile_box(column, row)
+                dest.blit_region(tile, x0 - tile_x, y0 - tile_y, x1 - x0, y1 - y0, x0 - x, y0 - y)
+            else:
+                dest.view(x0 - x, y0 - y, x1 - x0, y1 - y0).fill(*tile)
+
+    def flatten(self, x: int = 0, y: int = 0, width: int = None, height: int = None) -> Image:
+        """Returns a contiguous Image of a rectangle of the canvas (all of it by default)."""
+        width = self.width - x if width is None else width
+        height = self.height - y if height is None else height
+        image = Image(width, height)
+        if x < 0 or y < 0 or x + width > self.width or y + height > self.height:
+            image.fill(0, 0, 0, 0)
+        self.flatten_into(image, x, y)
+        return image
+
+    def compact(self) -> int:
+        """Turns allocated tiles whose pixels all have one color back into uniform tiles.
+
+        Returns the number of tiles released.
+        """
+        released = 0
+        for key, tile in list(self._tiles.items()):
+            if isinstance(tile, Image):
+                pixels = bytes(tile.buffer())
+                if pixels == pixels[:4] * (tile.width * tile.height):
+                    self._set_color(key[0], key[1], tuple(pixels[:4]))
+                    released += 1
+        return released
+
+
+class DrawList:
+    """A reusable list of blit/blend commands that is drawn with a single native call.
+
+    Commands run in the order they were added, with the same clipping as
+    blit/blend. The list keeps the source images alive until clear().
+    """
+    __slots__ = ("commands", "count", "capacity", "_images")
+
+    def __init__(self, capacity: int = 256):
+        self.commands = _ffi.ffi.new("draw_command[]", capacity)
+        self.count = 0
+        self.capacity = capacity
+        self._images = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        commands = _ffi.ffi.new("draw_command[]", capacity)
+        _ffi.ffi.memmove(commands, self.commands, self.count * _ffi.ffi.sizeof("draw_command"))
+        self.commands = commands
+        self.capacity = capacity
+
+    def add(self, image: Image, x: int, y: int, op: int = DRAW_OP_BLEND) -> int:
+        """Appends a command and returns its index."""
+        if self.count == self.capacity:
+            self._grow()
+        index = self.count
+        cmd = self.commands[index]
+        cmd.image = image.data
+        cmd.width = image.width
+        cmd.height = image.height
+        cmd.x = x
+        cmd.y = y
+        cmd.op = op
+        cmd.stride = image.stride
+        self._images.append(image)
+        self.count = index + 1
+        return index
+
+    def blit(self, image: Image, x: int, y: int) -> int:
+        return self.add(image, x, y, DRAW_OP_BLIT)
+
+    def blend(self, image: Image, x: int, y: int) -> int:
+        return self.add(image, x, y, DRAW_OP_BLEND)
+
+    def blend_premultiplied(self, image: Image, x: int, y: int) -> int:
+        return self.add(image, x, y, DRAW_OP_BLEND_PREMULTIPLIED)
+
+    def move(self, index: int, x: int, y: int):
+        """Changes the position of an existing command, so a list can be reused across frames."""
+        cmd = self.commands[index]
+        cmd.x = x
+        cmd.y = y
+
+    def clear(self):
+        self.count = 0
+        self._images.clear()
+
+    def draw(self, background: Image, bin_tiles: bool = True):
+        """Draws every command onto background; bin_tiles walks it in cache-sized row bands."""
+        _lib.draw_batch_strided(background.data, background.width, background.height, background.stride,
+                                self.commands, self.count, DRAW_BIN_TILES if bin_tiles else 0)
+        background._alpha = None
+        if background.damage is not None:
+            _lib.damage_add_commands(background.damage.list, self.commands, self.count)
+        if background._origin is not None:
+            x, y = background._origin
+            background._owner._written(x, y, background.width, background.height)
+
+    def recompose(self, dest: Image, clean: Image, damage: "DamageTracker"):
+        """Redraws only the damaged rectangles of dest: restores them from clean, then replays the commands.
+
+        clean must have the same size as dest. The rest of dest is left untouched.
+        """
+        _lib.recompose_damaged_strided(dest.data, dest.stride, clean.data, clean.stride, dest.width, dest.height,
+                                       self.commands, self.count, damage.list)
+        dest._alpha = None
+        if dest._origin is not None:
+            x, y = dest._origin
+            for r in damage.rects():
+                dest._owner._written(x + r[0], y + r[1], r[2], r[3])
+
+
+class GlyphBatch:
+    """Colored rectangles of one A8 coverage atlas (glyphs, icons), blended with a single native call.
+
+    The atlas is any buffer of atlas_height rows of atlas_width bytes,
+    stride bytes apart; the batch keeps it alive. Commands run in the order
+    they were added, clipped like Image.blend_mask(). Entries that reach
+    outside the atlas are skipped.
+    """
+    __slots__ = ("commands", "count", "capacity", "atlas", "atlas_width", "atlas_height", "atlas_stride", "_atlas")
+
+    def __init__(self, atlas, atlas_width: int, atlas_height: int, stride: int = None, capacity: int = 256):
+        self.atlas, _, self.atlas_stride = _pixel_buffer(atlas, atlas_width, atlas_height, "a8", stride, False)
+        self.atlas_width = atlas_width
+        self.atlas_height = atlas_height
+        self._atlas = atlas
+        self.commands = _ffi.ffi.new("mask_command[]", capacity)
+        self.count = 0
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        commands = _ffi.ffi.new("mask_command[]", capacity)
+        _ffi.ffi.memmove(commands, self.commands, self.count * _ffi.ffi.sizeof("mask_command"))
+        self.commands = commands
+        self.capacity = capacity
+
+    def add(self, atlas_x: int, atlas_y: int, width: int, height: int, x: int, y: int,
+            r: int, g: int, b: int, a: int = 255) -> int:
+        """Appends the atlas rectangle (atlas_x, atlas_y, width, height) drawn at (x, y) and returns its index."""
+        if self.count == self.capacity:
+            self._grow()
+        index = self.count
+        cmd = self.commands[index]
+        cmd.atlas_x = atlas_x
+        cmd.atlas_y = atlas_y
+        cmd.width = width
+        cmd.height = height
+        cmd.x = x
+        cmd.y = y
+        cmd.r = r
+        cmd.g = g
+        cmd.b = b
+        cmd.a = a
+        self.count = index + 1
+        return index
+
+    def move(self, index: int, x: int, y: int):
+        """Changes the position of an existing command."""
+        cmd = self.commands[index]
+        cmd.x = x
+        cmd.y = y
+
+    def clear(self):
+        self.count = 0
+
+    def draw(self, dest: Image, bin_tiles: bool = True):
+        """Draws every command onto dest; bin_tiles walks it in cache-sized row bands."""
+        _lib.blend_mask_batch(dest.data, dest.width, dest.height, dest.stride,
+                              self.atlas, self.atlas_width, self.atlas_height, self.atlas_stride,
+                              self.commands, self.count, DRAW_BIN_TILES if bin_tiles else 0)
+        dest._alpha = None
+        if dest.damage is not None:
+            for cmd in self.commands[0:self.count]:
+                _lib.damage_add(dest.damage.list, cmd.x, cmd.y, cmd.width, cmd.height)
+        if dest._origin is not None:
+            x, y = dest._origin
+            dest._owner._written(x, y, dest.width, dest.height)
+
+
+class DamageTracker:
+    """Collects the destination rectangles changed since the last clear().
+
+    Overlapping rectangles are merged, and the list is capped at
+    DAMAGE_MAX_RECTS entries by merging the closest ones.
+    """
+    __slots__ = ("list",)
+
+    def __init__(self, width: int, height: int):
+        self.list = _ffi.ffi.new("damage_list*")
+        _lib.damage_init(self.list, width, height)
+
+    def __len__(self) -> int:
+        return self.list.count
+
+    def add(self, x: int, y: int, width: int, height: int):
+        _lib.damage_add(self.list, x, y, width, height)
+
+    def add_draw_list(self, draw_list: DrawList):
+        """Marks every rectangle the draw list covers, e.g. before moving its sprites and after."""
+        _lib.damage_add_commands(self.list, draw_list.commands, draw_list.count)
+
+    def add_diff(self, previous: Image, current: Image, tile: int = 64) -> int:
+        """Marks the tile x tile blocks where current differs from previous. Returns how many changed."""
+        if (previous.width, previous.height) != (current.width, current.height):
+            raise ValueError(f"cannot diff a {previous.width}x{previous.height} frame "
+                             f"against a {current.width}x{current.height} one")
+        if tile < 1:
+            raise ValueError("tile must be at least 1")
+        return _check_diff(_lib.auto_diff_regions_strided(previous.data, previous.stride, current.data, current.stride,
+                                                          current.width, current.height, tile, self.list))
+
+    def clear(self):
+        _lib.damage_clear(self.list)
+
+    def rects(self) -> list:
+        """Returns the damaged rectangles as (x, y, width, height) tuples."""
+        return [(r.x, r.y, r.width, r.height) for r in self.list.rects[0:self.list.count]]
+
+    def bounds(self):
+        """Returns the (x, y, width, height) box around all damage, or None when nothing changed."""
+        rects = self.rects()
+        if not rects:
+            return None
+        x0 = min(r[0] for r in rects)
+        y0 = min(r[1] for r in rects)
+        x1 = max(r[0] + r[2] for r in rects)
+        y1 = max(r[1] + r[3] for r in rects)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+
+def _versioned(name: str, doc: str) -> property:
+    # A Layer attribute whose changes increment the layer's version.
+    attribute = "_" + name
+
+    def get(self):
+        return getattr(self, attribute)
+
+    def set(self, value):
+        if getattr(self, attribute) != value:
+            setattr(self, attribute, value)
+            self.version += 1
+
+    return property(get, set, doc=doc)
+
+class Layer:
+    """An image that a LayerStack draws at (x, y) with an opacity from 0 to 255.
+
+    Assigning image, x, y, opacity or visible increments version, and so does
+    touch(). A stack rebuilds a cached surface only when the version of one
+    of its layers changed, so call touch() after drawing into image.
+    """
+    __slots__ = ("_image", "_x", "_y", "_opacity", "_visible", "version", "_faded", "_faded_version")
+
+    image = _versioned("image", "The Image drawn for this layer.")
+    x = _versioned("x", "Horizontal position in the stack.")
+    y = _versioned("y", "Vertical position in the stack.")
+    visible = _versioned("visible", "Hidden layers are skipped.")
+
+    def __init__(self, image: Image, x: int = 0, y: int = 0, opacity: int = 255, visible: bool = True):
+        self._image = image
+        self._x = x
+        self._y = y
+        self._opacity = 255
+        self._visible = visible
+        self.version = 0
+        self._faded = None
+        self._faded_version = None
+        self.opacity = opacity
+
+    def __repr__(self) -> str:
+        return (f"<pycrgba.Layer {self._image.width}x{self._image.height} at ({self._x}, {self._y}) "
+                f"opacity={self._opacity} version={self.version}>")
+
+    @property
+    def opacity(self) -> int:
+        """0 (invisible) to 255 (the image's own alpha)."""
+        return self._opacity
+
+    @opacity.setter
+    def opacity(self, opacity: int):
+        if not 0 <= opacity <= 255:
+            raise ValueError(f"opacity must be between 0 and 255, got {opacity}")
+        if opacity != self._opacity:
+            self._opacity = opacity
+            self.version += 1
+
+    def touch(self):
+        """Marks the layer's pixels as changed."""
+        self.version += 1
+
+    def _straight(self) -> Image:
+        # The image with the opacity folded into its alpha, cached per version.
+        if self._opacity == 255:
+            return self._image
+        if self._faded_version != self.version:
+            if self._faded is not None:
+                self._faded.close()
+            self._faded = self._image.copy()
+            self._faded.multiply(255, 255, 255, self._opacity)
+            self._faded_version = self.version
+        return self._faded
+
+class LayerStack:
+    """A width x height stack of layers, composed bottom to top with blend().
+
+    compose() keeps the unchanged layers at the bottom of the stack in a
+    cached surface: they are flattened onto the background once and then
+    drawn with a single blit, and every layer from the first changed one up
+    is blended directly. The cache is rebuilt only when one of its layers
+    changes, so a scene whose changing layers sit near the top costs about
+    one blit per frame plus the layers above them.
+
+    The cached surface is made with the same blends compose() would
+    otherwise run, so a frame depends only on the scene, not on which
+    layers changed in earlier frames.
+    """
+    __slots__ = ("width", "height", "background", "layers", "rebuilds", "_seen", "_cache")
+
+    def __init__(self, width: int, height: int, background: tuple = (0, 0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.background = tuple(background)
+        self.layers = []
+        self.rebuilds = 0
+        self._seen = {}  # Layer -> version at the previous compose()
+        self._cache = None  # (key, surface) of the flattened bottom layers
+
+    def __enter__(self) -> "LayerStack":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self) -> str:
+        cached = len(self._cache[0]) - 1 if self._cache is not None else 0
+        return f"<pycrgba.LayerStack {self.width}x{self.height} layers={len(self.layers)} cached={cached}>"
+
+    def add(self, image: Image, x: int = 0, y: int = 0, opacity: int = 255) -> Layer:
+        """Adds a layer on top of the stack and returns it."""
+        layer = Layer(image, x, y, opacity)
+        self.layers.append(layer)
+        return layer
+
+    def remove(self, layer: Layer):
+        self.layers.remove(layer)
+
+    def close(self):
+        """Frees the cached surface; the next compose() rebuilds it."""
+        if self._cache is not None:
+            self._cache[1].close()
+            self._cache = None
+        self._seen.clear()
+        for layer in self.layers:
+            if layer._faded is not None:
+                layer._faded.close()
+                layer._faded = layer._faded_version = None
+
+    def compose(self, dest: Image):
+        """Draws the stack onto dest, which must be width x height; every pixel of dest is replaced."""
+        if (dest.width, dest.height) != (self.width, self.height):
+            raise ValueError(f"cannot compose a {self.width}x{self.height} stack "
+                             f"onto a {dest.width}x{dest.height} image")
+        layers = [layer for layer in self.layers if layer._visible and layer._opacity]
+        bottom = 0
+        while bottom < len(layers) and self._seen.get(layers[bottom]) == layers[bottom].version:
+            bottom += 1
+        self._seen = {layer: layer.version for layer in layers}
+
+        # Straight alpha blending is not associative, so only layers drawn
+        # directly onto the background can be flattened without changing the
+        # result; the rest are blended one by one.
+        if bottom:
+            key = tuple((layer, layer.version) for layer in layers[:bottom]) + (self.background,)
+            if self._cache is None or self._cache[0] != key:
+                if self._cache is not None:
+                    self._cache[1].close()
+                self._cache = (key, self._flatten(layers[:bottom]))
+            dest.blit(self._cache[1])
+        else:
+            dest.fill(*self.background)
+        for layer in layers[bottom:]:
+            dest.blend(layer._straight(), layer._x, layer._y)
+
+    def _flatten(self, members: list) -> Image:
+        # Draws the bottom layers onto the background exactly like compose()
+        # would draw them.
+        self.rebuilds += 1
+        surface = Image(self.width, self.height)
+        surface.fill(*self.background)
+        for layer in members:
+            surface.blend(layer._straight(), layer._x, layer._y)
+        return surface
+
+
+def render_regions(executor, frame: Image, function, *args, rows: int = None, columns: int = 1) -> list:
+    """Splits a shared frame into rows x columns regions and renders each one in executor.
+
+    function(region, x, y, *args) is called once per region, where region is
+    a view of the frame's rectangle at (x, y). With a ProcessPoolExecutor the
+    frame, and any shared images in args, reach the workers by name, so no
+    pixels are copied and the kernels run on every core without sharing a
+    GIL. function must be picklable (defined at module level). rows defaults
+    to the number of CPUs. Returns the results in region order, once every
+    region is done.
+    """
+    if frame.shared_name is None:
+        raise ValueError("render_regions needs a frame created with Image.create_shared()")
+    if rows is None:
+        rows = os.cpu_count() or 1
+    rows = max(1, min(rows, frame.height))
+    columns = max(1, min(columns, frame.width))
+    regions = []
+    for row in range(rows):
+        y0, y1 = frame.height * row // rows, frame.height * (row + 1) // rows
+        for column in range(columns):
+            x0, x1 = frame.width * column // columns, frame.width * (column + 1) // columns
+            regions.append((x0, y0, x1 - x0, y1 - y0))
+    futures = [executor.submit(function, frame.view(x, y, width, height), x, y, *args) for x, y, width, height in regions]
+    results = [future.result() for future in futures]
+    for x, y, width, height in regions:
+        frame._written(x, y, width, height)
+    return results
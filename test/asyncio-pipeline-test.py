@@ -0,0 +1,80 @@
+import asyncio
+import time
+import numpy as np
+from pycrgba import Image, auto_blend
+from pycrgba import aio
+
+async def max_loop_stall(work):
+    # Runs work() while a ticker task measures the longest gap between its wake-ups.
+    stalls = []
+    done = False
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    start_time = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start_time
+    done = True
+    await task
+    return elapsed, max(stalls)
+
+async def pipeline(ring, background, overlay, frames):
+    sent = []
+
+    async def render():
+        for i in range(frames):
+            async with ring.render() as frame:
+                await aio.blit(frame, background)
+                await aio.blend(frame, overlay, i * 8, 0)
+
+    async def send():
+        for _ in range(frames):
+            async with ring.consume() as frame:
+                sent.append(await aio.to_bytes(frame, "bgra"))
+
+    await asyncio.gather(render(), send())
+    return sent
+
+async def test_asyncio_pipeline():
+    width, height = 3840, 2160
+    rng = np.random.default_rng(11)
+    background = Image.from_array(rng.integers(0, 256, (height, width, 4), dtype=np.uint8))
+    overlay = Image.from_array(rng.integers(0, 256, (height, width, 4), dtype=np.uint8))
+    target = Image(width, height)
+
+    async def blocking():
+        for _ in range(10):
+            auto_blend(target.data, overlay.data, width, height, width, height, 0, 0)
+
+    async def awaited():
+        for _ in range(10):
+            await aio.blend(target, overlay, 0, 0)
+
+    blocking_time, blocking_stall = await max_loop_stall(blocking)
+    awaited_time, awaited_stall = await max_loop_stall(awaited)
+    print(f"10 4K blends called directly: {blocking_time * 1000:.1f} ms, longest event loop stall {blocking_stall * 1000:.1f} ms")
+    print(f"10 4K blends awaited:         {awaited_time * 1000:.1f} ms, longest event loop stall {awaited_stall * 1000:.1f} ms")
+
+    frames = 12
+    with aio.FrameRing(width, height, count=3) as ring:
+        start_time = time.perf_counter()
+        sent = await pipeline(ring, background, overlay, frames)
+        pipeline_time = (time.perf_counter() - start_time) / frames
+        buffers = {frame.data for frame in ring.frames}
+
+    expected = Image(width, height)
+    expected.blit(background)
+    expected.blend(overlay, (frames - 1) * 8, 0)
+    print(f"Triple-buffered render + convert: {pipeline_time * 1000:.1f} ms/frame over {len(buffers)} preallocated frames")
+    print(f"Last frame matches a direct render: {sent[-1] == expected.to_bytes('bgra')}")
+
+if __name__ == "__main__":
+    asyncio.run(test_asyncio_pipeline())
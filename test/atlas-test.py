@@ -0,0 +1,55 @@
+import time
+import random
+import numpy as np
+from pycrgba import Image, Atlas, DrawList
+
+def test_atlas(iterations=20, sprites=2000):
+    width, height = 1920, 1080
+    rng = random.Random(0)
+    np_rng = np.random.default_rng(0)
+
+    icons = []
+    for _ in range(200):
+        icon = Image(rng.randint(8, 48), rng.randint(8, 48))
+        np.asarray(icon)[:] = np_rng.integers(0, 256, (icon.height, icon.width, 4), dtype=np.uint8)
+        icons.append(icon)
+
+    atlas = Atlas(512, 512, padding=1)
+    # Shelves pack tightest when the tallest sprites go in first.
+    for i in sorted(range(len(icons)), key=lambda i: -icons[i].height):
+        atlas.insert(icons[i], f"icon{i}")
+    entries_match = all(np.array_equal(np.asarray(atlas[f"icon{i}"]), np.asarray(icon)) for i, icon in enumerate(icons))
+
+    positions = [(rng.randrange(len(icons)), rng.randint(-48, width), rng.randint(-48, height)) for _ in range(sprites)]
+    separate = DrawList(sprites)
+    packed = DrawList(sprites)
+    for index, x, y in positions:
+        separate.blend(icons[index], x, y)
+        packed.blend(atlas[f"icon{index}"], x, y)
+
+    background_separate = Image(width, height)
+    background_packed = Image(width, height)
+    total_separate_time = 0
+    total_packed_time = 0
+
+    for _ in range(iterations):
+        background_separate.fill(30, 30, 30, 255)
+        background_packed.fill(30, 30, 30, 255)
+
+        start_time = time.perf_counter()
+        separate.draw(background_separate)
+        total_separate_time += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        packed.draw(background_packed)
+        total_packed_time += time.perf_counter() - start_time
+
+    results_match = np.array_equal(np.asarray(background_separate), np.asarray(background_packed))
+
+    print(f"{len(atlas)} icons packed into a {atlas.image.width}x{atlas.image.height} atlas, entries match: {entries_match}")
+    print(f"DrawList from separate images: {iterations / total_separate_time:.2f} FPS")
+    print(f"DrawList from the atlas: {iterations / total_packed_time:.2f} FPS")
+    print(f"Results match: {results_match}")
+
+if __name__ == "__main__":
+    test_atlas()
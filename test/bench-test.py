@@ -0,0 +1,24 @@
+import json
+import os
+import tempfile
+from pycrgba import bench
+
+def test_bench():
+    path = os.path.join(tempfile.mkdtemp(), "baseline.json")
+    exit_code = bench.main(["--quick", "--kernels", "fill,blend,diff_regions", "--sizes", "sprite,256x256",
+                            "--offsets", "origin,negative", "--output", path])
+    with open(path) as f:
+        report = json.load(f)
+
+    # A baseline three times faster than this run must be reported as a regression.
+    faster = {"results": [dict(r, median_ns=r["median_ns"] // 3) for r in report["results"]]}
+    with open(path, "w") as f:
+        json.dump(faster, f)
+    regression_exit_code = bench.main(["--quick", "--kernels", "fill", "--sizes", "256x256", "--baseline", path])
+    os.remove(path)
+
+    print(f"SIMD tier: {report['meta']['simd_tier']}, {len(report['results'])} cases")
+    print(f"Exit code without baseline: {exit_code}, against a 3x faster baseline: {regression_exit_code}")
+
+if __name__ == "__main__":
+    test_bench()
@@ -50,5 +50,34 @@ def test_blend(iterations=100):
     free_image_rgba(background)
     free_image_rgba(overlay)
 
+def test_sparse_blend(iterations=100):
+    """UI-style overlay: mostly fully transparent or fully opaque spans."""
+    width, height = 1920, 1080
+    background = create_image_rgba(width, height)
+    overlay = create_image_rgba(width, height)
+    fill_image_rgba(overlay, width, height, 0, 0, 0, 0)
+    for y in range(0, height, 3):
+        for x in range(0, width, 16):
+            index = (y * width + x) * 4
+            overlay[index:index + 4] = bytes([0, 255, 0, 255 if x % 64 else 96])
+
+    results = {}
+    for func in [blend, blend_avx2, blend_neon]:
+        fill_image_rgba(background, width, height, 255, 0, 0, 255)
+        start_time = time.time()
+        for _ in range(iterations):
+            func(background, overlay, width, height, width, height, 0, 0)
+        fps = iterations / (time.time() - start_time)
+        results[func.__name__] = (fps, bytes(background[0:width * height * 4]))
+
+    print(f"Sparse overlay, resolution: {width}x{height}")
+    reference = results["blend"][1]
+    for name, (fps, pixels) in results.items():
+        print(f"{name}: {fps:.2f} FPS ({'Results match' if pixels == reference else 'Results differ'})")
+
+    free_image_rgba(background)
+    free_image_rgba(overlay)
+
 if __name__ == "__main__":
-    test_blend()
\ No newline at end of file
+    test_blend()
+    test_sparse_blend()
\ No newline at end of file
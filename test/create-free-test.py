@@ -1,5 +1,5 @@
 import time
-from pycrgba import create_image_rgba, free_image_rgba
+from pycrgba import create_image_rgba, free_image_rgba, pool_enable, pool_disable, pool_stats
 
 def test_create_free(iterations=100):
     width, height = 1920, 1080
@@ -23,9 +23,17 @@ def test_create_free(iterations=100):
     create_fps = 1 / avg_create_time if avg_create_time > 0 else float('inf')
     free_fps = 1 / avg_free_time if avg_free_time > 0 else float('inf')
 
-    print(f"Resolution: {width}x{height}")
+    return create_fps, free_fps
+
+if __name__ == "__main__":
+    create_fps, free_fps = test_create_free()
+    print("Resolution: 1920x1080")
     print(f"create_image_rgba: {create_fps:.2f} FPS")
     print(f"free_image_rgba: {free_fps:.2f} FPS")
 
-if __name__ == "__main__":
-    test_create_free()
+    pool_enable()
+    create_fps, free_fps = test_create_free()
+    print(f"create_image_rgba (pooled): {create_fps:.2f} FPS")
+    print(f"free_image_rgba (pooled): {free_fps:.2f} FPS")
+    print(f"Pool: {pool_stats()}")
+    pool_disable()
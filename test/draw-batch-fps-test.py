@@ -0,0 +1,50 @@
+import time
+import random
+import numpy as np
+from pycrgba import Image, DrawList, auto_blend
+
+def test_draw_batch(iterations=20, sprites=2000):
+    width, height = 1920, 1080
+    sprite_size = 32
+    rng = random.Random(0)
+
+    sprite = Image(sprite_size, sprite_size)
+    np.asarray(sprite)[:] = np.random.default_rng(0).integers(0, 256, (sprite_size, sprite_size, 4), dtype=np.uint8)
+    positions = [(rng.randint(-sprite_size, width), rng.randint(-sprite_size, height)) for _ in range(sprites)]
+
+    draw_list = DrawList(sprites)
+    for x, y in positions:
+        draw_list.blend(sprite, x, y)
+
+    background_calls = Image(width, height)
+    background_batch = Image(width, height)
+
+    total_calls_time = 0
+    total_batch_time = 0
+
+    for _ in range(iterations):
+        background_calls.fill(30, 30, 30, 255)
+        background_batch.fill(30, 30, 30, 255)
+
+        start_time = time.perf_counter()
+        for x, y in positions:
+            auto_blend(background_calls.data, sprite.data, width, height, sprite_size, sprite_size, x, y)
+        total_calls_time += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        draw_list.draw(background_batch)
+        total_batch_time += time.perf_counter() - start_time
+
+    results_match = np.array_equal(np.asarray(background_calls), np.asarray(background_batch))
+
+    calls_fps = iterations / total_calls_time
+    batch_fps = iterations / total_batch_time
+
+    print(f"Resolution: {width}x{height}, {sprites} sprites of {sprite_size}x{sprite_size}")
+    print(f"auto_blend per sprite: {calls_fps:.2f} FPS")
+    print(f"DrawList.draw: {batch_fps:.2f} FPS")
+    print(f"Results match: {results_match}")
+    print(f"Speed-up: {batch_fps / calls_fps:.2f}x")
+
+if __name__ == "__main__":
+    test_draw_batch()
@@ -0,0 +1,40 @@
+import os
+import time
+import tempfile
+import numpy as np
+from pycrgba import Image
+
+def test_file_image():
+    width, height = 50000, 25000   # 1.25 gigapixels, 5 GB file
+    path = os.path.join(tempfile.mkdtemp(), "canvas.rgba")
+
+    start_time = time.perf_counter()
+    canvas = Image.create_file(path, width, height)
+    create_time = time.perf_counter() - start_time
+
+    tile = Image(256, 256)
+    for i in range(64):
+        tile.fill(i, 255 - i, 128, 255)
+        canvas.blit(tile, (i * 7919) % (width - 256), (i * 104729) % (height - 256))
+    canvas.close()
+
+    start_time = time.perf_counter()
+    canvas = Image.open_file(path, writable=False)
+    open_time = time.perf_counter() - start_time
+
+    tiles_match = all(
+        np.array_equal(np.asarray(canvas.view((i * 7919) % (width - 256), (i * 104729) % (height - 256), 256, 256))[0, 0],
+                       [i, 255 - i, 128, 255])
+        for i in range(64))
+    canvas.close()
+    tile.close()
+
+    # st_blocks is only reported on POSIX; sparse files only store the tiles that were written.
+    on_disk = getattr(os.stat(path), "st_blocks", 0) * 512
+    print(f"{width}x{height} canvas, {os.path.getsize(path) / 1e9:.1f} GB file, {on_disk / 1e6:.0f} MB on disk")
+    print(f"create_file: {create_time * 1000:.2f} ms, open_file: {open_time * 1000:.2f} ms")
+    print(f"Tiles match after reopening: {tiles_match}")
+    os.remove(path)
+
+if __name__ == "__main__":
+    test_file_image()
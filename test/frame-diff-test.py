@@ -0,0 +1,35 @@
+import time
+import numpy as np
+from pycrgba import Image
+
+def test_frame_diff():
+    width, height = 3840, 2160
+    rng = np.random.default_rng(3)
+    previous = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    current = previous.copy()
+    current[400:460, 1000:1180] = 255       # a moved window
+    current[2000, 3000, 1] ^= 1             # a single changed pixel
+    prev_image, cur_image = Image.from_array(previous), Image.from_array(current)
+
+    start_time = time.perf_counter()
+    for _ in range(20):
+        damage = cur_image.diff(prev_image, tile=64)
+    diff_time = (time.perf_counter() - start_time) / 20
+
+    start_time = time.perf_counter()
+    mask = (previous != current).any(axis=2)
+    numpy_time = time.perf_counter() - start_time
+
+    covered = np.zeros((height, width), dtype=bool)
+    for x, y, w, h in damage.rects():
+        covered[y:y + h, x:x + w] = True
+    changed_pixels_covered = bool(covered[mask].all())
+    sent = covered.sum() / covered.size
+
+    print(f"Changed regions: {damage.rects()}")
+    print(f"Bounding box: {damage.bounds()}")
+    print(f"Image.diff: {diff_time * 1000:.2f} ms, NumPy mask: {numpy_time * 1000:.2f} ms")
+    print(f"Every changed pixel covered: {changed_pixels_covered}, {sent * 100:.2f}% of the frame to send")
+
+if __name__ == "__main__":
+    test_frame_diff()
@@ -0,0 +1,45 @@
+import time
+import numpy as np
+from pycrgba import Image, DrawList, auto_fill_image_rgba, enable_stats, stats, reset_stats
+
+def per_call_ns(function, calls=100000):
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start_time) / calls * 1e9
+
+def test_kernel_stats():
+    frame = Image(1920, 1080)
+    rng = np.random.default_rng(5)
+    sprite = Image.from_array(rng.integers(0, 256, (64, 64, 4), dtype=np.uint8))
+    sprites = DrawList()
+    for _ in range(500):
+        sprites.blend(sprite, int(rng.integers(-32, 1920)), int(rng.integers(-32, 1080)))
+
+    enable_stats()
+    reset_stats()
+    for _ in range(10):
+        frame.fill(0, 0, 0, 255)
+        sprites.draw(frame)
+        frame.resized(480, 270, "area")
+        frame.resized(960, 540)
+    for kernel, tiers in stats().items():
+        for tier, counters in tiers.items():
+            seconds = counters["total_ns"] / 1e9
+            print(f"{kernel:>16} {tier:>6}: {counters['calls']:4d} calls, {counters['pixels'] / 1e6:8.2f} MP, "
+                  f"{counters['bytes'] / seconds / 1e9 if seconds else 0:6.2f} GB/s, max {counters['max_ns'] / 1e3:.1f} us")
+
+    reset_stats()
+    print(f"Counters after reset_stats(): {stats()}")
+
+    tiny = Image(8, 8)
+    fill_tiny = lambda: auto_fill_image_rgba(tiny.data, 8, 8, 1, 2, 3, 4)
+    enable_stats(False)
+    disabled_ns = per_call_ns(fill_tiny)
+    enable_stats()
+    enabled_ns = per_call_ns(fill_tiny)
+    enable_stats(False)
+    print(f"8x8 fill: {disabled_ns:.0f} ns with stats off, {enabled_ns:.0f} ns with stats on")
+
+if __name__ == "__main__":
+    test_kernel_stats()
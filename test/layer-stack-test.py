@@ -0,0 +1,82 @@
+import time
+import numpy as np
+from pycrgba import Image, LayerStack, DamageTracker
+
+def test_layer_stack():
+    width, height = 3840, 2160
+    frames = 20
+    rng = np.random.default_rng(17)
+    pixels = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    pixels[..., 3] = 255
+    background = Image.from_array(pixels)
+    chrome = Image.from_array(rng.integers(0, 256, (height, width, 4), dtype=np.uint8))
+    vignette = Image.from_array(rng.integers(0, 256, (height, width, 4), dtype=np.uint8))
+    content = Image.from_array(rng.integers(0, 256, (720, 1280, 4), dtype=np.uint8))
+    watermark = Image.from_array(rng.integers(0, 256, (200, 600, 4), dtype=np.uint8))
+    frame = Image(width, height)
+
+    start_time = time.perf_counter()
+    for i in range(frames):
+        frame.blit(background)
+        frame.blend(chrome)
+        frame.blend(vignette)
+        frame.blend(content, 100 + i * 10, 300)
+        frame.blend(watermark, 3100, 1900)
+    direct_time = (time.perf_counter() - start_time) / frames
+    expected = np.asarray(frame).copy()
+
+    stack = LayerStack(width, height)
+    stack.add(background)
+    stack.add(chrome)
+    stack.add(vignette)
+    moving = stack.add(content, 100, 300)
+    stack.add(watermark, 3100, 1900)
+    start_time = time.perf_counter()
+    for i in range(frames):
+        moving.x = 100 + i * 10
+        stack.compose(frame)
+    stack_time = (time.perf_counter() - start_time) / frames
+    moving_rebuilds = stack.rebuilds
+
+    start_time = time.perf_counter()
+    for _ in range(frames):
+        stack.compose(frame)
+    static_time = (time.perf_counter() - start_time) / frames
+    difference = np.abs(np.asarray(frame).astype(int) - expected.astype(int)).max()
+
+    print(f"Blending every layer: {direct_time * 1000:.2f} ms/frame")
+    print(f"LayerStack, one moving layer: {stack_time * 1000:.2f} ms/frame ({moving_rebuilds} cache rebuilds)")
+    print(f"LayerStack, nothing changing: {static_time * 1000:.2f} ms/frame ({stack.rebuilds - moving_rebuilds} cache rebuilds)")
+    print(f"Largest channel difference from blending every layer: {difference}")
+    stack.close()
+
+def test_cache_history():
+    # A frame must depend only on the scene: touching a lower layer for a few
+    # frames and then leaving it alone must not change any pixel.
+    width, height = 640, 360
+    rng = np.random.default_rng(5)
+    images = [Image.from_array(rng.integers(0, 256, (height, width, 4), dtype=np.uint8)) for _ in range(8)]
+    frame = Image(width, height)
+    frame.fill(0, 0, 0, 255)
+    for image in images:
+        frame.blend(image)
+    expected = np.asarray(frame).copy()
+
+    stack = LayerStack(width, height, background=(0, 0, 0, 255))
+    layers = [stack.add(image) for image in images]
+    reference = Image.from_array(expected)
+    damage = DamageTracker(width, height)
+    largest = 0
+    for i in range(6):
+        if i < 3:
+            layers[1].touch()
+        stack.compose(frame)
+        damage.add_diff(reference, frame)
+        largest = max(largest, np.abs(np.asarray(frame).astype(int) - expected.astype(int)).max())
+    print(f"Touching a lower layer, then leaving it: largest difference {largest}, "
+          f"damaged regions {len(damage)}")
+    stack.close()
+
+if __name__ == "__main__":
+    test_layer_stack()
+    test_cache_history()
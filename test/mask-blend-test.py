@@ -0,0 +1,52 @@
+import time
+import numpy as np
+from pycrgba import Image, GlyphBatch
+
+def test_mask_blend(iterations=100):
+    width, height = 1920, 1080
+    rng = np.random.default_rng(0)
+    mask = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    mask[:, ::3] = 0
+    color = (200, 40, 90, 180)
+
+    # Reference: the same colour as a full RGBA overlay with alpha = coverage * a / 255.
+    overlay = Image(width, height)
+    overlay_pixels = np.asarray(overlay)
+    overlay_pixels[..., :3] = color[:3]
+    coverage = mask.astype(np.uint32) * color[3] + 128
+    overlay_pixels[..., 3] = (coverage + (coverage >> 8)) >> 8
+
+    expected = Image(width, height)
+    expected.fill(10, 20, 30, 255)
+    expected.blend(overlay, 0, 0)
+    image = Image(width, height)
+    image.fill(10, 20, 30, 255)
+    image.blend_mask(mask, width, height, 0, 0, *color)
+    print(f"blend_mask matches blend: {bool((np.asarray(image) == np.asarray(expected)).all())}")
+
+    start_time = time.time()
+    for _ in range(iterations):
+        image.blend_mask(mask, width, height, 0, 0, *color)
+    print(f"blend_mask: {iterations / (time.time() - start_time):.0f} fps")
+    start_time = time.time()
+    for _ in range(iterations):
+        image.blend(overlay, 0, 0)
+    print(f"blend with expanded overlay: {iterations / (time.time() - start_time):.0f} fps")
+
+    # 16x16 glyph cells, 2000 glyphs per frame.
+    atlas = rng.integers(0, 256, (256, 256), dtype=np.uint8)
+    glyphs = GlyphBatch(atlas, 256, 256)
+    for i in range(2000):
+        cell = i % 256
+        glyphs.add((cell % 16) * 16, (cell // 16) * 16, 16, 16, (i * 17) % width, (i * 7) % height, 255, 255, 255)
+    start_time = time.time()
+    for _ in range(iterations):
+        glyphs.draw(image)
+    print(f"GlyphBatch 2000 glyphs: {iterations / (time.time() - start_time):.0f} fps")
+
+    overlay.close()
+    expected.close()
+    image.close()
+
+if __name__ == "__main__":
+    test_mask_blend()
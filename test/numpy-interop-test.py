@@ -0,0 +1,49 @@
+import mmap
+import numpy as np
+from pycrgba import Image
+
+def test_numpy_interop():
+    width, height = 640, 480
+
+    # NumPy array -> Image: kernels write straight into the array
+    array = np.zeros((height, width, 4), dtype=np.uint8)
+    image = Image.from_array(array)
+    image.fill(10, 20, 30, 255)
+    wrap_ok = bool((array == [10, 20, 30, 255]).all())
+
+    # Image -> NumPy array: the array sees later writes without a copy
+    owned = Image(width, height)
+    view = np.asarray(owned)
+    owned.fill(1, 2, 3, 4)
+    export_ok = view.shape == (height, width, 4) and bool((view == [1, 2, 3, 4]).all())
+
+    # bytearray and mmap buffers
+    raw = bytearray(width * height * 4)
+    Image.from_buffer(raw, width, height).fill(5, 6, 7, 8)
+    bytearray_ok = raw[:4] == bytearray([5, 6, 7, 8])
+
+    mapped = mmap.mmap(-1, width * height * 4)
+    mapped_image = Image.from_buffer(mapped, width, height)
+    mapped_image.blit(owned)
+    mmap_ok = mapped[:4] == bytes([1, 2, 3, 4])
+    mapped_image.close()
+    mapped.close()
+
+    try:
+        Image.from_array(np.zeros((height, width, 3), dtype=np.uint8))
+        shape_check_ok = False
+    except ValueError:
+        shape_check_ok = True
+
+    print(f"Resolution: {width}x{height}")
+    print(f"Wrap NumPy array: {wrap_ok}")
+    print(f"Export to NumPy: {export_ok}")
+    print(f"Wrap bytearray: {bytearray_ok}")
+    print(f"Wrap mmap: {mmap_ok}")
+    print(f"Rejects wrong shape: {shape_check_ok}")
+
+    image.close()
+    owned.close()
+
+if __name__ == "__main__":
+    test_numpy_interop()
@@ -0,0 +1,49 @@
+import time
+import numpy as np
+from pycrgba import Image, blit_same_size
+
+def test_pixel_formats(iterations=100):
+    width, height = 1920, 1080
+    rng = np.random.default_rng(0)
+    image = Image(width, height)
+    pixels = np.asarray(image)
+    pixels[:] = rng.integers(0, 256, pixels.shape, dtype=np.uint8)
+
+    expected = {
+        "bgra": pixels[..., [2, 1, 0, 3]],
+        "argb": pixels[..., [3, 0, 1, 2]],
+        "rgb24": pixels[..., :3],
+        "a8": pixels[..., 3:],
+    }
+    for name, reference in expected.items():
+        exported = image.to_bytes(name)
+        export_ok = bytes(np.ascontiguousarray(reference)) == exported
+
+        restored = Image.from_pixels(exported, width, height, name)
+        restored_pixels = np.asarray(restored)
+        if name in ("bgra", "argb"):
+            import_ok = bool((restored_pixels == pixels).all())
+        elif name == "rgb24":
+            import_ok = bool((restored_pixels[..., :3] == pixels[..., :3]).all() and (restored_pixels[..., 3] == 255).all())
+        else:
+            import_ok = bool((restored_pixels[..., 3] == pixels[..., 3]).all() and (restored_pixels[..., :3] == 255).all())
+
+        out = bytearray(len(exported))
+        start_time = time.time()
+        for _ in range(iterations):
+            image.export_pixels(out, name)
+        fps = iterations / (time.time() - start_time)
+        print(f"{name}: export {export_ok}, import {import_ok}, {fps:.0f} fps")
+        restored.close()
+
+    copy = Image(width, height)
+    start_time = time.time()
+    for _ in range(iterations):
+        blit_same_size(image.data, copy.data, width, height, 4)
+    print(f"memcpy reference: {iterations / (time.time() - start_time):.0f} fps")
+
+    image.close()
+    copy.close()
+
+if __name__ == "__main__":
+    test_pixel_formats()
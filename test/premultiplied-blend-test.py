@@ -0,0 +1,74 @@
+import time
+from pycrgba import (
+    Image, create_image_rgba, free_image_rgba, fill_image_rgba, blend,
+    premultiply, blend_premultiplied, blend_premultiplied_avx2, blend_premultiplied_neon
+)
+
+def read_bytes(image, width, height):
+    return bytes(image[0:width * height * 4])
+
+def fill_gradient(image, width, height):
+    for y in range(height):
+        for x in range(width):
+            index = (y * width + x) * 4
+            image[index] = x % 256
+            image[index + 1] = y % 256
+            image[index + 2] = (x + y) % 256
+            image[index + 3] = (x * 7 + y) % 256
+
+def test_blend_premultiplied(iterations=100):
+    width, height = 1920, 1080
+    background = create_image_rgba(width, height)
+    overlay = create_image_rgba(width, height)
+    fill_image_rgba(background, width, height, 255, 0, 0, 255)
+    fill_gradient(overlay, width, height)
+
+    start_time = time.time()
+    for _ in range(iterations):
+        blend(background, overlay, width, height, width, height, 0, 0)
+    blend_fps = iterations / (time.time() - start_time)
+
+    # Sprites are premultiplied once, at load time.
+    premultiply(overlay, width, height)
+
+    results = {}
+    for func in [blend_premultiplied, blend_premultiplied_avx2, blend_premultiplied_neon]:
+        fill_image_rgba(background, width, height, 255, 0, 0, 255)
+        total_time = 0
+        for _ in range(iterations):
+            start_time = time.time()
+            func(background, overlay, width, height, width, height, 0, 0)
+            total_time += time.time() - start_time
+        results[func.__name__] = (iterations / total_time, read_bytes(background, width, height))
+
+    print(f"Resolution: {width}x{height}")
+    print(f"blend (straight alpha): {blend_fps:.2f} FPS")
+    reference = results["blend_premultiplied"][1]
+    for name, (fps, pixels) in results.items():
+        print(f"{name}: {fps:.2f} FPS ({'Results match' if pixels == reference else 'Results differ'})")
+
+    free_image_rgba(background)
+    free_image_rgba(overlay)
+
+def test_additive_overlay():
+    # Premultiplied pixels with zero alpha but some color add to the background,
+    # so a cached analyze_alpha() must not skip or crop them away.
+    background = Image(16, 16)
+    background.fill(10, 10, 10, 255)
+    overlay = Image(16, 16)
+    overlay.fill(0, 0, 0, 0)
+    overlay.view(4, 4, 8, 8).fill(50, 0, 0, 0)
+    overlay.view(6, 6, 2, 2).fill(0, 40, 0, 128)
+
+    plain = background.copy()
+    plain.blend_premultiplied(overlay, 1, 1)
+    info = overlay.analyze_alpha()
+    analyzed = background.copy()
+    analyzed.blend_premultiplied(overlay, 1, 1)
+    same = plain.to_bytes() == analyzed.to_bytes()
+    print(f"Additive overlay, analysis {info}")
+    print(f"blend_premultiplied with cached analysis: {'Results match' if same else 'Results differ'}")
+
+if __name__ == "__main__":
+    test_blend_premultiplied()
+    test_additive_overlay()
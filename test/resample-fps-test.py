@@ -0,0 +1,70 @@
+import time
+from pycrgba import (
+    create_image_rgba,
+    free_image_rgba,
+    fill_image_rgba,
+    nearest_neighbor_resize,
+    bilinear_resize,
+    bilinear_resize_avx2,
+    bilinear_resize_neon,
+    auto_bilinear_resize,
+    area_resize,
+    area_resize_avx2,
+    area_resize_neon,
+    auto_area_resize
+)
+import platform
+
+def test_resize_fps(resize_func, src_image, dst_image, src_width, src_height, dst_width, dst_height, num_frames=20):
+    start_time = time.time()
+    for _ in range(num_frames):
+        resize_func(src_image, dst_image, src_width, src_height, dst_width, dst_height)
+    end_time = time.time()
+    fps = num_frames / (end_time - start_time)
+    return fps
+
+def read_bytes(image, width, height):
+    return bytes(image[0:width * height * 4])
+
+def main():
+    src_width, src_height = 3840, 2160
+    sizes = [(1920, 1080), (320, 180), (5000, 2800)]
+    src_image = create_image_rgba(src_width, src_height)
+    fill_image_rgba(src_image, src_width, src_height, 0, 0, 0, 255)
+    for y in range(0, src_height, 7):
+        for x in range(0, src_width, 5):
+            index = (y * src_width + x) * 4
+            src_image[index] = x % 256
+            src_image[index + 1] = y % 256
+
+    resize_functions = [
+        ("Nearest Neighbor", nearest_neighbor_resize, None),
+        ("Bilinear", bilinear_resize, "bilinear"),
+        ("Bilinear AVX2", bilinear_resize_avx2, "bilinear"),
+        ("Bilinear NEON", bilinear_resize_neon, "bilinear"),
+        ("Bilinear auto", auto_bilinear_resize, "bilinear"),
+        ("Area", area_resize, "area"),
+        ("Area AVX2", area_resize_avx2, "area"),
+        ("Area NEON", area_resize_neon, "area"),
+        ("Area auto", auto_area_resize, "area")
+    ]
+
+    print(f"Platform: {platform.machine()}")
+    for dst_width, dst_height in sizes:
+        print(f"Testing resize performance from {src_width}x{src_height} to {dst_width}x{dst_height}:")
+        dst_image = create_image_rgba(dst_width, dst_height)
+        reference = {}
+        for name, func, kind in resize_functions:
+            fps = test_resize_fps(func, src_image, dst_image, src_width, src_height, dst_width, dst_height)
+            result = read_bytes(dst_image, dst_width, dst_height)
+            if kind is not None:
+                match = reference.setdefault(kind, result) == result
+                print(f"{name}: {fps:.2f} FPS ({'Results match' if match else 'Results differ'})")
+            else:
+                print(f"{name}: {fps:.2f} FPS")
+        free_image_rgba(dst_image)
+
+    free_image_rgba(src_image)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pycrgba import Image, render_regions
+
+def draw_region(region, x, y, background, sprite, positions):
+    # Per-sprite Python work runs in the worker; only the region's own pixels are touched.
+    region.blit(background.view(x, y, region.width, region.height))
+    drawn = 0
+    for sx, sy in positions:
+        if sx < x + region.width and sy < y + region.height and sx + sprite.width > x and sy + sprite.height > y:
+            region.blend(sprite, sx - x, sy - y)
+            drawn += 1
+    return drawn
+
+def test_shared_memory_render():
+    width, height = 3840, 2160
+    rng = np.random.default_rng(13)
+    background = Image.create_shared(width, height)
+    np.asarray(background)[:] = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    sprite = Image.create_shared(64, 64)
+    np.asarray(sprite)[:] = rng.integers(0, 256, (64, 64, 4), dtype=np.uint8)
+    positions = [(int(rng.integers(-32, width)), int(rng.integers(-32, height))) for _ in range(20000)]
+    frame = Image.create_shared(width, height)
+
+    reopened = pickle.loads(pickle.dumps(frame.view(100, 50, 16, 8)))
+    print(f"Pickled view: {len(pickle.dumps(frame.view(100, 50, 16, 8)))} bytes, reopened as {reopened} of {frame.shared_name!r}")
+
+    start_time = time.perf_counter()
+    expected = Image(width, height)
+    draw_region(expected, 0, 0, background, sprite, positions)
+    single_time = time.perf_counter() - start_time
+
+    with ProcessPoolExecutor(4) as executor:
+        render_regions(executor, frame, draw_region, background, sprite, positions, rows=4)  # starts the workers
+        start_time = time.perf_counter()
+        counts = render_regions(executor, frame, draw_region, background, sprite, positions, rows=4)
+        pool_time = time.perf_counter() - start_time
+
+    print(f"One process: {single_time * 1000:.1f} ms, 4 regions in a process pool: {pool_time * 1000:.1f} ms")
+    print(f"Sprites drawn per region: {counts}")
+    print(f"Frame matches a single-process render: {np.array_equal(np.asarray(frame), np.asarray(expected))}")
+
+def test_reused_name():
+    # A segment closed and recreated under the same name must not be confused with the old one.
+    name = f"pycrgba-test-{id(object()):x}"
+    old = Image.create_shared(8, 8, name=name)
+    stale = pickle.dumps(old)
+    pickle.loads(stale).fill(1, 1, 1, 1)
+    old.close()
+
+    new = Image.create_shared(8, 8, name=name)
+    pickle.loads(pickle.dumps(new)).fill(255, 0, 0, 255)
+    try:
+        pickle.loads(stale)
+        stale_rejected = False
+    except ValueError:
+        stale_rejected = True
+    print(f"Writes through a reused name reach the new segment: {np.asarray(new)[0, 0].tolist() == [255, 0, 0, 255]}")
+    print(f"Pickle of the closed segment rejected: {stale_rejected}")
+    new.close()
+
+if __name__ == "__main__":
+    test_shared_memory_render()
+    test_reused_name()
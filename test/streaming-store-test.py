@@ -0,0 +1,44 @@
+import time
+import numpy as np
+from pycrgba import (Image, DrawList, set_streaming_threshold, get_streaming_threshold,
+                     set_huge_page_threshold, simd_tier)
+
+def render(frame, background, sprites, frames):
+    start_time = time.perf_counter()
+    for _ in range(frames):
+        frame.blit(background, 0, 0)
+        sprites.draw(frame)
+    return (time.perf_counter() - start_time) / frames
+
+def test_streaming_stores():
+    width, height = 3840, 2160
+    frames = 30
+    default_threshold = get_streaming_threshold()
+
+    set_huge_page_threshold(8 * 1024 * 1024)
+    frame = Image(width, height)
+    background = Image(width, height)
+    set_huge_page_threshold(0)
+    background.fill(30, 60, 90, 255)
+
+    rng = np.random.default_rng(7)
+    sprite_images = [Image.from_array(rng.integers(0, 256, (64, 64, 4), dtype=np.uint8)) for _ in range(64)]
+    sprites = DrawList()
+    for i in range(2000):
+        sprites.blend(sprite_images[i % 64], int(rng.integers(-32, width)), int(rng.integers(-32, height)))
+
+    set_streaming_threshold(0)
+    cached_time = render(frame, background, sprites, frames)
+    cached_pixels = np.asarray(frame).copy()
+
+    set_streaming_threshold(default_threshold)
+    streamed_time = render(frame, background, sprites, frames)
+    results_match = np.array_equal(cached_pixels, np.asarray(frame))
+
+    print(f"SIMD tier: {simd_tier()}, streaming threshold: {default_threshold / 1e6:.1f} MB")
+    print(f"Cached stores: {cached_time * 1000:.2f} ms/frame")
+    print(f"Streaming stores: {streamed_time * 1000:.2f} ms/frame")
+    print(f"Results match: {results_match}")
+
+if __name__ == "__main__":
+    test_streaming_stores()
@@ -0,0 +1,42 @@
+import time
+import random
+import numpy as np
+from pycrgba import Image, TiledCanvas
+
+def test_tiled_canvas(sprites=200):
+    width, height = 8192, 8192
+    rng = random.Random(0)
+    sprite = Image(64, 64)
+    np.asarray(sprite)[:] = np.random.default_rng(0).integers(0, 256, (64, 64, 4), dtype=np.uint8)
+    positions = [(rng.randint(-64, width), rng.randint(-64, height)) for _ in range(sprites)]
+
+    start_time = time.perf_counter()
+    canvas = TiledCanvas(width, height)
+    canvas.fill(30, 30, 30, 255)
+    canvas.fill_rect(1000, 1000, 1500, 700, 200, 0, 0, 255)
+    for x, y in positions:
+        canvas.blend(sprite, x, y)
+    tiled_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    reference = Image(width, height)
+    reference.fill(30, 30, 30, 255)
+    reference.view(1000, 1000, 1500, 700).fill(200, 0, 0, 255)
+    for x, y in positions:
+        reference.blend(sprite, x, y)
+    image_time = time.perf_counter() - start_time
+
+    flat = canvas.flatten()
+    results_match = np.array_equal(np.asarray(flat), np.asarray(reference))
+
+    print(f"{width}x{height} canvas, {sprites} sprites: {canvas.allocated_tiles} of {canvas.columns * canvas.rows} tiles allocated")
+    print(f"TiledCanvas: {canvas.nbytes / 1e6:.1f} MB, {tiled_time * 1000:.1f} ms")
+    print(f"Image: {reference.nbytes / 1e6:.1f} MB, {image_time * 1000:.1f} ms")
+    print(f"Results match: {results_match}")
+
+    canvas.close()
+    reference.close()
+    flat.close()
+
+if __name__ == "__main__":
+    test_tiled_canvas()
@@ -0,0 +1,58 @@
+import numpy as np
+from pycrgba import Image
+
+def test_views():
+    width, height = 640, 480
+    x, y, w, h = 100, 50, 200, 120
+
+    canvas = Image(width, height)
+    canvas.fill(0, 0, 0, 255)
+    pixels = np.asarray(canvas)
+
+    # Writes through a view land in the canvas rectangle and nowhere else
+    tile = canvas.view(x, y, w, h)
+    tile.fill(255, 0, 0, 255)
+    fill_ok = bool((pixels[y:y + h, x:x + w] == [255, 0, 0, 255]).all())
+    outside_ok = int(pixels[..., 0].sum()) == 255 * w * h
+
+    # Blends clip at the view edges, not at the canvas edges
+    overlay = Image(64, 64)
+    overlay.fill(0, 0, 255, 128)
+    tile.blend(overlay, w - 32, -32)
+    clip_ok = bool((pixels[y - 1, x + w - 32:x + w] == [0, 0, 0, 255]).all() and
+                   (pixels[y:y + 32, x + w] == [0, 0, 0, 255]).all())
+
+    # A packed copy of the view matches the same work done on a separate image
+    packed = Image(w, h)
+    packed.fill(255, 0, 0, 255)
+    packed.blend(overlay, w - 32, -32)
+    copy_ok = bool((np.asarray(tile.copy()) == np.asarray(packed)).all())
+
+    # Resizing from and into views
+    thumb = tile.resized(50, 30, "area")
+    canvas.view(0, 0, 50, 30).blit(thumb)
+    expected = packed.resized(50, 30, "area")
+    resize_ok = bool((pixels[:30, :50] == np.asarray(expected)).all())
+
+    # A NumPy slice is wrapped in place
+    frame = np.zeros((height, width, 4), dtype=np.uint8)
+    Image.from_array(frame[y:y + h, x:x + w]).fill(1, 2, 3, 4)
+    slice_ok = int(frame.sum()) == 10 * w * h
+
+    # Damage reported by a view is recorded in canvas coordinates
+    tracker = canvas.track_damage()
+    tile.blit(overlay, -10, -10)
+    damage_ok = tracker.rects() == [(x, y, 54, 54)]
+
+    print(f"Resolution: {width}x{height}, view {w}x{h} at ({x}, {y})")
+    print(f"Fill through view: {fill_ok and outside_ok}")
+    print(f"Clips at view edges: {clip_ok}")
+    print(f"Matches packed image: {copy_ok}")
+    print(f"Resize from/into views: {resize_ok}")
+    print(f"Wrap NumPy slice: {slice_ok}")
+    print(f"Damage in canvas coordinates: {damage_ok}")
+
+    canvas.close()
+
+if __name__ == "__main__":
+    test_views()